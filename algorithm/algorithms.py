@@ -1,5 +1,4 @@
-import scipy
-import operator
+import numpy as np
 
 __author__ = 'sebastian'
 
@@ -37,18 +36,60 @@ class KNNClassifier:
         return neighbors
 
 
+class Neighbors(list):
+    # list of (node, distance); error_bound is the max. amount by which a node which was only ranked
+    # approximately could be closer than the reported neighbours (0: exact result)
+    def __init__(self, neighbors=(), error_bound=0.):
+        list.__init__(self, neighbors)
+        self.error_bound = error_bound
+
+
+def approximate_error(approx, exact, selected, k, eps):
+    # nodes which were not re-ranked have an exact distance >= approx - eps
+    if k <= 0 or len(selected) == len(approx):
+        return 0.
+    rest = np.ones(len(approx), dtype=bool)
+    rest[selected] = False
+    kth = np.sort(exact)[min(k, len(exact)) - 1]
+    return max(0., kth - (approx[rest].min() - eps))
+
+
 class KolmogorovSmirnov:
-    def __init__(self, X, nodes):
-        self.X = X
-        self.nodes = nodes
+    def __init__(self, candidates, sketch_size=None, rerank=100):
+        # list of (NodeStore, indices of the candidate nodes within the store).
+        # with sketch_size, all candidates are ranked on quantile sketches of the nodes and
+        # only the best max(rerank, k) candidates are ranked with the exact statistic
+        self.candidates = candidates
+        self.sketch_size = sketch_size
+        self.rerank = rerank
+
+    def _distances(self, x, sketch=False):
+        distances = [(store.sketch(self.sketch_size) if sketch else store).ks_statistics(x, idx)
+                     for store, idx in self.candidates]
+        return np.concatenate(distances) if distances else np.empty(0)
 
     def getNeighbors(self, x, k):
-        distances = []
-        for i in range(len(self.X)):
-            dist, p = scipy.stats.ks_2samp(x, self.X[i])
-            distances.append((self.nodes[i], dist))
-        distances.sort(key=operator.itemgetter(1))
-        neighbors = []
-        for i in range(min(k, len(distances))):
-            neighbors.append(distances[i])
-        return neighbors
\ No newline at end of file
+        nodes = []
+        for store, idx in self.candidates:
+            nodes.extend(store.nodes[i] for i in idx)
+        if not nodes:
+            return Neighbors()
+        if not self.sketch_size:
+            distances = self._distances(x)
+            # stable sort keeps the order of the candidates for equal distances
+            order = np.argsort(distances, kind='mergesort')[:max(k, 0)]
+            return Neighbors((nodes[i], distances[i]) for i in order)
+
+        approx = self._distances(x, sketch=True)
+        selected = np.sort(np.argsort(approx, kind='mergesort')[:max(self.rerank, k, 0)])
+        exact = np.concatenate([store.ks_statistics(x, idx[s]) for (store, idx), s in
+                                zip(self.candidates, self._split(selected))])
+        order = np.argsort(exact, kind='mergesort')[:max(k, 0)]
+        error = approximate_error(approx, exact, selected, k, 1. / self.sketch_size)
+        return Neighbors(((nodes[selected[i]], exact[i]) for i in order), error)
+
+    def _split(self, selected):
+        # positions of the selected candidates within each store
+        bounds = np.cumsum([0] + [len(idx) for store, idx in self.candidates])
+        cuts = np.searchsorted(selected, bounds)
+        return [selected[cuts[i]:cuts[i + 1]] - bounds[i] for i in range(len(self.candidates))]
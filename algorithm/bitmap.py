@@ -0,0 +1,139 @@
+import numpy as np
+
+__author__ = 'sebastian'
+
+# number of set bits of each byte value
+POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.int64)
+
+
+class Bitmap(object):
+    # immutable set of integer ids in [0, size): sparse sets are kept as sorted id arrays,
+    # dense sets as packed bits (one bit per id)
+    def __init__(self, size, ids=None, bits=None, count=None):
+        self.size = size
+        self.ids = ids
+        self.bits = bits
+        self._count = count
+
+    @classmethod
+    def from_ids(cls, ids, size, is_sorted=False):
+        ids = np.asarray(ids, dtype=np.int64)
+        if not is_sorted:
+            ids = np.unique(ids)
+        return cls(size, ids=ids, count=len(ids))._compact()
+
+    @classmethod
+    def from_mask(cls, mask):
+        return cls(len(mask), bits=np.packbits(mask))._compact()
+
+    def _compact(self):
+        # choose the smaller representation: 8 bytes per id vs. one bit per id of the universe
+        dense = len(self) * 64 > self.size
+        if dense and self.bits is None:
+            return Bitmap(self.size, bits=np.packbits(self.mask()), count=len(self))
+        if not dense and self.ids is None:
+            return Bitmap(self.size, ids=self.to_ids(), count=len(self))
+        return self
+
+    def __len__(self):
+        if self._count is None:
+            self._count = int(POPCOUNT[self.bits].sum())
+        return self._count
+
+    def __iter__(self):
+        return iter(self.to_ids().tolist())
+
+    def __contains__(self, i):
+        return bool(self.contains(np.array([i]))[0])
+
+    def __repr__(self):
+        return 'Bitmap(' + str(len(self)) + '/' + str(self.size) + ')'
+
+    def to_ids(self):
+        if self.ids is not None:
+            return self.ids
+        return np.flatnonzero(self.mask())
+
+    def mask(self, size=None):
+        # bool array over the universe
+        size = self.size if size is None else size
+        if self.bits is not None:
+            m = np.unpackbits(self.bits)[:size]
+            if len(m) < size:
+                m = np.concatenate((m, np.zeros(size - len(m), dtype=m.dtype)))
+            return m.view(bool)
+        m = np.zeros(size, dtype=bool)
+        m[self.ids[self.ids < size]] = True
+        return m
+
+    def contains(self, ids):
+        # membership of several ids as bool array
+        ids = np.asarray(ids, dtype=np.int64)
+        if self.bits is not None:
+            valid = ids < len(self.bits) * 8
+            res = np.zeros(len(ids), dtype=bool)
+            x = ids[valid]
+            res[valid] = (self.bits[x >> 3] >> (7 - (x & 7))) & 1
+            return res
+        pos = np.searchsorted(self.ids, ids)
+        pos[pos >= len(self.ids)] = 0
+        return (self.ids[pos] == ids) if len(self.ids) else np.zeros(len(ids), dtype=bool)
+
+    def _dense_pair(self, other):
+        n = max(len(self.bits), len(other.bits))
+        a = self.bits if len(self.bits) == n else np.concatenate((self.bits, np.zeros(n - len(self.bits), np.uint8)))
+        b = other.bits if len(other.bits) == n else np.concatenate((other.bits, np.zeros(n - len(other.bits), np.uint8)))
+        return a, b
+
+    def __and__(self, other):
+        size = max(self.size, other.size)
+        if self.bits is not None and other.bits is not None:
+            a, b = self._dense_pair(other)
+            return Bitmap(size, bits=a & b)._compact()
+        if self.ids is not None:
+            ids = self.ids[other.contains(self.ids)]
+        else:
+            ids = other.ids[self.contains(other.ids)]
+        return Bitmap(size, ids=ids, count=len(ids))._compact()
+
+    def __or__(self, other):
+        size = max(self.size, other.size)
+        if self.bits is not None and other.bits is not None:
+            a, b = self._dense_pair(other)
+            return Bitmap(size, bits=a | b)._compact()
+        if self.ids is not None and other.ids is not None:
+            ids = np.union1d(self.ids, other.ids)
+            return Bitmap(size, ids=ids, count=len(ids))._compact()
+        m = self.mask(size) | other.mask(size)
+        return Bitmap.from_mask(m)
+
+    def __sub__(self, other):
+        if self.ids is not None:
+            ids = self.ids[~other.contains(self.ids)]
+            return Bitmap(self.size, ids=ids, count=len(ids))._compact()
+        if other.bits is not None:
+            a, b = self._dense_pair(other)
+            return Bitmap(self.size, bits=(a & ~b)[:len(self.bits)])._compact()
+        m = self.mask()
+        m[other.ids[other.ids < self.size]] = False
+        return Bitmap.from_mask(m)
+
+    def intersection_count(self, other):
+        if self.bits is not None and other.bits is not None:
+            a, b = self._dense_pair(other)
+            return int(POPCOUNT[a & b].sum())
+        if self.ids is not None and (other.ids is None or len(self.ids) <= len(other.ids)):
+            return int(other.contains(self.ids).sum())
+        return int(self.contains(other.ids).sum())
+
+    def isdisjoint(self, other):
+        return self.intersection_count(other) == 0
+
+    def issubset(self, other):
+        return self.intersection_count(other) == len(self)
+
+    def __eq__(self, other):
+        return isinstance(other, Bitmap) and len(self) == len(other) and self.issubset(other)
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
@@ -1,4 +1,134 @@
 import numpy as np
 
-FV1 = [min, max, np.mean, np.std]
-FV2 = [lambda x: np.percentile(x, 5), lambda x: np.percentile(x, 95), np.mean, np.std]
+# registered dimensions: name -> function(SegmentStatistics) returning one value per segment
+DIMENSIONS = {}
+# percentiles which are needed by the registered dimensions
+PERCENTILES = {}
+
+
+def register_dimension(name, fn, percentiles=()):
+    DIMENSIONS[name] = fn
+    PERCENTILES[name] = tuple(percentiles)
+
+
+def percentile_dimension(q):
+    name = 'p' + str(q)
+    if name not in DIMENSIONS:
+        register_dimension(name, lambda stats: stats.percentile(q), percentiles=[q])
+    return name
+
+
+class SegmentStatistics(object):
+    # statistics of one or several value arrays, given as one buffer with offsets:
+    # segment i is values[offsets[i]:offsets[i + 1]]. each statistic is computed once and shared by all dimensions
+    def __init__(self, values, offsets=None):
+        self.values = np.asarray(values, dtype=np.float64)
+        if offsets is None:
+            offsets = [0, len(self.values)]
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.lengths = np.diff(self.offsets)
+        self.single = len(self.lengths) == 1
+        self._cache = {}
+        self._percentiles = {}
+
+    def _get(self, name, fn):
+        if name not in self._cache:
+            self._cache[name] = fn()
+        return self._cache[name]
+
+    def _reduce(self, ufunc):
+        if self.single:
+            return np.array([ufunc.reduce(self.values)])
+        return ufunc.reduceat(self.values, self.offsets[:-1])
+
+    @property
+    def min(self):
+        return self._get('min', lambda: self._reduce(np.minimum))
+
+    @property
+    def max(self):
+        return self._get('max', lambda: self._reduce(np.maximum))
+
+    @property
+    def mean(self):
+        return self._get('mean', lambda: self._reduce(np.add) / self.lengths)
+
+    @property
+    def std(self):
+        def _std():
+            d = self.values - np.repeat(self.mean, self.lengths)
+            return np.sqrt(SegmentStatistics(d * d, self.offsets)._reduce(np.add) / self.lengths)
+        return self._get('std', _std)
+
+    @property
+    def sorted(self):
+        def _sorted():
+            if self.single:
+                return np.sort(self.values)
+            segments = np.repeat(np.arange(len(self.lengths)), self.lengths)
+            return self.values[np.lexsort((self.values, segments))]
+        return self._get('sorted', _sorted)
+
+    def prepare_percentiles(self, qs):
+        # compute several percentiles on the same sorted values
+        qs = [q for q in qs if q not in self._percentiles]
+        if not qs:
+            return
+        ranks = []
+        for q in qs:
+            # linear interpolation between the closest ranks (as numpy.percentile)
+            idx = q / 100. * (self.lengths - 1)
+            below = np.floor(idx).astype(np.int64)
+            above = np.minimum(below + 1, self.lengths - 1)
+            ranks.append((q, below, above, idx - below))
+        if self.single and 'sorted' not in self._cache:
+            # one vector: only the needed ranks are put in place
+            x = np.partition(self.values, sorted(set(int(r[i][0]) for r in ranks for i in [1, 2])))
+        else:
+            x = self.sorted
+        for q, below, above, w in ranks:
+            self._percentiles[q] = x[self.offsets[:-1] + below] * (1 - w) + x[self.offsets[:-1] + above] * w
+
+    def percentile(self, q):
+        self.prepare_percentiles([q])
+        return self._percentiles[q]
+
+
+class FeatureVector(object):
+    # named dimensions computed in one fused pass over the values of a node
+    def __init__(self, dimensions):
+        self.dimensions = list(dimensions)
+        self.percentiles = sorted(set(q for d in self.dimensions for q in PERCENTILES[d]))
+
+    def __repr__(self):
+        return 'FeatureVector(' + ', '.join(self.dimensions) + ')'
+
+    def __len__(self):
+        return len(self.dimensions)
+
+    def batch(self, values, offsets=None):
+        # feature matrix with one row per segment, rows of empty segments are nan
+        values = np.asarray(values, dtype=np.float64)
+        if offsets is None:
+            offsets = [0, len(values)]
+        offsets = np.asarray(offsets, dtype=np.int64)
+        filled = np.diff(offsets) > 0
+        X = np.empty((len(filled), len(self.dimensions)))
+        X.fill(np.nan)
+        if filled.any():
+            stats = SegmentStatistics(values, np.append(offsets[:-1][filled], offsets[-1]))
+            stats.prepare_percentiles(self.percentiles)
+            X[filled] = np.column_stack([DIMENSIONS[d](stats) for d in self.dimensions])
+        return X
+
+    def __call__(self, values):
+        return self.batch(values)[0].tolist()
+
+
+register_dimension('min', lambda stats: stats.min)
+register_dimension('max', lambda stats: stats.max)
+register_dimension('mean', lambda stats: stats.mean)
+register_dimension('std', lambda stats: stats.std)
+
+FV1 = FeatureVector(['min', 'max', 'mean', 'std'])
+FV2 = FeatureVector([percentile_dimension(5), percentile_dimension(95), 'mean', 'std'])
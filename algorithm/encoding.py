@@ -0,0 +1,28 @@
+__author__ = 'sebastian'
+
+
+class Dictionary(object):
+    # bidirectional mapping between strings and dense integer ids
+    def __init__(self):
+        self.ids = {}
+        self.strings = []
+
+    def __len__(self):
+        return len(self.strings)
+
+    def __contains__(self, x):
+        return x in self.ids
+
+    def encode(self, x):
+        i = self.ids.get(x)
+        if i is None:
+            i = len(self.strings)
+            self.ids[x] = i
+            self.strings.append(x)
+        return i
+
+    def get(self, x, default=None):
+        return self.ids.get(x, default)
+
+    def decode(self, i):
+        return self.strings[i]
@@ -1,5 +1,9 @@
 import math
 
+import numpy as np
+
+from dimensions import FeatureVector
+
 
 def get_float(v):
     try:
@@ -35,6 +39,19 @@ def get_numeric_values(values):
 
 def get_feature_vector(values, features):
     # apply feature functions
-    features = [f(values) for f in features]
+    if isinstance(features, FeatureVector):
+        features = features(values)
+    else:
+        features = [f(values) for f in features]
     if not any([math.isnan(x) for x in features]):
         return features
+
+def get_feature_vectors(value_lists, features):
+    # feature vectors of several value lists, computed on one segmented array
+    if not isinstance(features, FeatureVector):
+        return [get_feature_vector(v, features) for v in value_lists]
+    lengths = [len(v) for v in value_lists]
+    offsets = np.concatenate(([0], np.cumsum(lengths))).astype(np.int64)
+    values = np.concatenate([np.asarray(v, dtype=np.float64) for v in value_lists]) if value_lists else []
+    X = features.batch(values, offsets)
+    return [None if np.isnan(x).any() else x.tolist() for x in X]
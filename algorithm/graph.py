@@ -1,56 +1,81 @@
+from array import array
 from collections import defaultdict
 import os
 import math
+import numpy as np
 import scipy
 from sklearn import preprocessing
 from utils.dbpedia_access import DBpedia
 import logging
 import feature_extraction
+from utils import metrics, ntriples
 from utils.local_dbpedia_files import local_common_types
+from algorithm.bitmap import Bitmap
+from algorithm.encoding import Dictionary
+from algorithm.node_store import NodeStore
 
+BUILD_SECONDS = metrics.histogram('labelling_build_phase_seconds', 'Duration of the phases of a graph build',
+                                  labels=('phase',))
+VALUES = metrics.counter('labelling_values_collected_total', 'Numeric values collected for the type nodes')
+CANDIDATES = metrics.counter('labelling_split_candidates_total', 'Shared p-o pairs evaluated as split candidates')
+NODES = metrics.counter('labelling_nodes_added_total', 'Nodes added to the graphs by branching')
+VALUE_COUNT = metrics.gauge('labelling_graph_values', 'Values of the nodes of a graph (stored: after sampling)',
+                            labels=('property', 'kind'))
+VALUE_BYTES = metrics.gauge('labelling_graph_value_bytes', 'Memory of the value arrays of a graph', labels=('property',))
 
-def euclideanDistance(x1, x2):
-    distance = 0
-    for a, b in zip(x1, x2):
-        distance += pow((a - b), 2)
-    return math.sqrt(distance)
+
+def node_features(node, features):
+    # the feature vector is cached on the node until its values change
+    if node.features is None:
+        node.features = feature_extraction.get_feature_vector(node.get_values(), features)
+    return node.features
+
+
+def nodes_features(nodes, features):
+    # compute the missing feature vectors of several nodes in one batch
+    missing = [n for n in nodes if n.features is None]
+    if missing:
+        vectors = feature_extraction.get_feature_vectors([n.get_values() for n in missing], features)
+        for n, v in zip(missing, vectors):
+            n.features = v
+    return [n.features for n in nodes]
 
 
 def euclid_dist(candidates, node, features, normalize):
     # select candidate with longest distance
-    p_features = feature_extraction.get_feature_vector(node.get_values(), features)
+    p_features = node_features(node, features)
     if not p_features:
             return None
-    if normalize:
-        # normalize feature vector of selected node
-        scaler = preprocessing.StandardScaler().fit([p_features])
-        p_features = scaler.transform([p_features])[0]
-
-    values = []
     for c in candidates[:]:
-        c_values = c.get_values()
-        if c_values:
-            c_features = feature_extraction.get_feature_vector(c.get_values(), features)
-            if normalize:
-                c_features = scaler.transform([c_features])[0]
-            values.append(euclideanDistance(p_features, c_features))
-        else:
+        if not len(c.get_values()):
             candidates.remove(c)
-    if not values:
+    if not candidates:
         return None
-    i = values.index(max(values))
-    sel_node = candidates[i]
+
+    X = np.array([f or [np.nan] * len(p_features) for f in nodes_features(candidates, features)], dtype=np.float64)
+    p_features = np.array([p_features], dtype=np.float64)
+    if normalize:
+        # normalize feature vectors by the scaler of the selected node
+        scaler = preprocessing.StandardScaler().fit(p_features)
+        p_features = scaler.transform(p_features)
+        X = scaler.transform(X)
+    dists = np.sqrt(((X - p_features) ** 2).sum(axis=1))
+    # candidates without valid feature vector
+    dists[np.isnan(dists)] = -np.inf
+    if np.isneginf(dists).all():
+        return None
+    sel_node = candidates[int(np.argmax(dists))]
     return sel_node
 
 
 def kolmogorov_dist(candidates, node, features, normalize):
     p_values = node.get_values()
-    if not p_values:
+    if not len(p_values):
             return None
     values = []
     for c in candidates[:]:
         c_values = c.get_values()
-        if c_values:
+        if len(c_values):
             dist, p = scipy.stats.ks_2samp(p_values, c_values)
             values.append(dist)
         else:
@@ -61,35 +86,48 @@ def kolmogorov_dist(candidates, node, features, normalize):
     sel_node = candidates[i]
     return sel_node
 
-def add_values_to_nodes(leaves, prop, filename):
+def add_values_to_nodes(leaves, prop, filename, dictionary):
     logging.debug('Add values to nodes [' + filename + ']')
-    res = []
-    p = _normalize_uri(prop.prop)
-    for l in leaves:
-        # remove initial values
-        l.values = set()
-        s_p = set()
-        for s in l.subjects:
-            s = _normalize_uri(s)
-            s_p.add((s, p))
-        res.append((l, s_p))
-
-    # iterate over file
-    with open(filename + '_subjects') as f:
-        c = 0
-        for l in f:
-            line = l.decode('utf8')
-            x = line.split(' ')
-            for l, s_p in res:
-                if (x[0], x[1]) in s_p:
-                    o = x[2].rstrip('\n')
-                    o = o.rstrip('.')
-                    v = feature_extraction.get_value(o)
+    ntriples.scan(filename, [ValueCollector(leaves, prop, dictionary)])
+
+
+class ValueCollector(object):
+    # collects the numeric values of the property for the subjects of the nodes while scanning a local file
+    def __init__(self, leaves, prop, dictionary):
+        self.leaves = leaves
+        self.dictionary = dictionary
+        self.p = _normalize_uri(prop.prop).encode('utf8')
+        # inverted index: subject -> (subject id, indices of the nodes containing the subject)
+        self.index = {}
+        for i, l in enumerate(leaves):
+            for sid in l.subjects:
+                key = _normalize_uri(dictionary.decode(sid)).encode('utf8')
+                if key not in self.index:
+                    self.index[key] = (sid, [])
+                self.index[key][1].append(i)
+        self.subjects = [array('l') for l in leaves]
+        self.values = [array('d') for l in leaves]
+
+    def add(self, triples):
+        index = self.index
+        p = self.p
+        for x in triples:
+            if x[1] == p:
+                entry = index.get(x[0])
+                if entry:
+                    v = feature_extraction.get_value(x[2].rstrip('.'))
                     if v != None:
-                        l.values.add((x[0], v))
-            c += 1
-            if c % 100000 == 0:
-                logging.debug('triples processed: ' + str(c)[:-3] + 'k')
+                        sid, nodes = entry
+                        for i in nodes:
+                            self.subjects[i].append(sid)
+                            self.values[i].append(v)
+
+    def finish(self):
+        for i, l in enumerate(self.leaves):
+            l.values = ValueBuffer(self.dictionary, np.frombuffer(self.subjects[i], dtype=np.int_),
+                                   np.frombuffer(self.values[i], dtype=np.float64)).unique()
+            VALUES.inc(len(l.values))
+        self.index = None
 
 
 def normalize_uris(X):
@@ -108,59 +146,127 @@ def single_uri(x):
 
 
 class LocalDB():
-    def __init__(self, local_files, min_instances):
-        self.triples = self._load_triples(local_files, min_instances)
-
-    def _load_triples(self, filename, min_instances):
-        logging.debug('Load p-o pairs into memory')
-        triples = defaultdict(set)
-        shared = defaultdict(int)
-        # iterate over file
-        with open(filename + '_subjects') as f:
-            c = 0
-            for l in f:
-                line = l.decode('utf8')
-                x = line.split(' ')
-                triples[x[0]].add((x[1], x[2]))
-                shared[(x[1], x[2])] += 1
-                # debug logging
-                c += 1
-                if c % 100000 == 0:
-                    logging.debug('triples processed: ' + str(c)[:-3] + 'k')
-
-        logging.debug('Filter p-o pairs with min instances (1)')
-        for k, v in shared.items():
-            if v < min_instances:
-                del shared[k]
-
-        logging.debug('Filter p-o pairs with min instances (2)')
-        shared = set(shared.keys())
-        del_set = []
-        for s in triples:
-            triples[s] &= shared
-            if not triples[s]:
-                del_set.append(s)
-        for s in del_set:
-            del triples[s]
-
+    def __init__(self, local_files, min_instances, dictionary=None, load=True):
+        # subjects and p-o pairs are encoded as integer ids, the p-o pairs of a subject id s are
+        # pairs[indices[indptr[s]:indptr[s + 1]]]
+        self.subjects = dictionary if dictionary is not None else Dictionary()
+        self.min_instances = min_instances
+        self.pairs = []
+        self.indptr = None
+        self.indices = None
+        # triples collected while scanning a local file
+        self._pair_ids = Dictionary()
+        self._triple_subjects = array('l')
+        self._triple_pairs = array('l')
+        self._subject_cache = {}
+        if load:
+            logging.debug('Load p-o pairs into memory')
+            ntriples.scan(local_files, [self])
+
+    def add(self, triples):
+        subject_ids = self._subject_cache
+        pair_ids = self._pair_ids.ids
+        for x in triples:
+            s = x[0]
+            sid = subject_ids.get(s)
+            if sid is None:
+                # decode each subject only once
+                sid = subject_ids[s] = self.subjects.encode(single_uri(s.decode('utf8')))
+            pair = (x[1], x[2])
+            pid = pair_ids.get(pair)
+            if pid is None:
+                pid = self._pair_ids.encode(pair)
+            self._triple_subjects.append(sid)
+            self._triple_pairs.append(pid)
+
+    def finish(self):
+        with BUILD_SECONDS.time(phase='local_db'):
+            self._build_index()
+
+    def _build_index(self):
+        subjects = np.frombuffer(self._triple_subjects, dtype=np.int_)
+        pairs = np.frombuffer(self._triple_pairs, dtype=np.int_)
+
+        logging.debug('Filter p-o pairs with min instances')
+        # only resources are used as shared p-o pairs
+        keep = np.bincount(pairs, minlength=len(self._pair_ids)) >= self.min_instances
+        keep &= np.array([o.startswith('<') for p, o in self._pair_ids.strings], dtype=bool)
+        self.pairs = [(p.decode('utf8'), o.decode('utf8')) for (p, o), k in zip(self._pair_ids.strings, keep) if k]
+        remap = np.cumsum(keep) - 1
+        mask = keep[pairs]
+        subjects = subjects[mask]
+        pairs = remap[pairs[mask]]
+        self._pair_ids = None
+        self._triple_subjects = None
+        self._triple_pairs = None
+        self._subject_cache = None
+
+        logging.debug('Build CSR index of p-o pairs')
+        order = np.lexsort((pairs, subjects))
+        subjects = subjects[order]
+        pairs = pairs[order]
+        unique = np.ones(len(order), dtype=bool)
+        unique[1:] = (subjects[1:] != subjects[:-1]) | (pairs[1:] != pairs[:-1])
+        self.indices = pairs[unique].astype(np.int32)
+        self.indptr = np.zeros(len(self.subjects) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(subjects[unique], minlength=len(self.subjects)), out=self.indptr[1:])
+
+        logging.debug('Build inverted index of p-o pairs')
+        # subject ids of pair id p are pair_sids[pair_indptr[p]:pair_indptr[p + 1]] (sorted)
+        order = np.argsort(self.indices, kind='mergesort')
+        self.pair_sids = subjects[unique][order]
+        self.pair_indptr = np.zeros(len(self.pairs) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.indices, minlength=len(self.pairs)), out=self.pair_indptr[1:])
         logging.debug('Finished loading p-o pairs')
-        return triples
+
+    def pair_subjects(self, pid):
+        return Bitmap(len(self.subjects), ids=self.pair_sids[self.pair_indptr[pid]:self.pair_indptr[pid + 1]],
+                      count=int(self.pair_indptr[pid + 1] - self.pair_indptr[pid]))._compact()
+
+    def _pairs_of(self, sids):
+        # gather the p-o pairs of all subjects
+        sids = sids[sids < len(self.indptr) - 1]
+        starts = self.indptr[sids]
+        lengths = self.indptr[sids + 1] - starts
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        return self.indices[np.arange(lengths.sum()) + offsets], np.repeat(sids, lengths)
+
+    def pair_counts(self, subjects):
+        # ids of the pairs of the subjects in the bitmap and the number of these subjects having each pair
+        pairs, sids = self._pairs_of(subjects.to_ids())
+        counts = np.bincount(pairs, minlength=len(self.pairs))
+        pids = np.flatnonzero(counts)
+        return pids, counts[pids]
+
+    def common_pairs(self, subjects):
+        # ids of the pairs which are shared by all subjects in the bitmap
+        sids = subjects.to_ids()
+        sids = sids[sids < len(self.indptr) - 1]
+        if not len(sids):
+            return []
+        degrees = self.indptr[sids + 1] - self.indptr[sids]
+        s = sids[np.argmin(degrees)]
+        return [pid for pid in self.indices[self.indptr[s]:self.indptr[s + 1]]
+                if self.pair_subjects(pid).intersection_count(subjects) == len(sids)]
+
+    def _subject_ids(self, subs):
+        ids = [self.subjects.get(single_uri(s)) for s in subs]
+        return np.array([i for i in ids if i is not None], dtype=np.int64)
 
     def local_shared_property_object_pairs(self, subs):
         logging.debug('Find shared p-o pairs')
         res = defaultdict(set)
-        # normalize subjects
-        subjects = normalize_uris(subs)
-
-        for s in subjects:
-            if s in self.triples:
-                for p, o in self.triples[s]:
-                    if o.startswith('<'):
-                        res[(p, o)].add(single_uri(s))
+        pairs, sids = self._pairs_of(self._subject_ids(subs))
+        order = np.argsort(pairs, kind='mergesort')
+        pairs = pairs[order]
+        sids = sids[order]
+        bounds = np.flatnonzero(np.diff(pairs)) + 1
+        for pids, group in zip(np.split(pairs, bounds), np.split(sids, bounds)):
+            if len(pids):
+                res[self.pairs[pids[0]]] = set(self.subjects.decode(i) for i in group)
         return res
 
 
-
 def info_msg(node):
     logging.debug('NODE: ' + str(node) + ', CHILDREN: ' + str(node.children))
     for c in node.children:
@@ -184,6 +290,9 @@ class Property(object):
     def __ne__(self, other):
         return not self.__eq__(other)
 
+    def __hash__(self):
+        return hash(self.name)
+
 
 class PropertyGraph(object):
     def __init__(self, prop, subjects, local_files, min_instances):
@@ -194,11 +303,26 @@ class PropertyGraph(object):
         self.local_files = local_files
         self.subjects = subjects
         self.min_instances = min_instances
-        self.local_db = LocalDB(self.local_files, min_instances)
+        self._local_db = None
+        # subject ids of the node bitmaps and value buffers
+        self.dictionary = Dictionary()
+        self.store = None
 
-    def build_type_hierarchy(self):
-        kb = DBpedia()
-        self._build_subclasses(kb)
+    @property
+    def local_db(self):
+        # p-o pairs of the local files are only needed for building the graph
+        if self._local_db is None:
+            self._local_db = LocalDB(self.local_files, self.min_instances, self.dictionary)
+        return self._local_db
+
+    def build_type_hierarchy(self, type_index=None):
+        # types and subclasses are resolved from the local type index if available
+        if type_index is not None:
+            kb = type_index.view(self.subjects)
+        else:
+            kb = DBpedia()
+        with BUILD_SECONDS.time(phase='type_hierarchy'):
+            self._build_subclasses(kb)
 
         # add parent and children
         for c in self.nodes:
@@ -212,56 +336,94 @@ class PropertyGraph(object):
 
     def _build_subclasses(self, kb):
         res = local_common_types(self.local_files)
-        for r in res:
-            uri = r[0]
+        types = [u'<' + r[0] + u'>' for r in res]
+        type_subjects = kb.get_subjects_by_predicate_types(self.prop.prop, types)
+        for r, t in zip(res, types):
             # only add the subjects which are within the own subject set
-            subjects = kb.get_subjects_by_predicate_type(self.prop.prop, u'<' + uri + u'>') & self.subjects
+            subjects = type_subjects[t] & self.subjects
             if len(subjects) > self.min_instances:
-                c = TypeNode(uri, subjects, self.prop)
-                c.subclasses = kb.get_subclasses(c.get_uri())
-                self.nodes.append(c)
-        # build type hierarchy
+                self.nodes.append(TypeNode(r[0], self.encode_subjects(subjects), self.prop))
+        subclasses = kb.get_subclasses_of_types([c.get_uri() for c in self.nodes])
+        for c in self.nodes:
+            c.subclasses = subclasses[c.get_uri()]
+        self._link_subclasses()
+
+    def _link_subclasses(self):
+        # build type hierarchy: children in order of the nodes, the first superclass becomes the parent
+        position = dict((c.uri, i) for i, c in enumerate(self.nodes))
         for t1 in self.nodes:
-            for t2 in self.nodes:
-                if t2 in t1:
-                    t1.add_child(t2)
-                    t2.add_parent(t1)
+            for i in sorted(position[t] for t in t1.subclasses if t in position):
+                t2 = self.nodes[i]
+                t1.add_child(t2)
+                t2.add_parent(t1)
+
+    def single_element_values(self, max_values=None):
+        with BUILD_SECONDS.time(phase='single_element_values'):
+            self._single_element_values(max_values)
+        self.report_values()
 
-    def single_element_values(self):
+    def _single_element_values(self, max_values):
         for node in self.nodes:
             # convert to single element lists
-            vals = [x[1] for x in node.values]
+            vals = node.get_values()
             node.values = vals
-            if vals:
+            node.count = len(vals)
+            if len(vals):
                 node.min = min(vals)
                 node.max = max(vals)
+        # keep the values of the nodes sorted in one contiguous buffer
+        self.store = NodeStore([n for n in self.nodes if n.instances > 0 and len(n.values)])
+        if max_values:
+            # bounded memory per node: a sample of the values with the same min. and max.
+            self.store = self.store.sample(max_values)
+        for i, node in enumerate(self.store.nodes):
+            node.values = self.store.node_values(i)
+
+    def release(self):
+        # drop the structures which are only needed for building: p-o pairs of the local file,
+        # subject sets and the subject dictionary (the number of instances of the nodes is kept)
+        for n in self.nodes:
+            n.stored_instances = n.instances
+            n.subjects = None
+            n.common_pairs = None
+        self._local_db = None
+        self.subjects = None
+        self.dictionary = None
+
+    def report_values(self):
+        total = int(self.store.counts.sum())
+        VALUE_COUNT.set(total, property=self.prop.name, kind='total')
+        VALUE_COUNT.set(len(self.store.values), property=self.prop.name, kind='stored')
+        VALUE_BYTES.set(self.store.nbytes, property=self.prop.name)
+        logging.info('Values of property graph ' + self.prop.name + ': ' + str(len(self.store.values)) + ' stored of ' +
+                     str(total) + ' (' + str(round(self.store.nbytes / 1024. ** 2, 1)) + ' MB)')
+
+    def encode_subjects(self, subjects):
+        # bitmap of subject uris
+        ids = [self.dictionary.encode(s) for s in subjects]
+        return Bitmap.from_ids(ids, len(self.dictionary))
 
     def _get_common_po_pairs(self, subjects):
-        shared = self.local_db.local_shared_property_object_pairs(subjects)
-        common_pairs = set([tup for tup in shared if len(shared[tup]) == len(subjects)])
-        return common_pairs
+        # p-o pairs whose subject bitmap contains all subjects
+        return set(self.local_db.pairs[pid] for pid in self.local_db.common_pairs(subjects))
 
     def _collect_candidates(self, node, min_instances, min_perc=1/100., max_perc=99/100.):
         # collect candidates for splitting
         candidates = []
         logging.debug('Collect candidates for splitting: ' + str(node))
-        shared = self.local_db.local_shared_property_object_pairs(node.subjects)
+        subjects = node.subjects
+        pids, counts = self.local_db.pair_counts(subjects)
         logging.debug('Split candidates in range: >' + str(max((1/100.) * node.instances, min_instances)))
-        for tup in shared:
-            subjects = shared[tup]
-            if max(min_perc * node.instances, min_instances) < len(subjects) <= max_perc * node.instances:
-                n = SharedPairs(node.uri, subjects, self.prop, tup)
-                values = set()
-                for s, v in node.values:
-                    uri = s.lstrip('<').rstrip('>')
-                    if uri in subjects:
-                        values.add((s, v))
-                n.values = values
-                # check if there are enough numeric values in this node
-                if len(n.get_values()) >= min_instances:
-                    # additionally add all shared pairs of these subjects
-                    n.common_pairs = self._get_common_po_pairs(n.subjects)
-                    candidates.append(n)
+        in_range = (counts > max(min_perc * node.instances, min_instances)) & (counts <= max_perc * node.instances)
+        for pid in pids[in_range]:
+            bits = self.local_db.pair_subjects(pid) & subjects
+            n = SharedPairs(node.uri, bits, self.prop, self.local_db.pairs[pid])
+            n.values = node.values.select(bits)
+            # check if there are enough numeric values in this node
+            if len(n.get_values()) >= min_instances:
+                # additionally add all shared pairs of these subjects
+                n.common_pairs = self._get_common_po_pairs(bits)
+                candidates.append(n)
         return candidates
 
     def _process_candidates(self, candidates, node, features, dist_function, min_instances, normalize):
@@ -274,7 +436,7 @@ class PropertyGraph(object):
         candidates.remove(sel_node)
         # update other candidates
         for c in candidates[:]:
-            if c.subjects & sel_node.subjects:
+            if not c.subjects.isdisjoint(sel_node.subjects):
                 candidates.remove(c)
         return sel_node
 
@@ -282,16 +444,23 @@ class PropertyGraph(object):
         for child in node.children:
             for c in candidates:
                 c.subjects -= child.subjects
-                c.values -= child.values
+                c.values = c.values.select(c.subjects)
 
 
     ################### SPLIT ON LONGEST FEATURE VECTOR DISTANCE, INSTANCES IN ALL NODES ############################
     def branching(self, features, dist_function, min_instances=50, max_instances=100, normalize=True):
-        add_values_to_nodes(self.nodes, self.prop, self.local_files)
+        # one pass over the local file for the values of the nodes and the p-o pairs
+        consumers = [ValueCollector(self.nodes, self.prop, self.dictionary)]
+        if self._local_db is None:
+            self._local_db = LocalDB(self.local_files, self.min_instances, self.dictionary, load=False)
+            consumers.append(self._local_db)
+        with BUILD_SECONDS.time(phase='scan'):
+            ntriples.scan(self.local_files, consumers)
 
         for node in self.roots:
             logging.info('PROCESSING NODE: ' + str(node))
-            self._branching(node, min_instances, max_instances, features, dist_function, normalize)
+            with BUILD_SECONDS.time(phase='branching'):
+                self._branching(node, min_instances, max_instances, features, dist_function, normalize)
             info_msg(node)
         # update leaves
         self.leaves = []
@@ -301,6 +470,7 @@ class PropertyGraph(object):
 
     def _branching(self, node, min_instances, max_instances, features, dist_function, normalize):
         candidates = self._collect_candidates(node, min_instances)
+        CANDIDATES.inc(len(candidates))
         self._update_candidates_by_existing_children(candidates, node)
 
         while True:
@@ -314,6 +484,7 @@ class PropertyGraph(object):
             node.add_child(sel_node)
             sel_node.add_parent(node)
             self.nodes.append(sel_node)
+            NODES.inc()
 
         for c in node.children:
             # split selected node recursively
@@ -325,12 +496,17 @@ class TypeNode(object):
         self.property = property
         self.children = []
         self.parent = None
+        # Bitmap over the subject dictionary of the graph
         self.subjects = subjects
         self.uri = t
         self.subclasses = []
-        self.values = set()
-        self.weight = 1.
         self.features = None
+        self.values = ValueBuffer()
+        self.weight = 1.
+        # number of instances of nodes restored without their subject set
+        self.stored_instances = 0
+        # number of values (the store may only keep a sample)
+        self.count = 0
 
     def get_path(self):
         if self.parent:
@@ -340,14 +516,26 @@ class TypeNode(object):
         else:
             return [self.uri]
 
+    @property
+    def values(self):
+        return self._values
+
+    @values.setter
+    def values(self, values):
+        self._values = values
+        # cached feature vector
+        self.features = None
+
     @property
     def instances(self):
+        if self.subjects is None:
+            return self.stored_instances
         return len(self.subjects)
 
     def split(self, n):
         self.add_child(n)
         self.subjects -= n.subjects
-        self.values -= n.values
+        self.values = self.values.select(self.subjects)
         n.add_parent(self)
 
     def add_parent(self, p):
@@ -374,26 +562,68 @@ class TypeNode(object):
         return self.uri.split('/')[-1].replace('/', '_') + '[' + str(self.property) + ']'
 
     def extract_testdata(self, percent):
-        count = percent * self.instances
-
-        res_data = set()
-        res_subj = set()
-        i = 0
-        #random.shuffle(self.values)
-        while i < count:
-            v = self.values.pop()
-            uri = single_uri(v[0])
-            self.subjects.discard(uri)
-            res_subj.add(uri)
-            res_data.add(v)
-            i += 1
+        count = int(math.ceil(percent * self.instances))
+
+        test = self.values.take(count)
+        self.values = self.values.drop(count)
+        res_subj = Bitmap.from_ids(test.subjects, self.subjects.size)
+        self.subjects -= res_subj
         n = TestData(self.uri, res_subj, self.property)
         n.parent = self
-        n.values = res_data
+        n.values = test
         return n
 
     def get_values(self):
-        return [x[1] for x in self.values]
+        if isinstance(self.values, ValueBuffer):
+            return self.values.values
+        return self.values
+
+
+class ValueBuffer(object):
+    # numeric values of a node and the ids of their subjects
+    def __init__(self, dictionary=None, subjects=None, values=None):
+        self.dictionary = dictionary
+        self.subjects = np.empty(0, dtype=np.int_) if subjects is None else subjects
+        self.values = np.empty(0, dtype=np.float64) if values is None else values
+
+    def __len__(self):
+        return len(self.values)
+
+    def _select(self, mask):
+        return ValueBuffer(self.dictionary, self.subjects[mask], self.values[mask])
+
+    def unique(self):
+        # remove duplicate (subject, value) pairs
+        if not len(self):
+            return self
+        order = np.lexsort((self.values, self.subjects))
+        s = self.subjects[order]
+        v = self.values[order]
+        keep = np.ones(len(order), dtype=bool)
+        keep[1:] = (s[1:] != s[:-1]) | (v[1:] != v[:-1])
+        return ValueBuffer(self.dictionary, s[keep], v[keep])
+
+    def restrict(self, subjects):
+        # only keep the values of the given subject uris
+        if not len(self):
+            return self
+        ids = [self.dictionary.get(s) for s in subjects]
+        ids = np.array([i for i in ids if i is not None], dtype=np.int_)
+        return self._select(np.in1d(self.subjects, ids))
+
+    def select(self, subjects):
+        # only keep the values of the subject ids in the bitmap
+        return self._select(subjects.contains(self.subjects))
+
+    def take(self, count):
+        return ValueBuffer(self.dictionary, self.subjects[:count], self.values[:count])
+
+    def drop(self, count):
+        return ValueBuffer(self.dictionary, self.subjects[count:], self.values[count:])
+
+    def subject_uris(self):
+        return [self.dictionary.decode(i) for i in self.subjects]
+
 
 class SharedPairs(TypeNode):
     def __init__(self, t, subjects, property, predicate_object):
@@ -0,0 +1,100 @@
+import numpy as np
+
+__author__ = 'sebastian'
+
+
+class IntervalIndex(object):
+    # static centered interval tree over the closed intervals [mins[i], maxs[i]]
+    def __init__(self, mins, maxs, leaf_size=16):
+        self.mins = np.asarray(mins, dtype=np.float64)
+        self.maxs = np.asarray(maxs, dtype=np.float64)
+        self.leaf_size = leaf_size
+        self.root = self._build(np.arange(len(self.mins), dtype=np.int64))
+
+    def __len__(self):
+        return len(self.mins)
+
+    def _build(self, ids):
+        if len(ids) <= self.leaf_size:
+            return _Leaf(ids)
+        mins = self.mins[ids]
+        maxs = self.maxs[ids]
+        center = np.median(np.concatenate((mins, maxs)))
+        left = maxs < center
+        right = mins > center
+        here = ~(left | right)
+        if left.all() or right.all():
+            return _Leaf(ids)
+        by_start = ids[here][np.argsort(mins[here], kind='mergesort')]
+        by_end = ids[here][np.argsort(maxs[here], kind='mergesort')]
+        return _Node(center, by_start, self.mins[by_start], by_end, self.maxs[by_end],
+                     self._build(ids[left]), self._build(ids[right]))
+
+    def overlapping(self, lower, upper):
+        # sorted ids of all intervals which overlap [lower, upper]
+        res = []
+        stack = [self.root]
+        while stack:
+            n = stack.pop()
+            if isinstance(n, _Leaf):
+                res.append(n.ids[(self.mins[n.ids] <= upper) & (self.maxs[n.ids] >= lower)])
+            elif upper < n.center:
+                res.append(n.by_start[:np.searchsorted(n.starts, upper, side='right')])
+                stack.append(n.left)
+            elif lower > n.center:
+                res.append(n.by_end[np.searchsorted(n.ends, lower, side='left'):])
+                stack.append(n.right)
+            else:
+                res.append(n.by_start)
+                stack.append(n.left)
+                stack.append(n.right)
+        if not res:
+            return np.empty(0, dtype=np.int64)
+        return np.sort(np.concatenate(res))
+
+
+class _Leaf(object):
+    def __init__(self, ids):
+        self.ids = ids
+
+
+class _Node(object):
+    def __init__(self, center, by_start, starts, by_end, ends, left, right):
+        self.center = center
+        self.by_start = by_start
+        self.starts = starts
+        self.by_end = by_end
+        self.ends = ends
+        self.left = left
+        self.right = right
+
+
+class StoreIndex(object):
+    # interval index over the [min, max] ranges of the nodes of several NodeStores
+    def __init__(self, stores):
+        self.stores = list(stores)
+        self._build([(s.mins, s.maxs) for s in self.stores])
+
+    def _build(self, ranges):
+        # ranges: (mins, maxs) of the nodes of each store
+        self.offsets = np.zeros(len(ranges) + 1, dtype=np.int64)
+        np.cumsum([len(r[0]) for r in ranges], out=self.offsets[1:])
+        if ranges:
+            mins = np.concatenate([r[0] for r in ranges])
+            maxs = np.concatenate([r[1] for r in ranges])
+        else:
+            mins = maxs = np.empty(0, dtype=np.float64)
+        self.index = IntervalIndex(mins, maxs)
+
+    def _store(self, i):
+        return self.stores[i]
+
+    def candidates(self, lower, upper):
+        # list of (store, indices of the overlapping nodes within the store)
+        ids = self.index.overlapping(lower, upper)
+        bounds = np.searchsorted(ids, self.offsets)
+        res = []
+        for i in range(len(self.offsets) - 1):
+            if bounds[i + 1] > bounds[i]:
+                res.append((self._store(i), ids[bounds[i]:bounds[i + 1]] - self.offsets[i]))
+        return res
@@ -0,0 +1,167 @@
+import numpy as np
+
+__author__ = 'sebastian'
+
+# max. number of (candidate, query value) cells evaluated at once
+CHUNK_CELLS = 2 ** 20
+
+
+class _Values(object):
+    def __init__(self, values):
+        self.values = values
+
+
+class NodeStore(object):
+    # the values of all nodes of a graph, sorted per node and concatenated into one buffer:
+    # the values of node i are values[offsets[i]:offsets[i + 1]]
+    def __init__(self, nodes, values=None, offsets=None, keys=None, unique=None, counts=None):
+        self.nodes = list(nodes)
+        if values is None:
+            segments = [np.sort(np.asarray(n.values, dtype=np.float64)) for n in self.nodes]
+            lengths = [len(s) for s in segments]
+            offsets = np.zeros(len(segments) + 1, dtype=np.int64)
+            np.cumsum(lengths, out=offsets[1:])
+            values = np.concatenate(segments) if segments else np.empty(0, dtype=np.float64)
+        self.values = values
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.lengths = np.diff(self.offsets)
+        # number of values of the nodes before sampling, see sample()
+        self.counts = self.lengths if counts is None else np.asarray(counts, dtype=np.int64)
+        if len(self.nodes):
+            self.mins = self.values[self.offsets[:-1]]
+            self.maxs = self.values[self.offsets[1:] - 1]
+        else:
+            self.mins = np.empty(0, dtype=np.float64)
+            self.maxs = np.empty(0, dtype=np.float64)
+        self._sketches = {}
+        if keys is None:
+            self._build_keys()
+        else:
+            # read-only arrays, e.g. memory-mapped from a snapshot
+            self.keys = keys
+            self.unique = unique
+            self.stride = len(unique) + 1
+
+    @classmethod
+    def from_values(cls, value_lists):
+        # store of plain value lists (e.g. query bags)
+        return cls([_Values(v) for v in value_lists])
+
+    def _build_keys(self):
+        # encode every value as (node index, rank of the value within the store) in one sorted integer array.
+        # this allows to count the values <= x of many nodes with a single searchsorted call
+        self.unique, ranks = np.unique(self.values, return_inverse=True)
+        self.stride = len(self.unique) + 1
+        node_ids = np.repeat(np.arange(len(self.nodes), dtype=np.int64), self.lengths)
+        self.keys = node_ids * self.stride + ranks
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def sketch(self, size):
+        # store of the same nodes with at most `size` quantiles per node (all values of smaller nodes).
+        # the empirical CDF of a sketch differs by at most 1/size from the CDF of the node
+        if size not in self._sketches:
+            lengths = np.minimum(self.lengths, size)
+            offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+            np.cumsum(lengths, out=offsets[1:])
+            node_rep = np.repeat(np.arange(len(lengths), dtype=np.int64), lengths)
+            j = np.arange(offsets[-1], dtype=np.int64) - offsets[node_rep]
+            n = self.lengths[node_rep]
+            # the value at which the CDF of the node reaches (j + 1) / size
+            pos = np.where(n <= size, j, ((j + 1) * n) // size - 1) + self.offsets[node_rep]
+            self._sketches[size] = NodeStore(self.nodes, values=self.values[pos], offsets=offsets, counts=self.counts)
+        return self._sketches[size]
+
+    def sample(self, size):
+        # store of the same nodes with at most `size` (>= 2) values per node: evenly spaced order statistics
+        # including the min. and max. of each node, the CDF of a sample differs by about 1/(size - 1) from the
+        # CDF of the node. counts keeps the number of values of the nodes
+        if size < 2:
+            raise ValueError('Sample size must be at least 2: ' + str(size))
+        lengths = np.minimum(self.lengths, size)
+        offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        node_rep = np.repeat(np.arange(len(lengths), dtype=np.int64), lengths)
+        j = np.arange(offsets[-1], dtype=np.int64) - offsets[node_rep]
+        n = self.lengths[node_rep]
+        pos = np.where(n <= size, j, (j * (n - 1) + (size - 1) // 2) // (size - 1)) + self.offsets[node_rep]
+        return NodeStore(self.nodes, values=self.values[pos], offsets=offsets, counts=self.counts)
+
+    @property
+    def nbytes(self):
+        # memory of the value arrays
+        return sum(a.nbytes for a in [self.values, self.offsets, self.keys, self.unique])
+
+    def node_values(self, i):
+        return self.values[self.offsets[i]:self.offsets[i + 1]]
+
+    def ks_statistics(self, x, idx=None):
+        # two-sample KS statistic of x against each node in idx (same result as scipy.stats.ks_2samp)
+        if idx is None:
+            idx = np.arange(len(self.nodes))
+        idx = np.asarray(idx, dtype=np.int64)
+        x = np.sort(np.asarray(x, dtype=np.float64))
+        res = np.zeros(len(idx), dtype=np.float64)
+        if not len(idx) or not len(x):
+            return res
+
+        chunk = max(1, CHUNK_CELLS // len(x))
+        for i in range(0, len(idx), chunk):
+            res[i:i + chunk] = self._ks_chunk(x, idx[i:i + chunk])
+        return res
+
+    def _ks_chunk(self, x, idx):
+        n = len(x)
+        starts = self.offsets[idx]
+        lengths = self.lengths[idx]
+
+        # distance at the values of the nodes
+        seg_pos = np.zeros(len(idx), dtype=np.int64)
+        np.cumsum(lengths[:-1], out=seg_pos[1:])
+        start_rep = np.repeat(starts, lengths)
+        pos = np.arange(lengths.sum(), dtype=np.int64) - np.repeat(seg_pos, lengths) + start_rep
+        cdf_x = np.searchsorted(x, self.values[pos], side='right') / (1.0 * n)
+        cdf_node = (np.searchsorted(self.keys, self.keys[pos], side='right') - start_rep) / (1.0 * np.repeat(lengths, lengths))
+        d_nodes = np.maximum.reduceat(np.abs(cdf_x - cdf_node), seg_pos)
+
+        # distance at the query values
+        cdf_x = np.searchsorted(x, x, side='right') / (1.0 * n)
+        q = idx[:, None] * self.stride + np.searchsorted(self.unique, x, side='right')[None, :]
+        cdf_node = (np.searchsorted(self.keys, q, side='left') - starts[:, None]) / (1.0 * lengths[:, None])
+        d_query = np.abs(cdf_x[None, :] - cdf_node).max(axis=1)
+
+        return np.maximum(d_nodes, d_query)
+
+
+def _ks_side(a, ai, b, bi):
+    # max. |F_a - F_b| at the values of the segments ai of store a, against the segments bi of store b
+    starts = a.offsets[ai]
+    lengths = a.lengths[ai]
+    seg_pos = np.zeros(len(ai), dtype=np.int64)
+    np.cumsum(lengths[:-1], out=seg_pos[1:])
+    start_rep = np.repeat(starts, lengths)
+    pos = np.arange(lengths.sum(), dtype=np.int64) - np.repeat(seg_pos, lengths) + start_rep
+    cdf_a = (np.searchsorted(a.keys, a.keys[pos], side='right') - start_rep) / (1.0 * np.repeat(lengths, lengths))
+    b_rep = np.repeat(bi, lengths)
+    q = b_rep * b.stride + np.searchsorted(b.unique, a.values[pos], side='right')
+    cdf_b = (np.searchsorted(b.keys, q, side='left') - b.offsets[b_rep]) / (1.0 * b.lengths[b_rep])
+    return np.maximum.reduceat(np.abs(cdf_a - cdf_b), seg_pos)
+
+
+def ks_pairs(a, ai, b, bi):
+    # two-sample KS statistics of the pairs (segment ai[j] of store a, segment bi[j] of store b), e.g. several
+    # query bags (a) against their candidate nodes (b) in one pass
+    ai = np.asarray(ai, dtype=np.int64)
+    bi = np.asarray(bi, dtype=np.int64)
+    res = np.zeros(len(ai), dtype=np.float64)
+    cells = np.cumsum(a.lengths[ai] + b.lengths[bi])
+    start = 0
+    while start < len(ai):
+        # pairs of one chunk have at most CHUNK_CELLS values (at least one pair)
+        done = cells[start - 1] if start else 0
+        end = max(start + 1, int(np.searchsorted(cells, done + CHUNK_CELLS, side='right')))
+        x, y = ai[start:end], bi[start:end]
+        res[start:end] = np.maximum(_ks_side(a, x, b, y), _ks_side(b, y, a, x))
+        start = end
+    return res
@@ -0,0 +1,196 @@
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import tempfile
+import time
+import timeit
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import numpy as np
+import yaml
+
+from algorithm import graph
+from algorithm.interval_index import StoreIndex
+from benchmarks.synthetic import Dataset, SCALES
+from utils import dbpedia_access
+from utils.dbpedia_access import DBpedia
+from utils.sparql_stub import StubEndpoint
+from web import builder, labeller
+
+MB = 1024. ** 2
+
+
+def peak_rss():
+    # peak resident set size of this process (MB), ru_maxrss is in KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.
+
+
+class Timings(object):
+    def __init__(self):
+        self.phases = OrderedDict()
+
+    @contextmanager
+    def phase(self, name):
+        logging.info('Benchmark phase: ' + name)
+        start = timeit.default_timer()
+        yield
+        self.phases[name] = OrderedDict([
+            ('seconds', round(timeit.default_timer() - start, 4)),
+            ('peak-rss-mb', round(peak_rss(), 1))
+        ])
+
+
+@contextmanager
+def stub_endpoint(dataset):
+    # the stub answers in a separate process: its result rows are not counted in the peak memory of the build.
+    # new DBpedia instances query the stub (without cache) until the end of the block
+    endpoint = StubEndpoint(dataset.answer)
+    server = multiprocessing.Process(target=endpoint.server.serve_forever)
+    server.daemon = True
+    server.start()
+    settings = dict(dbpedia_access.SETTINGS)
+    dbpedia_access.SETTINGS.update({'endpoint': endpoint.url, 'cache': None, 'fixtures': None, 'offline': False,
+                                    'backoff': 0.01})
+    try:
+        yield endpoint.url
+    finally:
+        dbpedia_access.SETTINGS.update(settings)
+        server.terminate()
+        server.join()
+        endpoint.server.server_close()
+
+
+def latencies(index, store, queries, k, ranking, rnd):
+    # query with value samples of random nodes
+    res = []
+    for _ in range(queries):
+        values = store.node_values(rnd.randint(len(store.nodes)))
+        values = rnd.choice(values, size=rnd.randint(10, 201))
+        start = timeit.default_timer()
+        labeller.ks_classify(values, index, k, **ranking)
+        res.append(timeit.default_timer() - start)
+    return np.array(res) * 1000.
+
+
+def run(config, scale, directory, queries=200, neighbours=10, seed=0):
+    params = dict(SCALES[scale], seed=seed)
+    timings = Timings()
+    dataset = Dataset(directory, **params)
+    with timings.phase('generate'):
+        triples = dataset.generate()
+    dist_fct, features = builder.graph_setup(config)
+    setup = config['graph-setup']
+    with stub_endpoint(dataset):
+        dbp = DBpedia()
+        p = dataset.prop
+        with timings.phase('subjects'):
+            subjects = dbp.get_subjects_by_predicate(graph._normalize_uri(p.prop))
+        g = graph.PropertyGraph(p, subjects, p.filename, min_instances=setup['nodes']['min'])
+        # the build loads the p-o pairs in the scan of branching, here they are loaded (and timed) separately
+        with timings.phase('local_db'):
+            g.local_db
+        with timings.phase('build_type_hierarchy'):
+            g.build_type_hierarchy()
+    with timings.phase('branching'):
+        g.branching(features=features, dist_function=dist_fct, min_instances=setup['nodes']['min'],
+                    max_instances=setup['nodes']['max'], normalize=setup['normalize-dist'])
+    with timings.phase('single_element_values'):
+        g.single_element_values(max_values=setup.get('max-values'))
+    g.release()
+
+    index = StoreIndex([g.store])
+    ranking = labeller.ranking_config(config)
+    if ranking['sketch_size']:
+        with timings.phase('sketches'):
+            g.store.sketch(ranking['sketch_size'])
+    with timings.phase('ks_classify'):
+        ms = latencies(index, g.store, queries, neighbours, ranking, np.random.RandomState(seed))
+
+    return OrderedDict([
+        ('scale', scale),
+        ('dataset', OrderedDict(sorted(params.items()) + [
+            ('triples', triples),
+            ('file-size-mb', round(os.path.getsize(p.filename + '_subjects') / MB, 1))
+        ])),
+        ('graph-setup', setup),
+        ('ranking', ranking),
+        ('graph', OrderedDict([
+            ('nodes', len(g.nodes)),
+            ('values', int(g.store.counts.sum())),
+            ('stored-values', len(g.store.values)),
+            ('value-memory-mb', round(g.store.nbytes / MB, 1))
+        ])),
+        ('phases', timings.phases),
+        ('ks_classify', OrderedDict([
+            ('queries', queries),
+            ('neighbours', neighbours),
+            ('p50-ms', round(np.percentile(ms, 50), 3)),
+            ('p99-ms', round(np.percentile(ms, 99), 3)),
+            ('mean-ms', round(ms.mean(), 3))
+        ])),
+        ('peak-rss-mb', round(peak_rss(), 1)),
+        ('python', platform.python_version()),
+        ('numpy', np.__version__),
+        ('time', time.strftime('%Y-%m-%dT%H:%M:%S'))
+    ])
+
+
+def compare(result, baseline):
+    # ratio to a previous run per phase (>1: slower)
+    res = OrderedDict()
+    for name, phase in result['phases'].items():
+        if name in baseline.get('phases', {}) and baseline['phases'][name]['seconds']:
+            res[name] = round(phase['seconds'] / baseline['phases'][name]['seconds'], 2)
+    for q in ['p50-ms', 'p99-ms']:
+        if baseline.get('ks_classify', {}).get(q):
+            res['ks_classify ' + q] = round(result['ks_classify'][q] / baseline['ks_classify'][q], 2)
+    if baseline.get('peak-rss-mb'):
+        res['peak-rss-mb'] = round(result['peak-rss-mb'] / baseline['peak-rss-mb'], 2)
+    return res
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Benchmark the graph build and the query latency on synthetic data')
+    parser.add_argument("-c", "--config", default="config.yaml", help="config file (graph-setup and ranking sections)")
+    parser.add_argument("--scale", choices=sorted(SCALES, key=lambda s: SCALES[s]['subjects']), default="small")
+    parser.add_argument("--queries", type=int, default=200, help="number of ks_classify queries")
+    parser.add_argument("--neighbours", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--dir", help="directory of the generated files (default: temporary, removed afterwards)")
+    parser.add_argument("-o", "--output", help="write the results as JSON to this file (default: stdout)")
+    parser.add_argument("--baseline", help="results of a previous run, the ratios per phase are added to the output")
+    parser.add_argument("--debug", action="store_true")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO,
+                        format='%(asctime)s %(levelname)s %(message)s')
+    with open(args.config, 'r') as ymlfile:
+        config = yaml.load(ymlfile)
+    directory = args.dir or tempfile.mkdtemp(prefix='benchmark-')
+    try:
+        result = run(config, args.scale, directory, args.queries, args.neighbours, args.seed)
+    finally:
+        if not args.dir:
+            shutil.rmtree(directory)
+    if args.baseline:
+        with open(args.baseline) as f:
+            result['baseline'] = compare(result, json.load(f))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+        logging.info('Results written to: ' + args.output)
+    else:
+        print json.dumps(result, indent=2)
+
+
+if __name__ == '__main__':
+    main()
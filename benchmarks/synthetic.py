@@ -0,0 +1,125 @@
+import os
+import pickle
+import re
+import threading
+
+import numpy as np
+
+from algorithm import graph
+from utils.sparql_cache import normalize_query
+
+ONTOLOGY = 'http://dbpedia.org/ontology/'
+RESOURCE = 'http://dbpedia.org/resource/'
+RDF_TYPE = '<http://www.w3.org/1999/02/22-rdf-syntax-ns#type>'
+DC_SUBJECT = '<http://purl.org/dc/terms/subject>'
+FOAF_NAME = '<http://xmlns.com/foaf/0.1/name>'
+DOUBLE = '<http://www.w3.org/2001/XMLSchema#double>'
+
+SCALES = {
+    'tiny': dict(subjects=2000, types=6, categories=10),
+    'small': dict(subjects=20000, types=12, categories=40),
+    'medium': dict(subjects=200000, types=30, categories=200),
+    'large': dict(subjects=1000000, types=60, categories=1000)
+}
+
+SUBCLASSES = re.compile(r'VALUES \?c \{(.*?)\}')
+TYPE_SUBJECTS = re.compile(r'VALUES \?t \{(.*?)\}')
+
+
+class Dataset(object):
+    # synthetic numeric property: every subject has a most specific type of a random type tree (and all its
+    # superclasses), one to three categories (dct:subject, skewed towards the first categories) and one or
+    # two values, which depend on the type and the categories
+    def __init__(self, directory, subjects, types, categories, name='benchmarkValue', seed=0):
+        self.directory = directory
+        self.size = subjects
+        self.prop = graph.Property(ONTOLOGY + name, dir=directory)
+        rnd = np.random.RandomState(seed)
+        self.rnd = rnd
+        # type i > 0 is a subclass of a type < i
+        self.parents = np.array([-1] + [rnd.randint(0, i) for i in range(1, types)])
+        self.subject_types = rnd.randint(0, types, subjects)
+        self.categories = categories
+        self.type_offsets = rnd.normal(0, 5, types)
+        self.category_offsets = rnd.normal(0, 1, categories)
+        self._answers = {}
+        self._lock = threading.Lock()
+
+    def type_uri(self, t):
+        return ONTOLOGY + 'Type' + str(t)
+
+    def subject_uri(self, s):
+        return RESOURCE + 'S' + str(s)
+
+    def ancestors(self, t):
+        res = []
+        while t >= 0:
+            res.append(t)
+            t = self.parents[t]
+        return res
+
+    def children(self, t):
+        return [int(c) for c in np.flatnonzero(self.parents == t)]
+
+    def subjects_of_type(self, t):
+        # subjects of the type and its subclasses
+        types = [c for c in range(len(self.parents)) if t in self.ancestors(c)]
+        return np.flatnonzero(np.in1d(self.subject_types, types))
+
+    def generate(self, block=10000):
+        # write <prop>_subjects and <prop>_common_types.pkl, returns the number of triples
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+        prop = self.prop.prop.encode('utf8')
+        triples = 0
+        ancestors = [self.ancestors(t) for t in range(len(self.parents))]
+        weights = 1. / np.arange(1, self.categories + 1)
+        with open(self.prop.filename + '_subjects', 'w') as f:
+            for start in range(0, self.size, block):
+                n = min(block, self.size - start)
+                categories = self.rnd.choice(self.categories, size=(n, 3), p=weights / weights.sum())
+                category_counts = self.rnd.randint(1, 4, n)
+                value_counts = self.rnd.randint(1, 3, n)
+                noise = self.rnd.normal(0, 1., (n, 2))
+                lines = []
+                for i in range(n):
+                    s = start + i
+                    uri = '<' + self.subject_uri(s) + '>'
+                    t = self.subject_types[s]
+                    cats = set(categories[i, :category_counts[i]])
+                    mean = self.type_offsets[t] + sum(self.category_offsets[c] for c in cats)
+                    for v in noise[i, :value_counts[i]]:
+                        lines.append(uri + ' ' + prop + ' "' + repr(round(mean + v, 3)) + '"^^' + DOUBLE + ' .\n')
+                    for c in cats:
+                        lines.append(uri + ' ' + DC_SUBJECT + ' <' + RESOURCE + 'Category:C' + str(c) + '> .\n')
+                    for a in ancestors[t]:
+                        lines.append(uri + ' ' + RDF_TYPE + ' <' + self.type_uri(a) + '> .\n')
+                    lines.append(uri + ' ' + FOAF_NAME + ' "Subject ' + str(s) + '"@en .\n')
+                f.writelines(lines)
+                triples += len(lines)
+        counts = [(self.type_uri(t), len(self.subjects_of_type(t))) for t in range(len(self.parents))]
+        with open(self.prop.filename + '_common_types.pkl', 'w') as f:
+            pickle.dump(sorted(counts, key=lambda c: c[1], reverse=True), f)
+        return triples
+
+    def answer(self, query):
+        # SPARQL stub (see utils.sparql_stub): the queries of the graph build
+        key = normalize_query(query)
+        with self._lock:
+            if key not in self._answers:
+                self._answers[key] = self._answer(query)
+            return self._answers[key]
+
+    def _answer(self, query):
+        m = SUBCLASSES.search(query)
+        if m:
+            return [{'c': {'type': 'uri', 'value': c[1:-1]}, 't': {'type': 'uri', 'value': self.type_uri(t)}}
+                    for c in m.group(1).split() for t in self.children(self._type_id(c))]
+        m = TYPE_SUBJECTS.search(query)
+        if m:
+            return [{'t': {'type': 'uri', 'value': t[1:-1]}, 's': {'type': 'uri', 'value': self.subject_uri(s)}}
+                    for t in m.group(1).split() for s in self.subjects_of_type(self._type_id(t))]
+        return [{'s': {'type': 'uri', 'value': self.subject_uri(s)}} for s in range(self.size)]
+
+    def _type_id(self, uri):
+        return int(uri[1:-1][len(self.type_uri('')):])
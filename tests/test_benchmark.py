@@ -0,0 +1,45 @@
+import shutil
+import tempfile
+import unittest
+
+from benchmarks import run
+from benchmarks.synthetic import Dataset
+
+CONFIG = {
+    'graph-setup': {
+        'nodes': {'min': 50, 'max': 100},
+        'normalize-dist': True,
+        'dist-function': 'kolmogorov_dist',
+        'feature-vector': 'FV1'
+    },
+    'ranking': {'sketch-size': 32}
+}
+
+
+class BenchmarkTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_answer(self):
+        dataset = Dataset(self.dir, subjects=100, types=3, categories=5)
+        rows = dataset.answer(u'SELECT ?t ?s WHERE { VALUES ?t { <' + dataset.type_uri(0) + u'> } ?s a ?t. }')
+        # all subjects have the root type
+        self.assertEqual(100, len(rows))
+        rows = dataset.answer(u'SELECT ?c ?t WHERE { VALUES ?c { <' + dataset.type_uri(0) + u'> } ?t rdfs:subClassOf ?c }')
+        self.assertEqual(set(dataset.type_uri(t) for t in dataset.children(0)), set(r['t']['value'] for r in rows))
+
+    def test_run(self):
+        result = run.run(CONFIG, 'tiny', self.dir, queries=20)
+        self.assertEqual(['generate', 'subjects', 'local_db', 'build_type_hierarchy', 'branching',
+                          'single_element_values', 'sketches', 'ks_classify'], list(result['phases']))
+        self.assertGreater(result['graph']['nodes'], 1)
+        self.assertLessEqual(result['ks_classify']['p50-ms'], result['ks_classify']['p99-ms'])
+        ratios = run.compare(result, result)
+        self.assertEqual(1., ratios['branching'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+import unittest
+
+import numpy as np
+
+from algorithm.bitmap import Bitmap
+
+
+class BitmapTestCase(unittest.TestCase):
+    def setUp(self):
+        self.rnd = np.random.RandomState(3)
+        self.size = 1000
+
+    def _random(self, count):
+        ids = self.rnd.randint(0, self.size, count)
+        return Bitmap.from_ids(ids, self.size), set(ids.tolist())
+
+    def test_set_algebra(self):
+        # sparse and dense containers
+        for c1, c2 in [(5, 10), (5, 800), (800, 5), (600, 900)]:
+            a, sa = self._random(c1)
+            b, sb = self._random(c2)
+            self.assertEqual(sa & sb, set(a & b))
+            self.assertEqual(sa | sb, set(a | b))
+            self.assertEqual(sa - sb, set(a - b))
+            self.assertEqual(sb - sa, set(b - a))
+            self.assertEqual(len(sa & sb), a.intersection_count(b))
+            self.assertEqual(not (sa & sb), a.isdisjoint(b))
+            self.assertEqual(len(sa), len(a))
+
+    def test_contains(self):
+        for count in [3, 900]:
+            a, sa = self._random(count)
+            ids = np.arange(self.size + 20)
+            self.assertEqual([i in sa for i in ids], list(a.contains(ids)))
+            self.assertEqual(sorted(sa), list(a))
+
+    def test_mask(self):
+        a, sa = self._random(700)
+        self.assertEqual(sa, set(np.flatnonzero(a.mask())))
+        self.assertEqual(a, Bitmap.from_mask(a.mask()))
+        self.assertEqual(a, Bitmap.from_ids(sorted(sa), self.size, is_sorted=True))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+import os
+import shutil
+import signal
+import tempfile
+import time
+import unittest
+
+import numpy as np
+
+from algorithm import graph
+from web import builder, labeller
+
+# builds of the fake build_graph: property name -> (start, end), written by the pool processes
+LOG = 'builds.log'
+
+
+def fake_build(p, config, dbp=None):
+    start = time.time()
+    if p.name == 'broken':
+        raise ValueError('no subjects')
+    if p.name == 'killed':
+        os.kill(os.getpid(), signal.SIGKILL)
+    time.sleep(5. if p.name == 'slow' else 0.3)
+    g = graph.PropertyGraph(p, set(), p.filename, min_instances=2)
+    root = graph.TypeNode(u'http://dbpedia.org/ontology/Thing', g.encode_subjects('abcd'), p)
+    root.values = graph.ValueBuffer(g.dictionary, root.subjects.to_ids(), np.array([1., 2., 3., 4.]))
+    g.nodes = [root]
+    g.roots = [root]
+    g.single_element_values()
+    g.release()
+    with open(os.path.join(config['local-files'], LOG), 'a') as f:
+        f.write(p.name + ' ' + repr(start) + ' ' + repr(time.time()) + '\n')
+    return g
+
+
+class BuildGraphsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.config = {
+            'graph-setup': {'nodes': {'min': 2, 'max': 5}, 'normalize-dist': True, 'dist-function': 'kolmogorov_dist'},
+            'local-files': self.dir,
+            'build': {'workers': 3, 'memory-factor': 1}
+        }
+        self.build_graph = builder.build_graph
+        builder.build_graph = fake_build
+        self.poll = builder.POLL_SECONDS
+        builder.POLL_SECONDS = 0.1
+
+    def tearDown(self):
+        builder.build_graph = self.build_graph
+        builder.POLL_SECONDS = self.poll
+        shutil.rmtree(self.dir)
+
+    def props(self, names):
+        props = []
+        for name in names:
+            p = graph.Property('http://dbpedia.org/ontology/' + name, dir=self.dir)
+            # 1000 bytes: estimated memory of the build with memory-factor 1
+            with open(p.filename + '_subjects', 'w') as f:
+                f.write('x' * 1000)
+            props.append(p)
+        return props
+
+    def builds(self):
+        with open(os.path.join(self.dir, LOG)) as f:
+            return sorted((float(start), float(end)) for name, start, end in (l.split() for l in f))
+
+    def test_errors(self):
+        self.config['build']['timeout'] = 2
+        props = self.props(['height', 'broken', 'killed', 'slow'])
+        graphs, errors = builder.build_graphs(props, self.config)
+        self.assertEqual(['height'], [p.name for p in graphs])
+        self.assertEqual([1., 2., 3., 4.], list(graphs[props[0]].store.values))
+        self.assertEqual(['broken', 'killed', 'slow'], sorted(p.name for p in errors))
+        self.assertIn('no subjects', errors[props[1]])
+        self.assertIn('died', errors[props[2]])
+        self.assertIn('timed out', errors[props[3]])
+
+    def test_budget(self):
+        props = self.props(['height', 'weight', 'age'])
+        graphs, errors = builder.build_graphs(props, self.config)
+        self.assertEqual(3, len(graphs))
+        builds = self.builds()
+        # without a budget the builds run at the same time
+        self.assertTrue(any(b[0] < a[1] for a, b in zip(builds, builds[1:])))
+
+        os.remove(os.path.join(self.dir, LOG))
+        # only one build of 1000 bytes fits into the budget
+        self.config['build']['max-memory'] = 1500. / builder.GB
+        graphs, errors = builder.build_graphs(props, self.config)
+        self.assertEqual(3, len(graphs))
+        builds = self.builds()
+        self.assertTrue(all(b[0] >= a[1] for a, b in zip(builds, builds[1:])))
+
+    def test_labeller_errors(self):
+        # with workers > 1 a single missing property is built in the pool as well, its error is recorded
+        num_labeller = labeller.NumLabeller(self.props(['broken']), self.config)
+        self.assertEqual({}, num_labeller.graphs)
+        self.assertEqual(['broken'], [p.name for p in num_labeller.errors])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+import os
+import re
+import shutil
+import tempfile
+import threading
+import unittest
+
+from utils import dbpedia_access, sparql_cache
+from utils.dbpedia_access import DBpedia, OfflineError
+from utils.sparql_client import HTTPError, SparqlClient
+from utils.sparql_stub import StubEndpoint
+
+QUERY = u'SELECT ?s WHERE { ?s a ?t }'
+
+
+def answer(query):
+    # two subclasses for each type of a VALUES block, otherwise 17 subjects
+    m = re.search(r'VALUES \?c \{(.*?)\}', query)
+    if m:
+        return [{'c': {'type': 'uri', 'value': c[1:-1]}, 't': {'type': 'uri', 'value': c[1:-1] + str(i)}}
+                for c in m.group(1).split() for i in range(2)]
+    return [{'s': {'type': 'uri', 'value': 's' + str(i)}} for i in range(17)]
+
+
+class DBpediaTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.cache = os.path.join(self.dir, 'cache')
+        self.endpoint = StubEndpoint(answer)
+        self.endpoint.start()
+
+    def tearDown(self):
+        self.endpoint.stop()
+        shutil.rmtree(self.dir)
+
+    def _dbpedia(self, **kwargs):
+        client = SparqlClient(self.endpoint.url, workers=3, retries=3, backoff=0.01)
+        return DBpedia(endpoint=self.endpoint.url, client=client, **kwargs)
+
+    def test_pages(self):
+        dbp = self._dbpedia()
+        rows = dbp.rows(QUERY, ['s'], limit=3)
+        self.assertEqual(['s0'], next(rows))
+        self.assertEqual([['s' + str(i)] for i in range(1, 17)], list(rows))
+        # first page alone, then windows of 3 pages until the incomplete page 6
+        self.assertEqual(7, len(self.endpoint.requests))
+        # single page
+        self.assertEqual(17, len(dbp._retrieve(QUERY, ['s'], limit=50)))
+        self.assertEqual(8, len(self.endpoint.requests))
+
+    def test_retry(self):
+        self.endpoint.failures = 2
+        self.assertEqual(17, len(self._dbpedia()._retrieve(QUERY, ['s'], limit=5)))
+        # each of the 4 pages failed twice
+        self.assertEqual(12, len(self.endpoint.requests))
+
+    def test_client_error(self):
+        # client errors are not retried
+        self.endpoint.failures = 2
+        self.endpoint.status = 400
+        with self.assertRaises(HTTPError) as e:
+            self._dbpedia()._retrieve(QUERY, ['s'], limit=5)
+        self.assertEqual(400, e.exception.status)
+        self.assertEqual(1, len(self.endpoint.requests))
+
+    def test_values_batches(self):
+        batch = dbpedia_access.SETTINGS['values-batch']
+        dbpedia_access.SETTINGS['values-batch'] = 2
+        try:
+            types = [u'<t' + str(i) + u'>' for i in range(5)]
+            res = self._dbpedia().get_subclasses_of_types(types)
+        finally:
+            dbpedia_access.SETTINGS['values-batch'] = batch
+        self.assertEqual(set(['t30', 't31']), res[u'<t3>'])
+        self.assertEqual(types, sorted(res.keys()))
+        self.assertEqual(3, len(self.endpoint.requests))
+
+    def test_cache(self):
+        dbp = self._dbpedia(cache=self.cache)
+        res = dbp._retrieve(QUERY, ['s'], limit=3)
+        self.assertEqual(17, len(res))
+        requests = len(self.endpoint.requests)
+
+        # same query with different whitespace is served from the cache
+        dbp = self._dbpedia(cache=self.cache, offline=True)
+        self.assertEqual(res, dbp._retrieve(u' SELECT ?s\nWHERE {  ?s a ?t }', ['s'], limit=3))
+        self.assertEqual(requests, len(self.endpoint.requests))
+        # other page size is not cached
+        self.assertRaises(OfflineError, dbp._retrieve, QUERY, ['s'], limit=5)
+
+    def test_fixtures(self):
+        self._dbpedia(cache=self.cache)._retrieve(QUERY, ['s'], limit=3)
+        dbp = self._dbpedia(cache=os.path.join(self.dir, 'empty'), fixtures=self.cache, offline=True)
+        self.assertEqual(17, len(dbp._retrieve(QUERY, ['s'], limit=3)))
+
+    def test_eviction(self):
+        cache = sparql_cache.SparqlCache(self.cache, max_size=0.001)
+        for i in range(10):
+            cache.put(str(i), [{'s': {'value': 'x' * 100}}])
+        self.assertLessEqual(cache.size, sparql_cache.MB * 0.001)
+        self.assertIsNotNone(cache.get('9'))
+        self.assertIsNone(cache.get('0'))
+
+    def test_concurrent_size(self):
+        cache = sparql_cache.SparqlCache(self.cache, max_size=0.01)
+        cache.put('first', [])
+
+        def put(start):
+            for i in range(start, start + 50):
+                cache.put(str(i % 60), [{'s': {'value': 'x' * 100}}])
+        threads = [threading.Thread(target=put, args=(i * 50,)) for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(cache._total_size(), cache.size)
+        self.assertLessEqual(cache.size, sparql_cache.MB * 0.01)
+
+
+if __name__ == '__main__':
+    unittest.main()
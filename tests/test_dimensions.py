@@ -0,0 +1,50 @@
+import unittest
+
+import numpy as np
+
+from algorithm import dimensions, feature_extraction
+
+
+class DimensionsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.rnd = np.random.RandomState(5)
+
+    def tearDown(self):
+        dimensions.DIMENSIONS.pop('range', None)
+        dimensions.PERCENTILES.pop('range', None)
+
+    def test_feature_vectors(self):
+        for n in [1, 2, 5, 100]:
+            x = self.rnd.randn(n) * 100
+            self.assertEqual([min(x), max(x), np.mean(x), np.std(x)], dimensions.FV1(x))
+            self.assertEqual([np.percentile(x, 5), np.percentile(x, 95), np.mean(x), np.std(x)], dimensions.FV2(x))
+
+    def test_batch(self):
+        value_lists = [self.rnd.randn(n) for n in [5, 0, 3, 1, 50, 0]]
+        vectors = feature_extraction.get_feature_vectors(value_lists, dimensions.FV2)
+        for x, v in zip(value_lists, vectors):
+            if len(x):
+                np.testing.assert_allclose(dimensions.FV2(x), v, rtol=1e-12)
+            else:
+                self.assertIsNone(v)
+
+    def test_register(self):
+        dimensions.register_dimension('range', lambda stats: stats.max - stats.min)
+        fv = dimensions.FeatureVector(['range', dimensions.percentile_dimension(50)])
+        x = self.rnd.randn(11)
+        self.assertEqual([max(x) - min(x), np.median(x)], fv(x))
+        X = fv.batch(np.concatenate((x, x[:4])), [0, 11, 15])
+        self.assertEqual((2, 2), X.shape)
+        self.assertAlmostEqual(np.median(x[:4]), X[1, 1])
+
+    def test_partition(self):
+        # percentiles of a single vector without sorting it
+        x = self.rnd.randn(101)
+        stats = dimensions.SegmentStatistics(x)
+        self.assertAlmostEqual(np.percentile(x, 5), stats.percentile(5)[0])
+        self.assertAlmostEqual(np.percentile(x, 95), stats.percentile(95)[0])
+        self.assertNotIn('sorted', stats._cache)
+
+
+if __name__ == '__main__':
+    unittest.main()
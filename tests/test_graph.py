@@ -0,0 +1,143 @@
+import math
+import pickle
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+from sklearn import preprocessing
+
+from algorithm import dimensions, feature_extraction, graph
+
+ONT = 'http://dbpedia.org/ontology/'
+
+
+class FakeKB(object):
+    # subjects and direct subclasses of the types
+    subjects = {'Agent': 'abcd', 'Person': 'abc', 'Athlete': 'ab', 'Place': 'd'}
+    subclasses = {'Agent': ['Person'], 'Person': ['Athlete', 'Politician']}
+
+    def get_subjects_by_predicate_types(self, p, types):
+        return dict((t, set('http://dbpedia.org/resource/' + x for x in self.subjects[t[1:-1][len(ONT):]]))
+                    for t in types)
+
+    def get_subclasses_of_types(self, types):
+        return dict((t, set(ONT + x for x in self.subclasses.get(t[1:-1][len(ONT):], []))) for t in types)
+
+
+TRIPLES = [
+    '<http://dbpedia.org/resource/a> <http://dbpedia.org/ontology/height> "1.8"^^<http://www.w3.org/2001/XMLSchema#double> .',
+    '<http://dbpedia.org/resource/a> <http://dbpedia.org/ontology/height> "1.8" .',
+    '<http://dbpedia.org/resource/b> <http://dbpedia.org/ontology/height> "1,7" .',
+    '<http://dbpedia.org/resource/b> <http://dbpedia.org/ontology/height> "tall" .',
+    '<http://dbpedia.org/resource/c> <http://dbpedia.org/ontology/height> "2.1" .',
+    '<http://dbpedia.org/resource/c> <http://dbpedia.org/ontology/weight> "80" .',
+    '<http://dbpedia.org/resource/d> <http://dbpedia.org/ontology/height> "1.6" .',
+    '<http://dbpedia.org/resource/a> <http://purl.org/dc/terms/subject> <http://dbpedia.org/resource/Category:X> .',
+    '<http://dbpedia.org/resource/b> <http://purl.org/dc/terms/subject> <http://dbpedia.org/resource/Category:X> .',
+    '<http://dbpedia.org/resource/c> <http://purl.org/dc/terms/subject> <http://dbpedia.org/resource/Category:X> .',
+    '<http://dbpedia.org/resource/c> <http://purl.org/dc/terms/subject> <http://dbpedia.org/resource/Category:Y> .',
+    '<http://dbpedia.org/resource/a> <http://xmlns.com/foaf/0.1/name> "A"@en .',
+    '<http://dbpedia.org/resource/b> <http://xmlns.com/foaf/0.1/name> "A"@en .',
+]
+
+
+class GraphTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.prop = graph.Property('http://dbpedia.org/ontology/height', dir=self.dir)
+        with open(self.prop.filename + '_subjects', 'w') as f:
+            f.write('\n'.join(TRIPLES) + '\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def _uris(self, *names):
+        return set('http://dbpedia.org/resource/' + n for n in names)
+
+    def test_add_values_to_nodes(self):
+        g = graph.PropertyGraph(self.prop, set(), self.prop.filename, min_instances=2)
+        n1 = graph.TypeNode(u'http://dbpedia.org/ontology/Person', g.encode_subjects(self._uris('a', 'b', 'c')), self.prop)
+        n2 = graph.TypeNode(u'http://dbpedia.org/ontology/Athlete', g.encode_subjects(self._uris('c', 'd')), self.prop)
+        graph.add_values_to_nodes([n1, n2], self.prop, self.prop.filename, g.dictionary)
+        self.assertEqual([1.7, 1.8, 2.1], sorted(n1.get_values()))
+        self.assertEqual([1.6, 2.1], sorted(n2.get_values()))
+        self.assertEqual(self._uris('a'), set(n1.values.restrict(self._uris('a', 'd')).subject_uris()))
+        self.assertEqual([2.1], list(n1.values.select(n2.subjects).values))
+
+    def test_build_subclasses(self):
+        with open(self.prop.filename + '_common_types.pkl', 'w') as f:
+            pickle.dump([(ONT + t, 10) for t in ['Athlete', 'Agent', 'Place', 'Person']], f)
+        g = graph.PropertyGraph(self.prop, self._uris('a', 'b', 'c', 'd'), self.prop.filename, min_instances=1)
+        g._build_subclasses(FakeKB())
+        nodes = dict((n.uri[len(ONT):], n) for n in g.nodes)
+        # Place has not enough subjects
+        self.assertEqual(['Athlete', 'Agent', 'Person'], [n.uri[len(ONT):] for n in g.nodes])
+        self.assertEqual([nodes['Person']], nodes['Agent'].children)
+        self.assertEqual([nodes['Athlete']], nodes['Person'].children)
+        self.assertEqual(nodes['Person'], nodes['Athlete'].parent)
+        self.assertIsNone(nodes['Agent'].parent)
+        self.assertEqual(self._uris('a', 'b', 'c'), set(g.dictionary.decode(i) for i in nodes['Person'].subjects))
+
+    def test_local_shared_property_object_pairs(self):
+        db = graph.LocalDB(self.prop.filename, 2)
+        shared = db.local_shared_property_object_pairs(self._uris('a', 'b', 'c', 'd'))
+        x = (u'<http://purl.org/dc/terms/subject>', u'<http://dbpedia.org/resource/Category:X>')
+        self.assertEqual([x], list(shared.keys()))
+        self.assertEqual(self._uris('a', 'b', 'c'), shared[x])
+
+
+class FakeNode(object):
+    def __init__(self, values):
+        self.values = values
+        self.features = None
+
+    def get_values(self):
+        return self.values
+
+
+def scalar_euclid_dist(candidates, node, features, normalize):
+    # one feature vector and distance per candidate, candidates without valid feature vector are skipped
+    p_features = feature_extraction.get_feature_vector(node.get_values(), features)
+    if normalize:
+        scaler = preprocessing.StandardScaler().fit([p_features])
+        p_features = scaler.transform([p_features])[0]
+    best, dist = None, -1
+    for c in candidates:
+        c_features = feature_extraction.get_feature_vector(c.get_values(), features)
+        if not len(c.get_values()) or c_features is None:
+            continue
+        if normalize:
+            c_features = scaler.transform([c_features])[0]
+        d = math.sqrt(sum((a - b) ** 2 for a, b in zip(p_features, c_features)))
+        if d > dist:
+            best, dist = c, d
+    return best
+
+
+class EuclidDistTestCase(unittest.TestCase):
+    def test_same_selection(self):
+        rnd = np.random.RandomState(3)
+        for features in [dimensions.FV1, dimensions.FV2]:
+            for normalize in [True, False]:
+                for _ in range(20):
+                    node = FakeNode(list(rnd.randn(30) * 10))
+                    candidates = [FakeNode(list(rnd.randn(rnd.randint(1, 20)) * rnd.uniform(1, 20)))
+                                  for _ in range(8)]
+                    expected = scalar_euclid_dist(candidates, node, features, normalize)
+                    self.assertIs(expected, graph.euclid_dist(candidates, node, features, normalize))
+
+    def test_invalid_candidates(self):
+        node = FakeNode([1., 2., 3.])
+        near = FakeNode([1., 2., 4.])
+        invalid = FakeNode([float('nan'), 100.])
+        empty = FakeNode([])
+        candidates = [invalid, near, empty]
+        self.assertIs(near, graph.euclid_dist(candidates, node, dimensions.FV1, False))
+        # candidates without values are removed
+        self.assertEqual([invalid, near], candidates)
+        self.assertIsNone(graph.euclid_dist([invalid], node, dimensions.FV1, False))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+import os
+import shutil
+import gc
+import tempfile
+import threading
+import unittest
+
+import numpy as np
+
+from algorithm import graph
+from algorithm.interval_index import StoreIndex
+from utils import snapshot
+from web import labeller
+from web.graph_cache import GraphCache, LazyStoreIndex
+
+VALUES = {
+    'height': [1.8, 1.7, 2.1, 1.9],
+    'weight': [70., 80., 95., 60.],
+    'age': [1.5, 30., 45., 52.]
+}
+
+
+class GraphCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.snapshot = os.path.join(self.dir, 'snapshot')
+        self.config = {
+            'graph-setup': {'nodes': {'min': 2, 'max': 5}, 'normalize-dist': True, 'dist-function': 'kolmogorov_dist'},
+            'local-files': self.dir,
+            'properties': os.path.join(self.dir, 'props.csv')
+        }
+        with open(self.config['properties'], 'w') as f:
+            for name in sorted(VALUES):
+                f.write('"http://dbpedia.org/ontology/' + name + '",10\n')
+        self.graphs = {}
+        for name, values in VALUES.items():
+            prop = graph.Property('http://dbpedia.org/ontology/' + name, dir=self.dir)
+            with open(prop.filename + '_subjects', 'w') as f:
+                f.write('<http://dbpedia.org/resource/a> <' + prop.prop[1:-1] + '> "1" .\n')
+            g = graph.PropertyGraph(prop, set(), prop.filename, min_instances=2)
+            root = graph.TypeNode(u'http://dbpedia.org/ontology/Thing', g.encode_subjects('abcd'), prop)
+            root.values = graph.ValueBuffer(g.dictionary, root.subjects.to_ids(), np.array(values))
+            g.nodes = [root]
+            g.roots = [root]
+            g.single_element_values()
+            g.release()
+            self.graphs[prop] = g
+        snapshot.save(self.snapshot, self.graphs, self.config)
+        self.entries = snapshot.entries(self.snapshot, list(self.graphs), self.config)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def names(self, candidates):
+        return [s.nodes[0].property.name for s, idx in candidates]
+
+    def test_lru(self):
+        size = self.graphs.values()[0].store.nbytes
+        cache = GraphCache(self.snapshot, self.entries, self.config, max_memory=2 * size)
+        index = LazyStoreIndex(cache)
+        self.assertEqual([], cache.loaded())
+        # only the graph of the value range is loaded
+        self.assertEqual(['weight'], self.names(index.candidates(60., 70.)))
+        self.assertEqual(1, len(cache.loaded()))
+        # age and height are loaded, weight is the least recently used graph
+        index.candidates(1.6, 1.9)
+        self.assertEqual(['age', 'height'], [p.name for p in cache.graphs])
+        index.candidates(60., 70.)
+        self.assertEqual(['height', 'weight'], [p.name for p in cache.graphs])
+        self.assertLessEqual(cache.memory(), 2 * size)
+
+    def test_same_neighbours(self):
+        cache = GraphCache(self.snapshot, self.entries, self.config, max_memory=1)
+        lazy = LazyStoreIndex(cache)
+        eager = StoreIndex(self.graphs[p].store for p in sorted(self.graphs, key=lambda p: p.name))
+        for values in [[1.7, 1.9], [50., 60.], [1., 100.]]:
+            self.assertEqual([(str(n), d) for n, d in labeller.ks_classify(values, eager, 3)],
+                             [(str(n), d) for n, d in labeller.ks_classify(values, lazy, 3)])
+        batch = labeller.ks_classify_batch([[1.7, 1.9], [50., 60.]], lazy, 3)
+        self.assertEqual([str(n) for n, d in batch[1]], [str(n) for n, d in labeller.ks_classify([50., 60.], eager, 3)])
+        # never more than the last graph with max_memory below the size of one graph
+        self.assertEqual(1, len(cache.loaded()))
+
+    def test_wide_query(self):
+        size = self.graphs.values()[0].store.nbytes
+        cache = GraphCache(self.snapshot, self.entries, self.config, max_memory=size)
+        candidates = LazyStoreIndex(cache).candidates(0., 100.)
+        self.assertEqual(3, len(candidates))
+        # the dropped graphs are used by the query until it is finished
+        self.assertEqual(1, len(cache.loaded()))
+        self.assertEqual(3 * size, cache.memory())
+        del candidates
+        gc.collect()
+        self.assertEqual(size, cache.memory())
+
+    def test_concurrent_load(self):
+        cache = GraphCache(self.snapshot, self.entries, self.config)
+        props = dict((p.name, p) for p in self.graphs)
+        cache.get(props['height'])
+        started = threading.Event()
+        release = threading.Event()
+        load = cache._load
+
+        def slow_load(p):
+            started.set()
+            release.wait()
+            return load(p)
+        cache._load = slow_load
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.get(props['age']))) for _ in range(2)]
+        for t in threads:
+            t.start()
+        started.wait()
+        # loaded graphs are served while another graph is read from disk
+        self.assertEqual('height', cache.get(props['height']).prop.name)
+        release.set()
+        for t in threads:
+            t.join()
+        # one load for both queries
+        self.assertIs(results[0], results[1])
+        self.assertEqual(['height', 'age'], [p.name for p in cache.graphs])
+
+    def test_release(self):
+        g = self.graphs.values()[0]
+        self.assertIsNone(g.dictionary)
+        self.assertIsNone(g.nodes[0].subjects)
+        self.assertEqual(4, g.nodes[0].instances)
+
+
+if __name__ == '__main__':
+    unittest.main()
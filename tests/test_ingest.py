@@ -0,0 +1,56 @@
+import StringIO
+import unittest
+
+import numpy as np
+
+from web import ingest
+
+
+class IngestTestCase(unittest.TestCase):
+    def test_read_columns(self):
+        table = 'name;height;weight\nx;1,8;70\ny;1.7;80\nz;;abc\nw;2.0\n'
+        samples = ingest.read_columns(StringIO.StringIO(table))
+        self.assertEqual([0, 1, 2], sorted(samples))
+        height = samples[1]
+        self.assertEqual([1.7, 2.0], height.values.tolist())
+        self.assertEqual([u'height', u'1,8'], height.invalid)
+        self.assertTrue(height.has_header())
+        self.assertEqual((2, 2), (height.numeric, height.non_numeric))
+        # only the requested column
+        samples = ingest.read_columns(StringIO.StringIO(table), [2])
+        self.assertEqual([2], list(samples))
+        self.assertEqual([70., 80.], samples[2].values.tolist())
+
+    def test_empty_cells(self):
+        nums, mask = ingest.to_numbers(['1.5', '', ' ', '2'])
+        self.assertEqual([True, False, False, True], mask.tolist())
+        self.assertEqual([1.5, 2.], nums[mask].tolist())
+        nums, mask = ingest.to_numbers(['1.5', '', 'abc', '2'])
+        self.assertEqual([True, False, False, True], mask.tolist())
+        self.assertEqual([False, False], ingest.to_numbers(['', ' '])[1].tolist())
+
+    def test_byte_order_mark(self):
+        samples = ingest.read_columns(StringIO.StringIO('\xef\xbb\xbf1;2\n3;4\n'))
+        self.assertEqual([1., 3.], samples[0].values.tolist())
+        self.assertEqual([], samples[0].invalid)
+        self.assertFalse(samples[0].has_header())
+
+    def test_reservoir(self):
+        values = np.arange(100000, dtype=np.float64)
+        lines = '\n'.join(str(v) for v in values)
+        samples = ingest.read_columns(StringIO.StringIO(lines), [0], max_values=1000)
+        sample = samples[0]
+        self.assertEqual(1000, len(sample.values))
+        self.assertEqual(100000, sample.numeric)
+        self.assertTrue(sample.sampled)
+        self.assertEqual(1000, len(np.unique(sample.values)))
+        # uniform over the whole column, not only the first rows
+        self.assertGreater(np.mean(sample.values), 40000)
+        self.assertLess(np.mean(sample.values), 60000)
+        # same upload, same sample
+        again = ingest.read_columns(StringIO.StringIO(lines), [0], max_values=1000)[0]
+        self.assertTrue(np.array_equal(sample.values, again.values))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,6 +2,7 @@ import unittest
 import yaml
 
 from algorithm import graph, dimensions
+from utils import dbpedia_access
 from utils.dbpedia_access import DBpedia
 
 
@@ -9,6 +10,7 @@ class InitGraphTestCase(unittest.TestCase):
     def setUp(self):
         with open("config.yaml", 'r') as ymlfile:
             self.config = yaml.load(ymlfile)
+        dbpedia_access.configure(self.config)
 
         self.dist_fct = getattr(graph, self.config['graph-setup']['dist-function'])
 
@@ -0,0 +1,30 @@
+import unittest
+
+import numpy as np
+
+from algorithm.interval_index import IntervalIndex
+
+
+class IntervalIndexTestCase(unittest.TestCase):
+    def test_overlapping(self):
+        rnd = np.random.RandomState(7)
+        mins = rnd.uniform(-100, 100, 2000)
+        maxs = mins + rnd.exponential(5, 2000)
+        index = IntervalIndex(mins, maxs)
+        for i in range(200):
+            lower = rnd.uniform(-120, 120)
+            upper = lower + rnd.exponential(10)
+            expected = np.flatnonzero((mins <= upper) & (maxs >= lower))
+            self.assertEqual(list(expected), list(index.overlapping(lower, upper)))
+
+    def test_points(self):
+        mins = [1., 1., 2., 5., 5.]
+        maxs = [1., 3., 2., 5., 9.]
+        index = IntervalIndex(mins, maxs, leaf_size=1)
+        self.assertEqual([0, 1], list(index.overlapping(1., 1.)))
+        self.assertEqual([3, 4], list(index.overlapping(4., 5.)))
+        self.assertEqual([], list(index.overlapping(10., 11.)))
+
+
+if __name__ == '__main__':
+    unittest.main()
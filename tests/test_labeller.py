@@ -4,6 +4,7 @@ import yaml
 
 from web.labeller import NumLabeller
 from web import labeller
+from utils import dbpedia_access
 
 
 class LabellerTestCase(unittest.TestCase):
@@ -13,6 +14,7 @@ class LabellerTestCase(unittest.TestCase):
 
         with open("config.yaml", 'r') as ymlfile:
             config = yaml.load(ymlfile)
+        dbpedia_access.configure(config)
 
         props = labeller.parse_props(config=config)
         num_labeller = NumLabeller(props, config)
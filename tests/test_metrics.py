@@ -0,0 +1,71 @@
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+from utils import metrics
+
+
+class MetricsTestCase(unittest.TestCase):
+    def test_counter(self):
+        c = metrics.counter('test_requests_total', 'Requests', labels=('endpoint',))
+        c.clear()
+        c.inc(endpoint='a')
+        c.inc(2, endpoint='a')
+        c.inc(endpoint='b')
+        self.assertIs(c, metrics.counter('test_requests_total', 'Requests', labels=('endpoint',)))
+        self.assertEqual(3, c.get(endpoint='a'))
+        lines = c.exposition()
+        self.assertEqual(u'# TYPE test_requests_total counter', lines[1])
+        self.assertEqual([u'test_requests_total{endpoint="a"} 3', u'test_requests_total{endpoint="b"} 1'], lines[2:])
+
+    def test_histogram(self):
+        h = metrics.histogram('test_seconds', 'Duration', buckets=(0.1, 1.))
+        h.clear()
+        for v in [0.05, 0.5, 0.7, 3.]:
+            h.observe(v)
+        self.assertEqual(4, h.count())
+        self.assertAlmostEqual(4.25, h.sum())
+        lines = h.exposition()[2:]
+        self.assertEqual([u'test_seconds_bucket{le="0.1"} 1', u'test_seconds_bucket{le="1.0"} 3',
+                          u'test_seconds_bucket{le="+Inf"} 4'], lines[:3])
+        self.assertEqual(u'test_seconds_count 4', lines[4])
+        with h.time():
+            pass
+        self.assertEqual(5, h.count())
+        self.assertIn(u'# HELP test_seconds Duration', metrics.exposition())
+
+
+    def test_merged(self):
+        # the metrics of the worker processes in a shared directory
+        c = metrics.counter('test_merged_total', 'Requests', labels=('endpoint',))
+        g = metrics.gauge('test_merged_bytes', 'Memory')
+        h = metrics.histogram('test_merged_seconds', 'Duration', buckets=(0.1, 1.))
+        for m in [c, g, h]:
+            m.clear()
+        c.inc(2, endpoint='a')
+        g.set(10)
+        h.observe(0.5)
+        directory = tempfile.mkdtemp()
+        try:
+            dead = subprocess.Popen(['true'])
+            dead.wait()
+            for pid, value in [(os.getppid(), 3), (dead.pid, 4)]:
+                with open(os.path.join(directory, str(pid) + '.json'), 'w') as f:
+                    json.dump({c.name: [[['a'], value]], g.name: [[[], value]], h.name: [[[], [[1, 0, 0], 0.05]]]}, f)
+            lines = metrics.merged_exposition(directory).split(u'\n')
+        finally:
+            shutil.rmtree(directory)
+        # counts of exited workers are kept, gauges only of the live workers
+        self.assertIn(u'test_merged_total{endpoint="a"} 9', lines)
+        self.assertIn(u'test_merged_bytes{worker="' + unicode(os.getpid()) + u'"} 10', lines)
+        self.assertIn(u'test_merged_bytes{worker="' + unicode(os.getppid()) + u'"} 3', lines)
+        self.assertNotIn(u'test_merged_bytes{worker="' + unicode(dead.pid) + u'"} 4', lines)
+        self.assertIn(u'test_merged_seconds_bucket{le="0.1"} 2', lines)
+        self.assertIn(u'test_merged_seconds_count 3', lines)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+import unittest
+
+import numpy as np
+import scipy.stats
+
+from algorithm.algorithms import KolmogorovSmirnov
+from algorithm.interval_index import StoreIndex
+from algorithm.node_store import NodeStore, ks_pairs
+from web import labeller
+
+
+class Node(object):
+    def __init__(self, values):
+        self.values = values
+
+
+class NodeStoreTestCase(unittest.TestCase):
+    def setUp(self):
+        rnd = np.random.RandomState(42)
+        self.nodes = []
+        for i in range(30):
+            size = rnd.randint(1, 300)
+            if i % 3 == 0:
+                # many ties
+                values = list(rnd.randint(0, 20, size).astype(float))
+            else:
+                values = list(rnd.normal(rnd.uniform(-10, 10), rnd.uniform(1, 5), size))
+            self.nodes.append(Node(values))
+        self.query = list(rnd.normal(0, 4, 50)) + [1.0, 1.0, 5.0]
+
+    def test_ks_statistics(self):
+        store = NodeStore(self.nodes)
+        dists = store.ks_statistics(self.query)
+        for n, d in zip(self.nodes, dists):
+            expected, p = scipy.stats.ks_2samp(self.query, n.values)
+            self.assertAlmostEqual(expected, d, places=12)
+
+    def test_ks_statistics_subset(self):
+        store = NodeStore(self.nodes)
+        idx = [2, 5, 17, 29]
+        dists = store.ks_statistics(self.query, idx)
+        for i, d in zip(idx, dists):
+            expected, p = scipy.stats.ks_2samp(self.query, self.nodes[i].values)
+            self.assertAlmostEqual(expected, d, places=12)
+
+    def test_neighbors(self):
+        store = NodeStore(self.nodes)
+        expected = sorted(((n, scipy.stats.ks_2samp(self.query, n.values)[0]) for n in self.nodes),
+                          key=lambda x: x[1])[:10]
+        neighbors = KolmogorovSmirnov([(store, np.arange(len(store)))]).getNeighbors(self.query, 10)
+        self.assertEqual([n for n, d in expected], [n for n, d in neighbors])
+
+    def test_ks_pairs(self):
+        store = NodeStore(self.nodes)
+        queries = NodeStore.from_values([self.query, self.query[:7], [3.0]])
+        qi = [0, 1, 2, 1, 0]
+        ni = [4, 4, 0, 29, 13]
+        for q, i, d in zip(qi, ni, ks_pairs(queries, qi, store, ni)):
+            self.assertEqual(store.ks_statistics(queries.nodes[q].values, [i])[0], d)
+
+    def test_ks_classify_batch(self):
+        index = StoreIndex([NodeStore(self.nodes[:12]), NodeStore(self.nodes[12:])])
+        columns = [self.query, [], [1.0, 2.0, 1.0], self.query[10:20], [1000.0]]
+        res = labeller.ks_classify_batch(columns, index, 5)
+        for values, neighbors in zip(columns, res):
+            self.assertEqual(labeller.ks_classify(values, index, 5), neighbors)
+
+    def test_sketch(self):
+        store = NodeStore(self.nodes)
+        for size in [4, 16, 64]:
+            sketch = store.sketch(size)
+            self.assertTrue((sketch.lengths <= size).all())
+            diff = np.abs(sketch.ks_statistics(self.query) - store.ks_statistics(self.query))
+            self.assertTrue((diff <= 1. / size + 1e-12).all())
+        # small nodes are kept exactly
+        small = np.flatnonzero(store.lengths <= 64)
+        self.assertEqual(list(store.ks_statistics(self.query, small)), list(sketch.ks_statistics(self.query, small)))
+
+    def test_sample(self):
+        store = NodeStore(self.nodes)
+        for size in [4, 16, 64]:
+            sample = store.sample(size)
+            self.assertTrue((sample.lengths <= size).all())
+            # true counts, min. and max. of the nodes
+            self.assertEqual(list(store.lengths), list(sample.counts))
+            self.assertEqual((list(store.mins), list(store.maxs)), (list(sample.mins), list(sample.maxs)))
+            diff = np.abs(sample.ks_statistics(self.query) - store.ks_statistics(self.query))
+            self.assertTrue((diff <= 1. / (size - 1) + 1e-12).all())
+        self.assertLess(sample.nbytes, store.nbytes)
+
+    def test_approximate_neighbors(self):
+        store = NodeStore(self.nodes)
+        candidates = [(store, np.arange(len(store)))]
+        exact = KolmogorovSmirnov(candidates).getNeighbors(self.query, 10)
+        approx = KolmogorovSmirnov(candidates, sketch_size=8, rerank=12).getNeighbors(self.query, 10)
+        # re-ranked distances are exact, nodes missed by the approximate ranking are within the error bound
+        for n, d in approx:
+            self.assertAlmostEqual(scipy.stats.ks_2samp(self.query, n.values)[0], d, places=12)
+        self.assertLessEqual(approx[-1][1] - exact[-1][1], approx.error_bound + 1e-12)
+        self.assertLessEqual(approx.error_bound, 1. / 8 * 2)
+        # all candidates re-ranked
+        full = KolmogorovSmirnov(candidates, sketch_size=8, rerank=len(store)).getNeighbors(self.query, 10)
+        self.assertEqual(exact, full)
+        self.assertEqual(0., full.error_bound)
+
+    def test_approximate_batch(self):
+        index = StoreIndex([NodeStore(self.nodes[:12]), NodeStore(self.nodes[12:])])
+        columns = [self.query, [], [1.0, 2.0, 1.0], self.query[10:20]]
+        res = labeller.ks_classify_batch(columns, index, 5, sketch_size=8, rerank=6)
+        for values, neighbors in zip(columns, res):
+            expected = labeller.ks_classify(values, index, 5, sketch_size=8, rerank=6)
+            self.assertEqual(expected, neighbors)
+            self.assertEqual(expected.error_bound, neighbors.error_bound)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import gzip
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+from utils import ntriples
+
+LINES = ['<http://dbpedia.org/resource/a> <http://dbpedia.org/ontology/height> "1.8" .',
+         '<http://dbpedia.org/resource/b> <http://xmlns.com/foaf/0.1/name> "Name with spaces"@en .',
+         '',
+         '<http://dbpedia.org/resource/c> <http://dbpedia.org/ontology/height> "2.1"']
+
+
+class NTriplesTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.dir, 'height')
+        self.expected = [['<http://dbpedia.org/resource/a>', '<http://dbpedia.org/ontology/height>', '"1.8"'],
+                         ['<http://dbpedia.org/resource/b>', '<http://xmlns.com/foaf/0.1/name>', '"Name'],
+                         ['<http://dbpedia.org/resource/c>', '<http://dbpedia.org/ontology/height>', '"2.1"']]
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def _read(self, chunk_size=7):
+        res = []
+        for triples in ntriples.read_triples(self.filename, chunk_size=chunk_size):
+            res.extend(x[:3] for x in triples)
+        return res
+
+    def test_plain(self):
+        with open(self.filename + '_subjects', 'w') as f:
+            f.write('\n'.join(LINES))
+        self.assertEqual(self.expected, self._read())
+        self.assertEqual(self.expected, self._read(chunk_size=1 << 20))
+
+    def test_gzip(self):
+        with gzip.open(self.filename + '_subjects.gz', 'wb') as f:
+            f.write('\n'.join(LINES) + '\n')
+        self.assertEqual(self.expected, self._read())
+
+    def test_split_archive(self):
+        src = os.path.join(self.dir, 'src')
+        os.mkdir(src)
+        with open(os.path.join(src, 'height_subjects'), 'w') as f:
+            f.write('\n'.join(LINES) + '\n')
+        with open(os.path.join(src, 'width_subjects'), 'w') as f:
+            f.write('\n'.join(LINES[:1]) + '\n')
+        archive = os.path.join(self.dir, 'subjects.tar.gz')
+        subprocess.check_call(['tar', '-czf', archive, '-C', src, 'width_subjects', 'height_subjects'])
+        subprocess.check_call(['split', '-b', '100', archive, archive + '.'])
+        os.remove(archive)
+        self.assertEqual(self.expected, self._read())
+        self.assertTrue(len(ntriples.source_files(self.filename)) > 1)
+
+    def test_scan(self):
+        with open(self.filename + '_subjects', 'w') as f:
+            f.write('\n'.join(LINES))
+
+        class Consumer(object):
+            def __init__(self):
+                self.triples = []
+                self.finished = False
+
+            def add(self, triples):
+                self.triples.extend(x[:3] for x in triples)
+
+            def finish(self):
+                self.finished = True
+
+        consumers = [Consumer(), Consumer()]
+        count, duration = ntriples.scan(self.filename, consumers, chunk_size=5)
+        self.assertEqual(3, count)
+        self.assertTrue(all(c.finished for c in consumers))
+        self.assertEqual(self.expected, consumers[1].triples)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+import unittest
+
+from web.query_cache import QueryCache, query_key
+
+
+class QueryCacheTestCase(unittest.TestCase):
+    def test_key(self):
+        self.assertEqual(query_key([3.0, 1.0, 2.0], 10), query_key([1.0, 2.0, 3.0], 10))
+        self.assertNotEqual(query_key([1.0, 2.0, 3.0], 10), query_key([1.0, 2.0, 3.0], 5))
+        self.assertNotEqual(query_key([1.0, 2.0], 10), query_key([1.0, 2.0, 2.0], 10))
+
+    def test_lru(self):
+        cache = QueryCache(max_size=2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        self.assertEqual(1, cache.get('a'))
+        cache.put('c', 3)
+        # b was least recently used
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(1, cache.get('a'))
+        self.assertEqual(3, cache.get('c'))
+        stats = cache.stats()
+        self.assertEqual((3, 1, 1, 2), (stats['hits'], stats['misses'], stats['evictions'], stats['size']))
+        cache.clear()
+        self.assertIsNone(cache.get('a'))
+
+    def test_ttl(self):
+        cache = QueryCache(max_size=2, ttl=-1)
+        cache.put('a', 1)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(1, cache.stats()['expirations'])
+        self.assertEqual(0, len(cache))
+
+
+    def test_generation(self):
+        cache = QueryCache(max_size=2)
+        generation = cache.generation
+        cache.put('a', 1, generation)
+        # ranked before the clear, put after it
+        cache.clear()
+        cache.put('b', 2, generation)
+        self.assertIsNone(cache.get('b'))
+        cache.put('b', 2, cache.generation)
+        self.assertEqual(2, cache.get('b'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+import gc
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+import numpy as np
+
+from algorithm import graph
+from utils import snapshot
+from web import labeller
+from web.rebuilds import RebuildQueue
+
+VALUES = {
+    'height': [1.8, 1.7, 2.1, 1.9],
+    'weight': [70., 80., 95., 60.]
+}
+
+
+class RebuildsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.snapshot = os.path.join(self.dir, 'snapshot')
+        self.config = {
+            'graph-setup': {'nodes': {'min': 2, 'max': 5}, 'normalize-dist': True, 'dist-function': 'kolmogorov_dist'},
+            'local-files': self.dir,
+            'properties': os.path.join(self.dir, 'props.csv')
+        }
+        with open(self.config['properties'], 'w') as f:
+            for name in sorted(VALUES):
+                f.write('"http://dbpedia.org/ontology/' + name + '",10\n')
+        self.props = [self.prop(name) for name in sorted(VALUES)]
+        snapshot.save(self.snapshot, dict((p, self.graph(p, VALUES[p.name])) for p in self.props), self.config)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def prop(self, name):
+        prop = graph.Property('http://dbpedia.org/ontology/' + name, dir=self.dir)
+        with open(prop.filename + '_subjects', 'w') as f:
+            f.write('<http://dbpedia.org/resource/a> <' + prop.prop[1:-1] + '> "1" .\n')
+        return prop
+
+    def graph(self, prop, values):
+        g = graph.PropertyGraph(prop, set(), prop.filename, min_instances=2)
+        root = graph.TypeNode(u'http://dbpedia.org/ontology/Thing', g.encode_subjects('abcd'), prop)
+        root.values = graph.ValueBuffer(g.dictionary, root.subjects.to_ids(), np.array(values))
+        g.nodes = [root]
+        g.roots = [root]
+        g.single_element_values()
+        g.release()
+        return g
+
+    def labels(self, num_labeller, values):
+        return [n.property.name for n, d in num_labeller.get_candidates(values, 1)]
+
+    def check_refresh(self, lazy):
+        num_labeller = labeller.NumLabeller(self.props, self.config, snapshot_dir=self.snapshot, lazy=lazy)
+        self.assertEqual('unchanged', num_labeller.refresh(self.props[0]))
+        index = num_labeller.index
+        # new property, built into the snapshot by another process
+        length = self.prop('length')
+        snapshot.save(self.snapshot, {length: self.graph(length, [70., 80., 95., 60.])}, self.config)
+        self.assertEqual('loaded', num_labeller.refresh(length))
+        self.assertIn(length, num_labeller.props)
+        self.assertIsNot(index, num_labeller.index)
+        self.assertEqual(3, len(num_labeller.graphs))
+        # changed values of an existing property
+        weight = self.props[1]
+        snapshot.save(self.snapshot, {weight: self.graph(weight, [1.5, 1.7, 1.8, 1.9])}, self.config)
+        self.assertEqual('loaded', num_labeller.refresh(weight))
+        self.assertEqual('unchanged', num_labeller.refresh(weight))
+        self.assertEqual(['length'], self.labels(num_labeller, [60., 70., 80., 95.]))
+        # the index of the queries started before the swap still has the old graphs
+        self.assertEqual(['weight'], [n.property.name for n, d in labeller.ks_classify([60., 70., 80., 95.], index, 1)])
+        # the new property is added to the properties file, it is served after a restart
+        self.assertEqual(['height', 'weight', 'length'], [p.name for p in labeller.parse_props(self.config)])
+        self.assertFalse(labeller.add_prop(self.config, length, 4))
+        restarted = labeller.NumLabeller(labeller.parse_props(self.config), self.config, snapshot_dir=self.snapshot,
+                                         lazy=lazy)
+        self.assertEqual(3, len(restarted.graphs))
+
+    def test_refresh(self):
+        self.check_refresh(lazy=False)
+
+    def test_refresh_lazy(self):
+        self.check_refresh(lazy=True)
+
+    def test_versioned_files(self):
+        self.config['api'] = {'graph-memory': 1e-6}
+        num_labeller = labeller.NumLabeller(self.props, self.config, snapshot_dir=self.snapshot, lazy=True)
+        weight = self.props[1]
+        files = set(os.listdir(self.snapshot))
+        # rebuilt by another process, the graph of weight is dropped from memory and loaded again
+        snapshot.save(self.snapshot, {weight: self.graph(weight, [1.5, 1.7, 1.8, 1.9])}, self.config)
+        self.assertEqual(['height'], self.labels(num_labeller, [1.7, 1.8]))
+        # the index of the old graph loads the old files
+        [(node, dist)] = num_labeller.get_candidates([60., 70., 80., 95.], 1)
+        self.assertEqual(('weight', 0.), (node.property.name, dist))
+        old = set(f for f in files if f.startswith('weight-'))
+        index = num_labeller.index
+        self.assertEqual('loaded', num_labeller.refresh(weight))
+        # the files of the old graph are removed when the queries of the old index are finished
+        self.assertTrue(old <= set(os.listdir(self.snapshot)))
+        del index
+        gc.collect()
+        self.assertEqual(set(), old & set(os.listdir(self.snapshot)))
+        self.assertEqual(8, len([f for f in os.listdir(self.snapshot) if f.endswith('.npy') or f.endswith('.npz')]))
+
+    def test_stale(self):
+        num_labeller = labeller.NumLabeller(self.props, self.config, snapshot_dir=self.snapshot)
+        with open(self.props[0].filename + '_subjects', 'a') as f:
+            f.write('<http://dbpedia.org/resource/b> <' + self.props[0].prop[1:-1] + '> "2" .\n')
+        served = num_labeller.served[self.props[0]]
+        self.assertTrue(snapshot.is_stale(served, self.props[0], self.config))
+        self.assertFalse(snapshot.is_stale(num_labeller.served[self.props[1]], self.props[1], self.config))
+
+    def test_queue(self):
+        changed = []
+        release = threading.Event()
+
+        def refresh(p, force):
+            release.wait()
+            if p.name == 'broken':
+                raise ValueError('no subjects')
+            return 'built' if force else 'unchanged'
+
+        queue = RebuildQueue(refresh, on_change=changed.append)
+        queue.submit(self.props[0])
+        # pending jobs of a property are not repeated
+        job = queue.submit(self.props[1], force=True)
+        self.assertIs(job, queue.submit(self.props[1]))
+        queue.submit(self.prop('broken'))
+        release.set()
+        queue.wait()
+        jobs = queue.list()
+        self.assertEqual(['unchanged', 'built', 'failed'], [job['status'] for job in jobs])
+        self.assertIn('no subjects', jobs[2]['error'])
+        self.assertEqual([self.props[1]], changed)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from StringIO import StringIO
+
+import numpy as np
+
+from algorithm import graph
+from utils import snapshot
+from web import labeller, server
+
+VALUES = {
+    'height': [1.8, 1.7, 2.1, 1.9],
+    'weight': [70., 80., 95., 60.]
+}
+
+
+class ServerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.snapshot = os.path.join(self.dir, 'snapshot')
+        self.config = {
+            'graph-setup': {'nodes': {'min': 2, 'max': 5}, 'normalize-dist': True, 'dist-function': 'kolmogorov_dist'},
+            'local-files': self.dir,
+            'properties': os.path.join(self.dir, 'props.csv')
+        }
+        with open(self.config['properties'], 'w') as f:
+            for name in sorted(VALUES):
+                f.write('"http://dbpedia.org/ontology/' + name + '",10\n')
+        graphs = {}
+        for name, values in VALUES.items():
+            prop = graph.Property('http://dbpedia.org/ontology/' + name, dir=self.dir)
+            with open(prop.filename + '_subjects', 'w') as f:
+                f.write('<http://dbpedia.org/resource/a> <' + prop.prop[1:-1] + '> "1" .\n')
+            graphs[prop] = self.graph(prop, values)
+        snapshot.save(self.snapshot, graphs, self.config)
+        server.set_labeller(labeller.NumLabeller(sorted(graphs, key=lambda p: p.name), self.config,
+                                                 snapshot_dir=self.snapshot), {'size': 10})
+        self.client = server.app.test_client()
+
+    def tearDown(self):
+        server.app.config['ADMIN_TOKEN'] = None
+        shutil.rmtree(self.dir)
+
+    def graph(self, prop, values):
+        g = graph.PropertyGraph(prop, set(), prop.filename, min_instances=2)
+        root = graph.TypeNode(u'http://dbpedia.org/ontology/Thing', g.encode_subjects('abcd'), prop)
+        root.values = graph.ValueBuffer(g.dictionary, root.subjects.to_ids(), np.array(values))
+        g.nodes = [root]
+        g.roots = [root]
+        g.single_element_values()
+        g.release()
+        return g
+
+
+class BatchLabellingTestCase(ServerTestCase):
+    def post(self, data, query=''):
+        return self.client.post('/labelling/batch?neighbours=1' + query, data=json.dumps(data),
+                                content_type='application/json')
+
+    def test_columns(self):
+        res = self.post({'columns': {'h': [1.75, 1.8, 2.0], 'w': [65, 75, 90]}})
+        self.assertEqual(200, res.status_code)
+        columns = json.loads(res.data)['columns']
+        self.assertEqual(['h', 'w'], [c['column'] for c in columns])
+        self.assertEqual(['Thing[height]', 'Thing[weight]'], [c['neighbours'][0][0] for c in columns])
+        res = self.post({'columns': [[1.75, 1.8, 2.0], ['a', 'b', 1]]}, query='&detect=true')
+        self.assertEqual([1], json.loads(res.data)['skipped'])
+
+    def test_csv(self):
+        table = 'name;height\na;1.8\nb;1.75\nc;2.0\n'
+        res = self.client.post('/labelling/batch?neighbours=1', data={'csv': (StringIO(table), 'table.csv')})
+        result = json.loads(res.data)
+        self.assertEqual([0], result['skipped'])
+        self.assertEqual([1], [c['column'] for c in result['columns']])
+
+    def test_swap_while_ranking(self):
+        num_labeller = server.app.config['LABELLER']
+        rank = num_labeller.get_candidates_batch
+        height = num_labeller.props[0]
+
+        def swap(*args):
+            res = rank(*args)
+            # the graph of height is rebuilt by another process and swapped in before the result is cached
+            snapshot.save(self.snapshot, {height: self.graph(height, [70., 80., 95., 60.])}, self.config)
+            self.assertEqual('loaded', num_labeller.refresh(height))
+            server.app.config['REBUILDS'].on_change(height)
+            return res
+
+        num_labeller.get_candidates_batch = swap
+        try:
+            res = self.post({'columns': [[1.8, 1.9]]})
+        finally:
+            del num_labeller.get_candidates_batch
+        self.assertEqual(['Thing[height]'], [c['neighbours'][0][0] for c in json.loads(res.data)['columns']])
+        # the result of the old graph is not cached
+        self.assertEqual(0, len(server.app.config['CACHE']))
+        self.assertEqual(200, self.post({'columns': [[1.8, 1.9]]}).status_code)
+        self.assertEqual((0, 1), (server.app.config['CACHE'].stats()['hits'], len(server.app.config['CACHE'])))
+
+    def test_invalid_json(self):
+        for data in [{'columns': 5}, {'columns': {'a': 5}}, {'columns': [[1, 2], 'x']}, 'columns', [1, 2]]:
+            self.assertEqual(400, self.post(data).status_code)
+
+
+class AdminTestCase(ServerTestCase):
+    def rebuild(self, remote='127.0.0.1', token=None):
+        return self.client.post('/admin/graphs/rebuild?property=height', environ_base={'REMOTE_ADDR': remote},
+                                headers={'X-Admin-Token': token} if token else {})
+
+    def test_localhost(self):
+        # without a token only from localhost
+        self.assertEqual(403, self.rebuild(remote='10.0.0.1').status_code)
+        self.assertEqual(202, self.rebuild().status_code)
+        server.app.config['REBUILDS'].wait()
+        jobs = json.loads(self.client.get('/admin/graphs').data)['jobs']
+        self.assertEqual(['unchanged'], [job['status'] for job in jobs])
+
+    def test_token(self):
+        server.app.config['ADMIN_TOKEN'] = 'secret'
+        self.assertEqual(403, self.rebuild().status_code)
+        self.assertEqual(403, self.rebuild(remote='10.0.0.1', token='wrong').status_code)
+        self.assertEqual(202, self.rebuild(remote='10.0.0.1', token='secret').status_code)
+        server.app.config['REBUILDS'].wait()
+
+
+if __name__ == '__main__':
+    unittest.main()
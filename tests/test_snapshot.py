@@ -0,0 +1,93 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from algorithm import graph
+from utils import snapshot
+
+
+class SnapshotTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.config = {
+            'graph-setup': {'nodes': {'min': 2, 'max': 5}, 'normalize-dist': True, 'dist-function': 'kolmogorov_dist'},
+            'local-files': self.dir,
+            'properties': os.path.join(self.dir, 'props.csv')
+        }
+        with open(self.config['properties'], 'w') as f:
+            f.write('"http://dbpedia.org/ontology/height",10\n')
+        self.prop = graph.Property('http://dbpedia.org/ontology/height', dir=self.dir)
+        with open(self.prop.filename + '_subjects', 'w') as f:
+            f.write('<http://dbpedia.org/resource/a> <http://dbpedia.org/ontology/height> "1.8" .\n')
+
+        g = graph.PropertyGraph(self.prop, set(), self.prop.filename, min_instances=2)
+        root = graph.TypeNode(u'http://dbpedia.org/ontology/Person', g.encode_subjects(['a', 'b', 'c', 'd']), self.prop)
+        child = graph.SharedPairs(root.uri, g.encode_subjects(['a', 'b']), self.prop,
+                                  (u'<http://purl.org/dc/terms/subject>', u'<http://dbpedia.org/resource/Category:X>'))
+        empty = graph.TypeNode(u'http://dbpedia.org/ontology/Athlete', g.encode_subjects([]), self.prop)
+        root.add_child(child)
+        child.add_parent(root)
+        root.add_child(empty)
+        empty.add_parent(root)
+        root.values = graph.ValueBuffer(g.dictionary, root.subjects.to_ids(), np.array([1.8, 1.7, 2.1, 1.9]))
+        child.values = root.values.select(child.subjects)
+        g.nodes = [root, child, empty]
+        g.roots = [root]
+        g.single_element_values()
+        self.graph = g
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_roundtrip(self):
+        out = os.path.join(self.dir, 'snapshot')
+        snapshot.save(out, {self.prop: self.graph}, self.config)
+        graphs = snapshot.load(out, [self.prop], self.config)
+        g = graphs[self.prop]
+        self.assertEqual([str(n) for n in self.graph.nodes], [str(n) for n in g.nodes])
+        self.assertEqual([n.get_path() for n in self.graph.nodes], [n.get_path() for n in g.nodes])
+        self.assertEqual([n.instances for n in self.graph.nodes], [n.instances for n in g.nodes])
+        self.assertEqual([n.weight for n in self.graph.nodes], [n.weight for n in g.nodes])
+        self.assertEqual(len(self.graph.store), len(g.store))
+        for a, b in zip(self.graph.store.nodes, g.store.nodes):
+            self.assertEqual(list(a.values), list(b.values))
+            self.assertEqual((a.min, a.max), (b.min, b.max))
+        self.assertTrue(np.allclose(self.graph.store.ks_statistics([1.75, 1.8]), g.store.ks_statistics([1.75, 1.8])))
+
+    def test_sampled(self):
+        self.graph.single_element_values(max_values=2)
+        self.assertEqual([1.7, 2.1], list(self.graph.nodes[0].values))
+        self.assertEqual(4, self.graph.nodes[0].count)
+        out = os.path.join(self.dir, 'snapshot')
+        snapshot.save(out, {self.prop: self.graph}, self.config)
+        g = snapshot.load(out, [self.prop], self.config)[self.prop]
+        self.assertEqual([4, 2], list(g.store.counts))
+        self.assertEqual([2, 2], list(g.store.lengths))
+        self.assertEqual((1.7, 2.1), (g.nodes[0].min, g.nodes[0].max))
+
+    def test_mmap(self):
+        out = os.path.join(self.dir, 'snapshot')
+        snapshot.save(out, {self.prop: self.graph}, self.config)
+        g = snapshot.load(out, [self.prop], self.config, mmap=True)[self.prop]
+        self.assertIsInstance(g.store.keys, np.memmap)
+        self.assertFalse(g.store.values.flags.writeable)
+        self.assertEqual(list(self.graph.store.keys), list(g.store.keys))
+        self.assertEqual(list(self.graph.store.ks_statistics([1.75, 1.8])), list(g.store.ks_statistics([1.75, 1.8])))
+
+    def test_stale(self):
+        out = os.path.join(self.dir, 'snapshot')
+        snapshot.save(out, {self.prop: self.graph}, self.config)
+        with open(self.prop.filename + '_subjects', 'a') as f:
+            f.write('<http://dbpedia.org/resource/b> <http://dbpedia.org/ontology/height> "1.7" .\n')
+        self.assertEqual({}, snapshot.load(out, [self.prop], self.config))
+
+        snapshot.save(out, {self.prop: self.graph}, self.config)
+        self.config['graph-setup']['nodes']['min'] = 3
+        self.assertEqual({}, snapshot.load(out, [self.prop], self.config))
+
+
+if __name__ == '__main__':
+    unittest.main()
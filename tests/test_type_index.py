@@ -0,0 +1,103 @@
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+
+from algorithm import graph
+from utils import type_index
+from utils.dbpedia_access import DBpedia
+from web import builder
+
+ONT = 'http://dbpedia.org/ontology/'
+RES = 'http://dbpedia.org/resource/'
+
+DUMP = [
+    '<http://dbpedia.org/resource/a> <http://www.w3.org/1999/02/22-rdf-syntax-ns#type> <http://dbpedia.org/ontology/Athlete> .',
+    '<http://dbpedia.org/resource/a> <http://www.w3.org/1999/02/22-rdf-syntax-ns#type> <http://dbpedia.org/ontology/Person> .',
+    '<http://dbpedia.org/resource/a> <http://www.w3.org/1999/02/22-rdf-syntax-ns#type> <http://xmlns.com/foaf/0.1/Person> .',
+    '<http://dbpedia.org/resource/b> <http://www.w3.org/1999/02/22-rdf-syntax-ns#type> <http://dbpedia.org/ontology/Athlete> .',
+    '<http://dbpedia.org/resource/b> <http://www.w3.org/1999/02/22-rdf-syntax-ns#type> <http://dbpedia.org/ontology/Person> .',
+    '<http://dbpedia.org/resource/c> <http://www.w3.org/1999/02/22-rdf-syntax-ns#type> <http://dbpedia.org/ontology/Person> .',
+    '<http://dbpedia.org/resource/x> <http://www.w3.org/1999/02/22-rdf-syntax-ns#type> <http://dbpedia.org/ontology/Place> .',
+    '<http://dbpedia.org/ontology/Athlete> <http://www.w3.org/2000/01/rdf-schema#subClassOf> <http://dbpedia.org/ontology/Person> .',
+    '<http://dbpedia.org/ontology/Person> <http://www.w3.org/2000/01/rdf-schema#subClassOf> <http://dbpedia.org/ontology/Agent> .',
+]
+
+
+class TypeIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.dump = os.path.join(self.dir, 'types.nt')
+        with open(self.dump, 'w') as f:
+            f.write('\n'.join(DUMP) + '\n')
+        self.prop = graph.Property('http://dbpedia.org/ontology/height', dir=self.dir)
+        with open(self.prop.filename + '_subjects', 'w') as f:
+            for s in 'abc':
+                f.write('<' + RES + s + '> <http://dbpedia.org/ontology/height> "1.8" .\n')
+        self.filename = type_index.index_file(self.dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_build(self):
+        type_index.build(self.filename, [self.dump], [self.prop.filename])
+        index = type_index.TypeIndex.load(self.filename)
+        # restricted to the subjects of the local file
+        self.assertEqual([RES + 'a', RES + 'b', RES + 'c'], index.subjects)
+        # including the superclasses of the types
+        self.assertEqual(set([ONT + 'Athlete', ONT + 'Person', ONT + 'Agent']), index.types_of(RES + 'a'))
+        self.assertEqual(set(), index.types_of(RES + 'x'))
+        self.assertEqual(set([ONT + 'Person']), index.subclasses(ONT + 'Agent'))
+        self.assertEqual(set([ONT + 'Person', ONT + 'Athlete']), index.subclass_closure(ONT + 'Agent'))
+
+    def test_direct_types(self):
+        # only the most specific types (as instance_types_en), ?s a <type> in SPARQL includes subclass instances
+        direct = {'a': ['Athlete'], 'b': ['Athlete', 'Person'], 'c': ['Person'], 'x': ['Place']}
+        with open(self.dump, 'w') as f:
+            for x, types in sorted(direct.items()):
+                for t in types:
+                    f.write('<' + RES + x + '> <http://www.w3.org/1999/02/22-rdf-syntax-ns#type> <' + ONT + t + '> .\n')
+            f.write('\n'.join(DUMP[-2:]) + '\n')
+        index = type_index.build(self.filename, [self.dump])
+        view = index.view(set(RES + x for x in direct))
+        types = ['<' + ONT + t + '>' for t in ['Agent', 'Person', 'Athlete', 'Place']]
+        for t, subjects in view.get_subjects_by_predicate_types('<http://dbpedia.org/ontology/height>', types).items():
+            members = index.subclass_closure(t[1:-1]) | set([t[1:-1]])
+            expected = set(RES + x for x, direct_types in direct.items() if members & set(ONT + d for d in direct_types))
+            self.assertEqual(expected, subjects)
+        self.assertEqual(set(RES + x for x in 'abc'), view.get_subjects_by_predicate_types(None, types)[types[0]])
+
+    def test_type_hierarchy(self):
+        index = type_index.build(self.filename, [self.dump])
+        with open(self.prop.filename + '_common_types.pkl', 'w') as f:
+            pickle.dump([(ONT + 'Person', 3), (ONT + 'Athlete', 2), (ONT + 'Place', 1)], f)
+        g = graph.PropertyGraph(self.prop, set(RES + s for s in 'abc'), self.prop.filename, min_instances=1)
+        g.build_type_hierarchy(type_index=index)
+        self.assertEqual(['Person', 'Athlete'], [n.uri[len(ONT):] for n in g.nodes])
+        self.assertEqual([g.nodes[0]], g.roots)
+        self.assertEqual([g.nodes[1]], g.nodes[0].children)
+        self.assertEqual(2, g.nodes[1].instances)
+
+    def test_build_graph(self):
+        # the subjects are read from the local file, an offline DBpedia fails on any query
+        type_index.build(self.filename, [self.dump], [self.prop.filename])
+        with open(self.prop.filename + '_subjects', 'a') as f:
+            f.write('<' + RES + 'x> <http://dbpedia.org/ontology/weight> "80" .\n')
+        with open(self.prop.filename + '_common_types.pkl', 'w') as f:
+            pickle.dump([(ONT + 'Person', 3), (ONT + 'Athlete', 2)], f)
+        config = {
+            'graph-setup': {'nodes': {'min': 1, 'max': 5}, 'normalize-dist': True, 'dist-function': 'kolmogorov_dist'},
+            'local-files': self.dir
+        }
+        self.assertEqual(set(RES + s for s in 'abc'), type_index.local_subjects(self.prop))
+        dbp = DBpedia(cache=os.path.join(self.dir, 'cache'), offline=True)
+        try:
+            g = builder.build_graph(self.prop, config, dbp=dbp)
+        finally:
+            builder._TYPE_INDEX.pop(self.dir, None)
+        self.assertEqual(['Person', 'Athlete'], [n.uri[len(ONT):] for n in g.nodes])
+
+
+if __name__ == '__main__':
+    unittest.main()
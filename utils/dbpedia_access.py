@@ -1,15 +1,65 @@
 from collections import defaultdict
 import logging
-from time import sleep
-from SPARQLWrapper import SPARQLWrapper, JSON
+import os
 import operator
 
+from utils.sparql_cache import SparqlCache, cache_key
+from utils.sparql_client import shared_client
+
+ENDPOINT = "http://dbpedia.org/sparql"
+
+# defaults of new DBpedia instances, see configure()
+SETTINGS = {
+    'endpoint': ENDPOINT,
+    'cache': None,
+    'max-cache-size': None,
+    'offline': False,
+    'fixtures': None,
+    # concurrent page requests and retries (exponential backoff, seconds) per failed page
+    'workers': 4,
+    'retries': 10,
+    'backoff': 1.,
+    'timeout': 500,
+    # number of terms in the VALUES block of batched queries
+    'values-batch': 50
+}
+
+
+def _environment():
+    # the environment (e.g. DBPEDIA_OFFLINE=1 for test runs) overrides the config file
+    env = {}
+    if os.environ.get('DBPEDIA_CACHE'):
+        env['cache'] = os.environ['DBPEDIA_CACHE']
+    if os.environ.get('DBPEDIA_FIXTURES'):
+        env['fixtures'] = os.environ['DBPEDIA_FIXTURES']
+    if os.environ.get('DBPEDIA_OFFLINE'):
+        env['offline'] = os.environ['DBPEDIA_OFFLINE'] != '0'
+    return env
+
+
+def configure(config):
+    # apply the 'dbpedia' section of the config file
+    SETTINGS.update(config.get('dbpedia') or {})
+    SETTINGS.update(_environment())
+
+
+SETTINGS.update(_environment())
+
+
+class OfflineError(Exception):
+    pass
+
 
 class DBpedia(object):
-    def __init__(self):
-        self.sparql = SPARQLWrapper("http://dbpedia.org/sparql")
-        self.sparql.setTimeout(500)
-        self.sparql.setReturnFormat(JSON)
+    def __init__(self, endpoint=None, cache=None, max_cache_size=None, offline=None, fixtures=None, client=None):
+        self.endpoint = endpoint or SETTINGS['endpoint']
+        self.offline = SETTINGS['offline'] if offline is None else offline
+        self.cache = SparqlCache(cache or SETTINGS['cache'],
+                                 max_size=max_cache_size or SETTINGS['max-cache-size'],
+                                 fixtures=fixtures or SETTINGS['fixtures'])
+        self.client = client or shared_client(self.endpoint, workers=SETTINGS['workers'],
+                                              retries=SETTINGS['retries'], backoff=SETTINGS['backoff'],
+                                              timeout=SETTINGS['timeout'])
 
     def get_predicates(self):
         query = u" SELECT DISTINCT ?p WHERE {" \
@@ -74,6 +124,19 @@ class DBpedia(object):
                 u" }}".format(s)
         return set([x[0] for x in self._retrieve(query, ['t'])])
 
+    def get_subclasses_of_types(self, types):
+        # batched get_subclasses: {type: set of subclasses}
+        res = dict((t, set()) for t in types)
+        for batch in self._batches(types):
+            query = u"SELECT ?c ?t" \
+                    u" WHERE {{" \
+                    u" VALUES ?c {{ {0} }}" \
+                    u" ?t rdfs:subClassOf ?c" \
+                    u" }}".format(u' '.join(batch))
+            for c, t in self._retrieve(query, ['c', 't']):
+                res[u'<' + c + u'>'].add(t)
+        return res
+
     def get_subjects_by_predicate(self, p):
         query = u"SELECT ?s" \
                 u" WHERE {{" \
@@ -89,6 +152,20 @@ class DBpedia(object):
                 u" }}".format(t, p)
         return set([x[0] for x in self._retrieve(query, ['s'])])
 
+    def get_subjects_by_predicate_types(self, p, types):
+        # batched get_subjects_by_predicate_type: {type: set of subjects}
+        res = dict((t, set()) for t in types)
+        for batch in self._batches(types):
+            query = u"SELECT ?t ?s" \
+                    u" WHERE {{" \
+                    u" VALUES ?t {{ {0} }}" \
+                    u" ?s a ?t." \
+                    u" ?s {1} ?o" \
+                    u" }}".format(u' '.join(batch), p)
+            for t, s in self._retrieve(query, ['t', 's']):
+                res[u'<' + t + u'>'].add(s)
+        return res
+
     def get_subjects_by_predicate_object_type(self, p, o, t):
         query = u"SELECT ?s" \
                 u" WHERE {{" \
@@ -105,41 +182,45 @@ class DBpedia(object):
         query += u"}"
         return self._retrieve(query, ['p', 'o'])
 
-    def _retrieve(self, query, params, limit=5000, filter=None, retries=10):
-        try:
-            logging.debug('DBpedia query: ' + query)
-            res = []
-            offset = 0
-            has_next = True
-            while has_next:
-                q = query + u" LIMIT {1} OFFSET {2}".format(property, limit, offset)
-
-                self.sparql.setQuery(q)
-                resp = self.sparql.query().convert()
-                results = resp["results"]["bindings"]
-
+    def _batches(self, terms):
+        terms = list(terms)
+        size = SETTINGS['values-batch']
+        return [terms[i:i + size] for i in range(0, len(terms), size)]
+
+    def _retrieve(self, query, params, limit=5000, filter=None):
+        return list(self.rows(query, params, limit, filter))
+
+    def rows(self, query, params, limit=5000, filter=None):
+        # generator of the result rows. the first page is requested alone (most queries have a single page),
+        # further pages are requested concurrently, a window of one page per worker at a time
+        logging.debug('DBpedia query: ' + query)
+        kept = 0
+        offset = 0
+        pages = iter([self._page(query, limit, 0)])
+        while True:
+            for results in pages:
                 for result in results:
                     tup = [result[p]["value"] for p in params]
-                    if filter:
-                        if all([f(t) for t, f in zip(tup, filter)]):
-                            res.append(tup)
-                    else:
-                        res.append(tup)
-
+                    if not filter or all([f(t) for t, f in zip(tup, filter)]):
+                        kept += 1
+                        yield tup
                 offset += limit
-
-                if len(res) < offset:
-                    has_next = False
-
+                # stop at the first incomplete page (or at filtered rows, the results are ordered)
+                if kept < offset:
+                    return
                 if offset % 10000 == 0:
                     logging.debug('DBPedia results retrieved: ' + str(offset))
-
-            return res
-        except Exception as e:
-            if retries > 0:
-                logging.warning('DBpedia connection lost: ' + str(e) + '. Try again...(' + str(retries) + ')')
-                sleep(20)
-                return self._retrieve(query, params, limit, filter, retries - 1)
-            logging.warning('DBpedia connection error: ' + str(e))
-            raise e
-
+            window = [offset + i * limit for i in range(self.client.workers)]
+            pages = self.client.imap(lambda o: self._page(query, limit, o), window)
+
+    def _page(self, query, limit, offset):
+        key = cache_key(self.endpoint, query, limit, offset)
+        results = self.cache.get(key)
+        if results is not None:
+            return results
+        if self.offline:
+            raise OfflineError('Query not cached (offline mode): ' + query + u" LIMIT {0} OFFSET {1}".format(limit, offset))
+
+        results = self.client.select(query + u" LIMIT {0} OFFSET {1}".format(limit, offset))
+        self.cache.put(key, results)
+        return results
@@ -0,0 +1,270 @@
+import errno
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# latency buckets (seconds) and count buckets (e.g. nodes per query)
+TIME_BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1., 2.5, 5., 10., 30., 60., 300.)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+# registered metrics by name, in order of registration
+REGISTRY = {}
+_ORDER = []
+_LOCK = threading.Lock()
+# interval (seconds) for writing the metrics of a worker process to the shared directory
+DUMP_SECONDS = 1.
+
+
+def _register(cls, name, documentation, labels, **kwargs):
+    # metrics are module level objects: the same name returns the same metric (e.g. on reload)
+    with _LOCK:
+        if name not in REGISTRY:
+            REGISTRY[name] = cls(name, documentation, labels, **kwargs)
+            _ORDER.append(name)
+        return REGISTRY[name]
+
+
+def counter(name, documentation, labels=()):
+    return _register(Counter, name, documentation, labels)
+
+
+def gauge(name, documentation, labels=()):
+    return _register(Gauge, name, documentation, labels)
+
+
+def histogram(name, documentation, labels=(), buckets=TIME_BUCKETS):
+    return _register(Histogram, name, documentation, labels, buckets=buckets)
+
+
+def _escape(value):
+    return unicode(value).replace(u'\\', u'\\\\').replace(u'\n', u'\\n').replace(u'"', u'\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return u''
+    return u'{' + u','.join(n + u'="' + _escape(v) + u'"' for n, v in pairs) + u'}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return u'+Inf'
+    return repr(float(value)) if isinstance(value, float) else unicode(value)
+
+
+class Metric(object):
+    type = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(labels.get(l, '') for l in self.labels)
+
+    def clear(self):
+        with self.lock:
+            self.values.clear()
+
+    def state(self):
+        # json-serializable values: [[label values, value], ...]
+        with self.lock:
+            return [[list(key), value] for key, value in self.values.items()]
+
+    def merge(self, values):
+        # add the values of another process
+        with self.lock:
+            for key, value in values:
+                key = tuple(key)
+                self.values[key] = self.values.get(key, 0) + value
+
+    def samples(self):
+        # (suffix, label values, extra labels, value)
+        with self.lock:
+            return [('', key, (), value) for key, value in sorted(self.values.items())]
+
+    def exposition(self):
+        lines = [u'# HELP ' + self.name + u' ' + self.documentation, u'# TYPE ' + self.name + u' ' + self.type]
+        for suffix, key, extra, value in self.samples():
+            lines.append(self.name + suffix + _format_labels(self.labels, key, extra) + u' ' + _format_value(value))
+        return lines
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels):
+        return self.values.get(self._key(labels), 0)
+
+
+class Gauge(Counter):
+    type = 'gauge'
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=TIME_BUCKETS):
+        Metric.__init__(self, name, documentation, labels)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            if key not in self.values:
+                # counts per bucket (not cumulative), sum
+                self.values[key] = [[0] * len(self.buckets), 0.]
+            entry = self.values[key]
+            for i, b in enumerate(self.buckets):
+                if value <= b:
+                    entry[0][i] += 1
+                    break
+            entry[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.observe(time.time() - start, **labels)
+
+    def merge(self, values):
+        with self.lock:
+            for key, (counts, total) in values:
+                key = tuple(key)
+                if key not in self.values:
+                    self.values[key] = [[0] * len(self.buckets), 0.]
+                entry = self.values[key]
+                entry[0] = [a + b for a, b in zip(entry[0], counts)]
+                entry[1] += total
+
+    def count(self, **labels):
+        entry = self.values.get(self._key(labels))
+        return sum(entry[0]) if entry else 0
+
+    def sum(self, **labels):
+        entry = self.values.get(self._key(labels))
+        return entry[1] if entry else 0.
+
+    def samples(self):
+        res = []
+        with self.lock:
+            for key, (counts, total) in sorted(self.values.items()):
+                cumulative = 0
+                for b, c in zip(self.buckets, counts):
+                    cumulative += c
+                    res.append(('_bucket', key, [('le', _format_value(b))], cumulative))
+                res.append(('_sum', key, (), total))
+                res.append(('_count', key, (), cumulative))
+        return res
+
+
+def exposition():
+    # all metrics in the Prometheus text format
+    lines = []
+    for name in list(_ORDER):
+        lines.extend(REGISTRY[name].exposition())
+    return u'\n'.join(lines) + u'\n'
+
+
+def clear():
+    for metric in REGISTRY.values():
+        metric.clear()
+
+
+def save(filename, kinds=('counter', 'gauge', 'histogram')):
+    # the values of the metrics of the given types, written atomically for the readers of other processes
+    with _LOCK:
+        names = list(_ORDER)
+    data = dict((name, REGISTRY[name].state()) for name in names if REGISTRY[name].type in kinds)
+    tmp = filename + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(data, f)
+    os.rename(tmp, filename)
+
+
+def reset_counts():
+    # a forked worker starts counting at zero, the counts of the parent are saved by the parent (gauges are kept)
+    for metric in REGISTRY.values():
+        if metric.type != 'gauge':
+            metric.clear()
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno == errno.EPERM
+    return True
+
+
+def start_dump(directory, update=None):
+    # write the metrics of this process to <directory>/<pid>.json every DUMP_SECONDS,
+    # update() sets the gauges which are computed on demand
+    filename = os.path.join(directory, str(os.getpid()) + '.json')
+
+    def dump():
+        while True:
+            try:
+                if update:
+                    update()
+                save(filename)
+            except (IOError, OSError):
+                logging.exception('Failed to write metrics: ' + filename)
+            time.sleep(DUMP_SECONDS)
+
+    t = threading.Thread(target=dump, name='metrics')
+    t.daemon = True
+    t.start()
+    return t
+
+
+def merged_exposition(directory):
+    # metrics of all processes which write to the directory (see start_dump), the current values of this process.
+    # counters and histograms are summed over the processes, including exited workers (the totals do not drop
+    # when a worker is restarted), gauges are reported per live process with a worker label
+    own = str(os.getpid())
+    states = [(own, dict((name, REGISTRY[name].state()) for name in list(_ORDER)))]
+    for name in sorted(os.listdir(directory)):
+        pid, ext = os.path.splitext(name)
+        if ext != '.json' or pid == own:
+            continue
+        try:
+            with open(os.path.join(directory, name)) as f:
+                states.append((pid, json.load(f)))
+        except (IOError, ValueError):
+            # removed or being replaced
+            continue
+    lines = []
+    for name in list(_ORDER):
+        metric = REGISTRY[name]
+        if metric.type == 'gauge':
+            merged = Gauge(metric.name, metric.documentation, metric.labels + ('worker',))
+            for pid, state in states:
+                if pid == own or _alive(int(pid)):
+                    merged.merge([[key + [pid], value] for key, value in state.get(name, ())])
+        else:
+            merged = metric.__class__(metric.name, metric.documentation, metric.labels)
+            if metric.type == 'histogram':
+                merged.buckets = metric.buckets
+            for pid, state in states:
+                merged.merge(state.get(name, ()))
+        lines.extend(merged.exposition())
+    return u'\n'.join(lines) + u'\n'
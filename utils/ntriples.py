@@ -0,0 +1,168 @@
+import bz2
+import gc
+import glob
+import gzip
+import logging
+import os
+import tarfile
+import time
+
+from utils import metrics
+
+CHUNK_SIZE = 1 << 24
+# split archive of the local subjects files, see README
+ARCHIVE = 'subjects.tar.gz.*'
+
+TRIPLES = metrics.counter('labelling_triples_scanned_total', 'Triples read from local files and dumps')
+SCAN_SECONDS = metrics.histogram('labelling_scan_seconds', 'Duration of a pass over a local file or dump')
+
+
+class _Concatenated(object):
+    # read several files as one stream (split archives)
+    def __init__(self, filenames):
+        self.filenames = list(filenames)
+        self.f = None
+
+    def read(self, size=-1):
+        res = []
+        while self.filenames or self.f:
+            if not self.f:
+                self.f = open(self.filenames.pop(0), 'rb')
+            data = self.f.read(size) if size >= 0 else self.f.read()
+            if data:
+                res.append(data)
+                if size >= 0:
+                    size -= len(data)
+                    if size <= 0:
+                        break
+            else:
+                self.f.close()
+                self.f = None
+        return ''.join(res)
+
+    def close(self):
+        if self.f:
+            self.f.close()
+        self.f = None
+        self.filenames = []
+
+
+def _archive_parts(filename):
+    return sorted(glob.glob(os.path.join(os.path.dirname(filename), ARCHIVE)))
+
+
+def source_files(filename):
+    # files which contain the triples of a local <prop>_subjects file
+    for f in [filename + '_subjects', filename + '_subjects.gz']:
+        if os.path.exists(f):
+            return [f]
+    return _archive_parts(filename)
+
+
+class TripleFile(object):
+    # file-like access to the <prop>_subjects triples: plain, gzip or member of the split subjects archive
+    def __init__(self, filename):
+        self.name = filename + '_subjects'
+        self.archive = None
+        if os.path.exists(self.name):
+            self.f = open(self.name, 'rb')
+        elif os.path.exists(self.name + '.gz'):
+            self.f = gzip.open(self.name + '.gz', 'rb')
+        else:
+            parts = _archive_parts(filename)
+            if not parts:
+                raise IOError('No such file or archive: ' + self.name)
+            self.archive = tarfile.open(fileobj=_Concatenated(parts), mode='r|gz')
+            self.f = None
+            member = os.path.basename(self.name)
+            for m in self.archive:
+                if os.path.basename(m.name) == member:
+                    self.f = self.archive.extractfile(m)
+                    break
+            if self.f is None:
+                self.archive.close()
+                raise IOError('No ' + member + ' in archive: ' + ', '.join(parts))
+
+    def read(self, size):
+        return self.f.read(size)
+
+    def close(self):
+        self.f.close()
+        if self.archive:
+            self.archive.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def read_triples(filename, chunk_size=CHUNK_SIZE):
+    # yields lists of triples, one list per chunk of the file: the first three fields of each
+    # triple are the subject, predicate and object byte strings
+    with TripleFile(filename) as f:
+        for triples in _chunks(f, chunk_size):
+            yield triples
+
+
+def read_file(path, chunk_size=CHUNK_SIZE):
+    # as read_triples, for any plain, gzip or bzip2 N-Triples file (e.g. DBpedia dumps)
+    if path.endswith('.gz'):
+        f = gzip.open(path, 'rb')
+    elif path.endswith('.bz2'):
+        f = bz2.BZ2File(path, 'rb')
+    else:
+        f = open(path, 'rb')
+    try:
+        for triples in _chunks(f, chunk_size):
+            yield triples
+    finally:
+        f.close()
+
+
+def _chunks(f, chunk_size):
+    rest = ''
+    while True:
+        data = f.read(chunk_size)
+        if not data:
+            break
+        lines = (rest + data).split('\n')
+        rest = lines.pop()
+        yield _split(lines)
+    if rest:
+        yield _split([rest])
+
+
+def _split(lines):
+    triples = [l.split(' ', 3) for l in lines]
+    return [x for x in triples if len(x) > 2]
+
+
+def scan(filename, consumers, chunk_size=CHUNK_SIZE, reader=read_triples):
+    # single pass over the triples of a local file, each chunk is handed to all consumers
+    name = filename + '_subjects' if reader == read_triples else filename
+    logging.debug('Scan triples [' + name + ']')
+    start = time.time()
+    c = 0
+    # the scan allocates millions of small objects without reference cycles,
+    # the garbage collector would repeatedly traverse all of them
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for triples in reader(filename, chunk_size):
+            for consumer in consumers:
+                consumer.add(triples)
+            c += len(triples)
+            TRIPLES.inc(len(triples))
+            logging.debug('triples processed: ' + str(c)[:-3] + 'k')
+        for consumer in consumers:
+            consumer.finish()
+    finally:
+        if gc_enabled:
+            gc.enable()
+    duration = time.time() - start
+    SCAN_SECONDS.observe(duration)
+    logging.info('Scanned ' + str(c) + ' triples [' + name + '] in ' + str(round(duration, 1)) + 's (' +
+                 str(int(c / duration if duration else c)) + ' triples/sec)')
+    return c, duration
@@ -0,0 +1,302 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+
+import numpy as np
+
+from algorithm import graph
+from algorithm.node_store import NodeStore
+from utils import ntriples, type_index
+
+SCHEMA_VERSION = 2
+MANIFEST = 'manifest.json'
+
+NODE_TYPES = [graph.TypeNode, graph.SharedPairs, graph.Rest, graph.TestData]
+
+
+def file_sha1(filename, chunk_size=1 << 20):
+    h = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _file_info(filename, sha1=True):
+    if not os.path.exists(filename):
+        return None
+    st = os.stat(filename)
+    info = {'size': st.st_size, 'mtime': st.st_mtime}
+    if sha1:
+        info['sha1'] = file_sha1(filename)
+    return info
+
+
+def input_files(prop):
+    # local files which are used for building the graph of a property
+    files = ntriples.source_files(prop.filename) + [prop.filename + '_common_types.pkl']
+    index = type_index.index_file(os.path.dirname(prop.filename))
+    if os.path.exists(index):
+        files.append(index)
+    return files
+
+
+def build_inputs(prop, config):
+    return {
+        'graph-setup': config['graph-setup'],
+        'files': dict((f, _file_info(f)) for f in input_files(prop))
+    }
+
+
+def _file_changed(filename, info):
+    current = _file_info(filename, sha1=False)
+    if current is None or info is None:
+        return current != info
+    if current['size'] != info['size']:
+        return True
+    if current['mtime'] == info['mtime']:
+        return False
+    # touched, check the content
+    return file_sha1(filename) != info['sha1']
+
+
+def is_stale(entry, prop, config):
+    inputs = entry['inputs']
+    if json.loads(json.dumps(config['graph-setup'])) != inputs['graph-setup']:
+        return True
+    files = inputs['files']
+    if sorted(files.keys()) != sorted(input_files(prop)):
+        return True
+    return any(_file_changed(f, files[f]) for f in files)
+
+
+def read_manifest(directory):
+    filename = os.path.join(directory, MANIFEST)
+    if not os.path.exists(filename):
+        return None
+    with open(filename, 'r') as f:
+        manifest = json.load(f)
+    if manifest.get('schema') != SCHEMA_VERSION:
+        logging.warning('Snapshot schema version ' + str(manifest.get('schema')) + ' not supported (expected ' +
+                        str(SCHEMA_VERSION) + '): ' + directory)
+        return None
+    return manifest
+
+
+def _write_manifest(directory, manifest):
+    filename = os.path.join(directory, MANIFEST)
+    with open(filename + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.rename(filename + '.tmp', filename)
+
+
+def save(directory, graphs, config):
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    manifest = read_manifest(directory) or {'schema': SCHEMA_VERSION, 'graphs': {}}
+    manifest['properties'] = {
+        'file': config['properties'],
+        'sha1': file_sha1(config['properties'])
+    }
+    for p in graphs:
+        logging.info('Store snapshot of property graph: ' + p.name)
+        built = time.time()
+        # new files for each build: graphs which are served from the previous files (memory-mapped or loaded
+        # on demand) keep reading consistent files, see remove_superseded
+        entry = save_graph(directory, graphs[p], version=str(int(built * 1e6)))
+        entry['inputs'] = build_inputs(p, config)
+        entry['built'] = built
+        manifest['graphs'][p.name] = entry
+    _write_manifest(directory, manifest)
+
+
+def _graph_files(entry):
+    return [entry[x] for x in ['graph', 'values', 'keys', 'unique']]
+
+
+def remove_superseded(directory, prop, keep):
+    # remove the files of earlier builds of the graph of a property, except the files of the entries in keep
+    keep = set(f for entry in keep for f in _graph_files(entry))
+    pattern = re.compile(re.escape(prop.name) + r'-\d+(\.npz|_values\.npy|_keys\.npy|_unique\.npy)$')
+    for name in os.listdir(directory):
+        if pattern.match(name) and name not in keep:
+            logging.info('Remove superseded snapshot file: ' + name)
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass
+
+
+def _replace(filename, write):
+    # write to a temporary file and rename: processes which have memory-mapped the old file keep reading it
+    with open(filename + '.tmp', 'wb') as f:
+        write(f)
+    os.rename(filename + '.tmp', filename)
+
+
+def save_graph(directory, g, version=None):
+    nodes = g.nodes
+    ids = dict((id(n), i) for i, n in enumerate(nodes))
+    store_ids = dict((id(n), i) for i, n in enumerate(g.store.nodes))
+
+    strings = {}
+
+    def _string_id(x):
+        if x not in strings:
+            strings[x] = len(strings)
+        return strings[x]
+
+    kinds = np.zeros(len(nodes), dtype=np.int8)
+    parents = np.full(len(nodes), -1, dtype=np.int32)
+    uris = np.zeros(len(nodes), dtype=np.int32)
+    pairs = np.full((len(nodes), 2), -1, dtype=np.int32)
+    weights = np.zeros(len(nodes), dtype=np.float64)
+    instances = np.zeros(len(nodes), dtype=np.int64)
+    mins = np.full(len(nodes), np.nan, dtype=np.float64)
+    maxs = np.full(len(nodes), np.nan, dtype=np.float64)
+    in_store = np.full(len(nodes), -1, dtype=np.int64)
+    children_indptr = np.zeros(len(nodes) + 1, dtype=np.int64)
+    children = []
+    for i, n in enumerate(nodes):
+        kinds[i] = NODE_TYPES.index(type(n))
+        if n.parent is not None:
+            parents[i] = ids[id(n.parent)]
+        uris[i] = _string_id(n.uri)
+        if hasattr(n, 'predicate_object'):
+            pairs[i] = [_string_id(x) for x in n.predicate_object]
+        weights[i] = n.weight
+        instances[i] = n.instances
+        if hasattr(n, 'min'):
+            mins[i] = n.min
+            maxs[i] = n.max
+        in_store[i] = store_ids.get(id(n), -1)
+        children.extend(ids[id(c)] for c in n.children)
+        children_indptr[i + 1] = len(children)
+
+    table = [None] * len(strings)
+    for x, i in strings.items():
+        table[i] = x
+
+    name = g.prop.name + ('-' + version if version else '')
+    graph_file = name + '.npz'
+    # the arrays of the node store are stored as .npy files, they can be memory-mapped
+    values_file = name + '_values.npy'
+    keys_file = name + '_keys.npy'
+    unique_file = name + '_unique.npy'
+    _replace(os.path.join(directory, values_file), lambda f: np.save(f, g.store.values))
+    _replace(os.path.join(directory, keys_file), lambda f: np.save(f, g.store.keys))
+    _replace(os.path.join(directory, unique_file), lambda f: np.save(f, g.store.unique))
+    _replace(os.path.join(directory, graph_file), lambda f: np.savez(
+        f, strings=np.array(table, dtype=np.unicode_), kinds=kinds, parents=parents, uris=uris, pairs=pairs,
+        weights=weights, instances=instances, mins=mins, maxs=maxs, in_store=in_store,
+        children_indptr=children_indptr, children=np.array(children, dtype=np.int32),
+        offsets=g.store.offsets, counts=g.store.counts))
+    return {
+        'prop': g.prop.prop,
+        'graph': graph_file,
+        'values': values_file,
+        'keys': keys_file,
+        'unique': unique_file,
+        'nodes': len(nodes),
+        'values-count': len(g.store.values),
+        'values-total': int(g.store.counts.sum()),
+        'values-bytes': int(g.store.nbytes)
+    }
+
+
+def entries(directory, props, config):
+    # manifest entries of the properties with an up-to-date snapshot
+    manifest = read_manifest(directory)
+    res = {}
+    if not manifest:
+        return res
+    if manifest['properties']['sha1'] != file_sha1(config['properties']):
+        logging.info('Properties file changed since snapshot was built: ' + config['properties'])
+    for p in props:
+        entry = manifest['graphs'].get(p.name)
+        if not entry:
+            logging.info('No snapshot for property: ' + p.name)
+        elif is_stale(entry, p, config):
+            logging.warning('Snapshot of property ' + p.name + ' is stale')
+        else:
+            res[p] = entry
+    return res
+
+
+def load(directory, props, config, mmap=False):
+    # graphs of all properties with an up-to-date snapshot. with mmap the arrays of the node stores
+    # are memory-mapped read-only (shared by all processes which serve the snapshot)
+    graphs = {}
+    for p, entry in entries(directory, props, config).items():
+        logging.info('Load property graph from snapshot: ' + p.name)
+        graphs[p] = load_graph(directory, entry, p, config, mmap=mmap)
+    return graphs
+
+
+def node_ranges(directory, entry):
+    # [min, max] of the nodes of the node store of a graph (in store order), without loading the graph
+    data = np.load(os.path.join(directory, entry['graph']), allow_pickle=False)
+    in_store = data['in_store']
+    ids = np.flatnonzero(in_store >= 0)[np.argsort(in_store[in_store >= 0])]
+    return data['mins'][ids], data['maxs'][ids]
+
+
+def load_graph(directory, entry, prop, config, mmap=False):
+    data = np.load(os.path.join(directory, entry['graph']), allow_pickle=False)
+    mode = 'r' if mmap else None
+    values, keys, unique = [np.load(os.path.join(directory, entry[x]), mmap_mode=mode, allow_pickle=False)
+                            for x in ['values', 'keys', 'unique']]
+    strings = data['strings'].tolist()
+    kinds = data['kinds']
+    uris = data['uris']
+    weights = data['weights']
+    instances = data['instances']
+    parents = data['parents']
+    pairs = data['pairs']
+    mins = data['mins']
+    maxs = data['maxs']
+    in_store = data['in_store']
+    children_indptr = data['children_indptr']
+    children = data['children']
+
+    g = graph.PropertyGraph(prop, None, prop.filename, min_instances=config['graph-setup']['nodes']['min'])
+    for i in range(len(kinds)):
+        cls = NODE_TYPES[kinds[i]]
+        uri = strings[uris[i]]
+        if cls in (graph.SharedPairs, graph.Rest):
+            n = cls(uri, None, prop, tuple(strings[x] for x in pairs[i]))
+        else:
+            n = cls(uri, None, prop)
+        n.weight = float(weights[i])
+        n.stored_instances = int(instances[i])
+        n.values = []
+        if not np.isnan(mins[i]):
+            n.min = float(mins[i])
+            n.max = float(maxs[i])
+        g.nodes.append(n)
+
+    for i, n in enumerate(g.nodes):
+        if parents[i] >= 0:
+            n.parent = g.nodes[parents[i]]
+        else:
+            g.roots.append(n)
+        n.children = [g.nodes[c] for c in children[children_indptr[i]:children_indptr[i + 1]]]
+        if not n.children:
+            g.leaves.append(n)
+
+    order = np.argsort(in_store[in_store >= 0])
+    store_nodes = [g.nodes[i] for i in np.flatnonzero(in_store >= 0)[order]]
+    # number of values before sampling (snapshots without counts are not sampled)
+    counts = data['counts'] if 'counts' in data else None
+    g.store = NodeStore(store_nodes, values=values, offsets=data['offsets'], keys=keys, unique=unique, counts=counts)
+    for i, n in enumerate(g.store.nodes):
+        n.values = g.store.node_values(i)
+        n.count = int(g.store.counts[i])
+    g.report_values()
+    return g
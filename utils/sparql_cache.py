@@ -0,0 +1,111 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+
+MB = 1024 ** 2
+
+
+def normalize_query(query):
+    return u' '.join(query.split())
+
+
+def cache_key(endpoint, query, limit, offset):
+    # content address of one result page
+    text = u'\n'.join([endpoint, normalize_query(query), u'LIMIT ' + str(limit), u'OFFSET ' + str(offset)])
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+class SparqlCache(object):
+    # on-disk cache of SPARQL result pages, one <key>.json file per page.
+    # the least recently used pages are evicted if the cache grows beyond max_size (MB).
+    # fixtures is a read-only directory with pages in the same format (e.g. a copy of a cache directory)
+    def __init__(self, directory=None, max_size=None, fixtures=None):
+        self.directory = directory
+        self.max_size = max_size * MB if max_size else None
+        self.fixtures = fixtures
+        self.size = None
+        # pages are stored by the threads which fetch them concurrently
+        self.lock = threading.Lock()
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+    def _path(self, directory, key):
+        return os.path.join(directory, key + '.json')
+
+    def get(self, key):
+        for d in [self.directory, self.fixtures]:
+            if not d:
+                continue
+            path = self._path(d, key)
+            try:
+                with open(path, 'rb') as f:
+                    rows = json.load(f)
+            except (IOError, OSError, ValueError):
+                continue
+            if d == self.directory:
+                # mark as recently used
+                try:
+                    os.utime(path, None)
+                except OSError:
+                    pass
+            return rows
+        return None
+
+    def put(self, key, rows):
+        if not self.directory:
+            return
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            json.dump(rows, f)
+        path = self._path(self.directory, key)
+        if not self.max_size:
+            os.rename(tmp, path)
+            return
+        with self.lock:
+            # a replaced page is not counted twice
+            old = os.path.getsize(path) if os.path.exists(path) else 0
+            os.rename(tmp, path)
+            if self.size is None:
+                self.size = self._total_size()
+            else:
+                self.size += os.path.getsize(path) - old
+            if self.size > self.max_size:
+                self._evict()
+
+    def _files(self):
+        files = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.json'):
+                path = os.path.join(self.directory, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                files.append((st.st_mtime, st.st_size, path))
+        return files
+
+    def _total_size(self):
+        return sum(size for _, size, _ in self._files())
+
+    def evict(self):
+        with self.lock:
+            self._evict()
+
+    def _evict(self):
+        # remove the least recently used pages until the cache fits into max_size
+        files = sorted(self._files())
+        self.size = sum(size for _, size, _ in files)
+        removed = 0
+        for _, size, path in files:
+            if self.size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self.size -= size
+            removed += 1
+        logging.debug('SPARQL cache: evicted ' + str(removed) + ' pages')
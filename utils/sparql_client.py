@@ -0,0 +1,130 @@
+import httplib
+import json
+import logging
+import os
+import random
+import socket
+import threading
+import time
+import urllib
+import urlparse
+import Queue
+from multiprocessing.pool import ThreadPool
+
+RESULTS_FORMAT = 'application/sparql-results+json'
+
+
+class HTTPError(Exception):
+    def __init__(self, status, reason):
+        Exception.__init__(self, 'HTTP ' + str(status) + ' ' + str(reason))
+        self.status = status
+
+
+def retryable(e):
+    # connection errors, server errors and rate limits
+    if isinstance(e, HTTPError):
+        return e.status >= 500 or e.status == 429
+    return True
+
+
+class ConnectionPool(object):
+    # keep-alive connections to the host of an endpoint, shared by the threads of a process
+    def __init__(self, url, size, timeout):
+        u = urlparse.urlsplit(url)
+        self.cls = httplib.HTTPSConnection if u.scheme == 'https' else httplib.HTTPConnection
+        self.host = u.netloc
+        self.path = u.path or '/'
+        if u.query:
+            self.path += '?' + u.query
+        self.timeout = timeout
+        self.idle = Queue.LifoQueue(size)
+
+    def post(self, body, headers):
+        try:
+            conn = self.idle.get_nowait()
+            reused = True
+        except Queue.Empty:
+            conn = self.cls(self.host, timeout=self.timeout)
+            reused = False
+        try:
+            conn.request('POST', self.path, body, headers)
+            resp = conn.getresponse()
+            data = resp.read()
+        except (httplib.HTTPException, socket.error):
+            conn.close()
+            if reused:
+                # the server closed the idle connection, try again with a new one
+                return self.post(body, headers)
+            raise
+        if resp.status != 200:
+            conn.close()
+            raise HTTPError(resp.status, resp.reason)
+        try:
+            self.idle.put_nowait(conn)
+        except Queue.Full:
+            conn.close()
+        return data
+
+
+class SparqlClient(object):
+    # SELECT queries over a pool of keep-alive connections. failed requests are retried
+    # with exponential backoff and jitter; pages of a query are fetched by a bounded thread pool
+    def __init__(self, endpoint, workers=4, retries=10, backoff=1., max_backoff=60., timeout=500):
+        self.endpoint = endpoint
+        self.workers = max(int(workers), 1)
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def _init_pools(self):
+        # pools are created per process (threads and sockets do not survive a fork)
+        with self._lock:
+            if self._pid != os.getpid():
+                self._connections = ConnectionPool(self.endpoint, self.workers, self.timeout)
+                self._threads = ThreadPool(self.workers)
+                self._pid = os.getpid()
+
+    def delay(self, attempt):
+        # full jitter: uniform in [0, min(max_backoff, backoff * 2^attempt)]
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def select(self, query):
+        # result bindings of a query
+        self._init_pools()
+        body = urllib.urlencode({'query': query.encode('utf-8'), 'format': RESULTS_FORMAT})
+        headers = {'Content-Type': 'application/x-www-form-urlencoded', 'Accept': RESULTS_FORMAT}
+        attempt = 0
+        while True:
+            try:
+                data = self._connections.post(body, headers)
+            except (HTTPError, httplib.HTTPException, socket.error) as e:
+                # client errors (malformed query, not found) fail the same way again
+                if not retryable(e) or attempt >= self.retries:
+                    logging.warning('SPARQL request failed: ' + str(e))
+                    raise
+                d = self.delay(attempt)
+                attempt += 1
+                logging.warning('SPARQL request failed: ' + str(e) + '. Retry in ' + str(round(d, 1)) + 's (' +
+                                str(attempt) + '/' + str(self.retries) + ')')
+                time.sleep(d)
+                continue
+            return json.loads(data)['results']['bindings']
+
+    def imap(self, fn, items):
+        # apply fn to the items in the thread pool, results in order of the items
+        self._init_pools()
+        return self._threads.imap(fn, items)
+
+
+_CLIENTS = {}
+
+
+def shared_client(endpoint, **kwargs):
+    # one client (connections and threads) per endpoint and settings
+    key = (endpoint,) + tuple(sorted(kwargs.items()))
+    if key not in _CLIENTS:
+        _CLIENTS[key] = SparqlClient(endpoint, **kwargs)
+    return _CLIENTS[key]
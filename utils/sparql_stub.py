@@ -0,0 +1,77 @@
+import BaseHTTPServer
+import json
+import re
+import threading
+import urlparse
+from SocketServer import ThreadingMixIn
+
+from utils.sparql_cache import normalize_query
+
+PAGE = re.compile(r'\s+LIMIT\s+(\d+)\s+OFFSET\s+(\d+)\s*$', re.IGNORECASE)
+
+
+class _Server(ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self._answer(urlparse.urlsplit(self.path).query)
+
+    def do_POST(self):
+        self._answer(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+
+    def _answer(self, params):
+        query = urlparse.parse_qs(params).get('query', [''])[0].decode('utf-8')
+        status, rows = self.server.endpoint.answer(query)
+        body = json.dumps({'head': {}, 'results': {'bindings': rows}})
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/sparql-results+json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubEndpoint(object):
+    # local stand-in for a SPARQL endpoint (tests and benchmarks): answer(query) returns all result bindings
+    # of a query without LIMIT/OFFSET, which are paged by the stub. the first `failures` requests of each page
+    # fail with HTTP `status` (503 by default)
+    def __init__(self, answer, failures=0, status=503):
+        self.answer_fn = answer
+        self.failures = failures
+        self.status = status
+        self.requests = []
+        self._failed = {}
+        self._lock = threading.Lock()
+        self.server = _Server(('127.0.0.1', 0), _Handler)
+        self.server.endpoint = self
+        self.url = 'http://127.0.0.1:' + str(self.server.server_address[1]) + '/sparql'
+
+    def answer(self, query):
+        with self._lock:
+            self.requests.append(query)
+            key = normalize_query(query)
+            if self._failed.get(key, 0) < self.failures:
+                self._failed[key] = self._failed.get(key, 0) + 1
+                return self.status, []
+        m = PAGE.search(query)
+        rows = self.answer_fn(query[:m.start()] if m else query)
+        if m:
+            limit, offset = int(m.group(1)), int(m.group(2))
+            rows = rows[offset:offset + limit]
+        return 200, rows
+
+    def start(self):
+        t = threading.Thread(target=self.server.serve_forever)
+        t.daemon = True
+        t.start()
+        return self.url
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
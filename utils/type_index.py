@@ -0,0 +1,208 @@
+import logging
+import os
+from collections import defaultdict
+
+import numpy as np
+
+from algorithm.encoding import Dictionary
+from utils import ntriples
+
+RDF_TYPE = '<http://www.w3.org/1999/02/22-rdf-syntax-ns#type>'
+SUBCLASS_OF = '<http://www.w3.org/2000/01/rdf-schema#subClassOf>'
+ONTOLOGY = '<http://dbpedia.org/ontology/'
+FILENAME = 'type_index.npz'
+
+
+def index_file(directory):
+    return os.path.join(directory, FILENAME)
+
+
+def _pack(strings):
+    # utf-8 encoded strings in one byte buffer with offsets
+    encoded = [x.encode('utf-8') for x in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(x) for x in encoded])
+    return np.frombuffer(''.join(encoded), dtype=np.uint8), offsets
+
+
+def _unpack(data, offsets):
+    data = data.tostring()
+    return [data[offsets[i]:offsets[i + 1]].decode('utf-8') for i in range(len(offsets) - 1)]
+
+
+class TypeIndex(object):
+    # rdf:type memberships of subjects (DBpedia ontology types, including the superclasses of their types) and
+    # direct rdfs:subClassOf relations.
+    # types are stored as ids into the type table, the types of subject i are subject_types[indptr[i]:indptr[i + 1]].
+    # subjects is a sorted list of subject uris
+    def __init__(self, types, subjects, indptr, subject_types, subclass_edges):
+        self.types = list(types)
+        self.subjects = subjects
+        self.indptr = indptr
+        self.subject_types = subject_types
+        self.subclass_edges = subclass_edges
+        self._type_ids = dict((t, i) for i, t in enumerate(self.types))
+        self._subject_ids = None
+        self._subclasses = defaultdict(set)
+        for c, p in subclass_edges:
+            self._subclasses[p].add(c)
+
+    def __len__(self):
+        return len(self.subjects)
+
+    def _row(self, s):
+        if self._subject_ids is None:
+            self._subject_ids = dict((x, i) for i, x in enumerate(self.subjects))
+        return self._subject_ids.get(s)
+
+    def types_of(self, s):
+        i = self._row(s)
+        if i is None:
+            return set()
+        return set(self.types[t] for t in self.subject_types[self.indptr[i]:self.indptr[i + 1]])
+
+    def subclasses(self, t):
+        # direct subclasses
+        i = self._type_ids.get(t)
+        return set(self.types[c] for c in self._subclasses.get(i, ()))
+
+    def subclass_closure(self, t):
+        res = set()
+        todo = [t]
+        while todo:
+            for c in self.subclasses(todo.pop()):
+                if c not in res:
+                    res.add(c)
+                    todo.append(c)
+        return res
+
+    def view(self, subjects):
+        return TypeView(self, subjects)
+
+    def save(self, filename):
+        tmp = filename + '.tmp.npz'
+        types, type_offsets = _pack(self.types)
+        subjects, subject_offsets = _pack(self.subjects)
+        np.savez_compressed(tmp, types=types, type_offsets=type_offsets, subjects=subjects,
+                            subject_offsets=subject_offsets, indptr=self.indptr, subject_types=self.subject_types,
+                            subclass_edges=np.array(self.subclass_edges, dtype=np.int32).reshape(-1, 2))
+        os.rename(tmp, filename)
+
+    @classmethod
+    def load(cls, filename):
+        data = np.load(filename)
+        index = cls(_unpack(data['types'], data['type_offsets']), _unpack(data['subjects'], data['subject_offsets']),
+                    data['indptr'], data['subject_types'], data['subclass_edges'].tolist())
+        logging.info('Loaded type index: ' + str(len(index)) + ' subjects, ' + str(len(index.types)) + ' types')
+        return index
+
+
+class TypeView(object):
+    # DBpedia lookups of the type hierarchy, answered from the index for the subjects of a property graph
+    def __init__(self, index, subjects):
+        self.index = index
+        self.subjects = subjects
+
+    def get_subjects_by_predicate_types(self, p, types):
+        res = dict((t, set()) for t in types)
+        for s in self.subjects:
+            for t in self.index.types_of(s):
+                key = u'<' + t + u'>'
+                if key in res:
+                    res[key].add(s)
+        return res
+
+    def get_subclasses_of_types(self, types):
+        return dict((t, self.index.subclasses(t[1:-1])) for t in types)
+
+
+class IndexBuilder(object):
+    # ntriples consumer collecting the rdf:type and rdfs:subClassOf triples of dumps;
+    # subjects restricts the types to these subjects (e.g. the subjects of the local files)
+    def __init__(self, subjects=None):
+        self.subjects = subjects
+        self.types = Dictionary()
+        self.subject_types = defaultdict(set)
+        self.edges = set()
+
+    def add(self, triples):
+        for x in triples:
+            s, p, o = x[0], x[1], x[2]
+            if p == RDF_TYPE:
+                if o.startswith(ONTOLOGY) and (self.subjects is None or s in self.subjects):
+                    self.subject_types[s].add(self.types.encode(o))
+            elif p == SUBCLASS_OF and s.startswith(ONTOLOGY) and o.startswith(ONTOLOGY):
+                self.edges.add((self.types.encode(s), self.types.encode(o)))
+
+    def finish(self):
+        pass
+
+    def superclasses(self):
+        # superclass closure per type id (including the type)
+        parents = defaultdict(set)
+        for c, p in self.edges:
+            parents[c].add(p)
+        closure = {}
+        for t in range(len(self.types.strings)):
+            res = set([t])
+            todo = [t]
+            while todo:
+                for p in parents[todo.pop()]:
+                    if p not in res:
+                        res.add(p)
+                        todo.append(p)
+            closure[t] = res
+        return closure
+
+    def index(self):
+        # the memberships are expanded through the subclass closure: a subject of a type is also a subject of its
+        # superclasses (as ?s a <type> in SPARQL, dumps like instance_types only have the direct types)
+        closure = self.superclasses()
+        types_of = dict((s, set().union(*[closure[t] for t in types])) for s, types in self.subject_types.items())
+        subjects = sorted(types_of)
+        indptr = np.zeros(len(subjects) + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum([len(types_of[s]) for s in subjects])
+        subject_types = np.array([t for s in subjects for t in sorted(types_of[s])], dtype=np.int32)
+        types = [t[1:-1].decode('utf-8') for t in self.types.strings]
+        return TypeIndex(types, [s[1:-1].decode('utf-8') for s in subjects], indptr, subject_types, sorted(self.edges))
+
+
+class SubjectCollector(object):
+    # ntriples consumer collecting the subjects of a local file (of the triples with the given predicate)
+    def __init__(self, subjects, predicate=None):
+        self.subjects = subjects
+        self.predicate = predicate
+
+    def add(self, triples):
+        if self.predicate is None:
+            self.subjects.update(x[0] for x in triples)
+        else:
+            self.subjects.update(x[0] for x in triples if x[1] == self.predicate)
+
+    def finish(self):
+        pass
+
+
+def local_subjects(p):
+    # subjects of the local file of a property, as get_subjects_by_predicate of the endpoint
+    subjects = set()
+    ntriples.scan(p.filename, [SubjectCollector(subjects, predicate=p.prop.encode('utf-8'))])
+    return set(s[1:-1].decode('utf-8') for s in subjects)
+
+
+def build(filename, dumps, local_files=()):
+    # build the type index from N-Triples dumps (e.g. DBpedia instance types and ontology),
+    # restricted to the subjects of the given local files
+    subjects = None
+    if local_files:
+        subjects = set()
+        for f in local_files:
+            ntriples.scan(f, [SubjectCollector(subjects)])
+    builder = IndexBuilder(subjects)
+    for d in dumps:
+        ntriples.scan(d, [builder], reader=ntriples.read_file)
+    index = builder.index()
+    index.save(filename)
+    logging.info('Type index written to: ' + filename + ' (' + str(len(index)) + ' subjects, ' +
+                 str(len(index.types)) + ' types)')
+    return index
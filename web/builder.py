@@ -0,0 +1,170 @@
+import logging
+import multiprocessing
+import os
+import shutil
+import signal
+import tempfile
+import time
+import traceback
+
+from algorithm import graph, dimensions
+from utils import dbpedia_access, snapshot, type_index
+from utils.dbpedia_access import DBpedia
+
+GB = 1024 ** 3
+# interval for checking the running builds (seconds)
+POLL_SECONDS = 1.
+
+
+def graph_setup(config):
+    dist_fct = getattr(graph, config['graph-setup']['dist-function'])
+    features = None
+    if dist_fct == graph.euclid_dist:
+        features = getattr(dimensions, config['graph-setup']['feature-vector'])
+    return dist_fct, features
+
+
+# loaded type index per local files directory
+_TYPE_INDEX = {}
+
+
+def get_type_index(config):
+    directory = config['local-files']
+    if directory not in _TYPE_INDEX:
+        filename = type_index.index_file(directory)
+        _TYPE_INDEX[directory] = type_index.TypeIndex.load(filename) if os.path.exists(filename) else None
+    return _TYPE_INDEX[directory]
+
+
+def build_graph(p, config, dbp=None):
+    dist_fct, features = graph_setup(config)
+    index = get_type_index(config)
+    logging.info('Collecting all subjects for property: ' + p.name)
+    if index is not None:
+        # with a type index the build needs no endpoint, the local file has the triples of the property
+        subjects = type_index.local_subjects(p)
+    else:
+        if dbp is None:
+            dbp = DBpedia()
+        subjects = dbp.get_subjects_by_predicate(graph._normalize_uri(p.prop))
+
+    logging.info('Build property graph: ' + p.name)
+    g = graph.PropertyGraph(p, subjects, p.filename, min_instances=config['graph-setup']['nodes']['min'])
+    g.build_type_hierarchy(type_index=index)
+    logging.info('Branching for property graph: ' + p.name)
+    g.branching(
+        features=features,
+        dist_function=dist_fct,
+        min_instances=config['graph-setup']['nodes']['min'],
+        max_instances=config['graph-setup']['nodes']['max'],
+        normalize=config['graph-setup']['normalize-dist']
+    )
+    g.single_element_values(max_values=config['graph-setup'].get('max-values'))
+    g.release()
+    return g
+
+
+def build_config(config):
+    build = dict(workers=1, max_memory=None, memory_factor=4., timeout=None)
+    build.update((k.replace('-', '_'), v) for k, v in config.get('build', {}).items())
+    return build
+
+
+def estimate_memory(p, config):
+    # estimated peak memory (bytes) for building the graph of a property, based on the size of its local file
+    filename = p.filename + '_subjects'
+    size = os.path.getsize(filename) if os.path.exists(filename) else 0
+    return size * build_config(config)['memory_factor']
+
+
+def _build_worker(args):
+    # runs in a pool process: build one graph and hand it back as snapshot files
+    p, config, directory = args
+    # the parent checks if the process of a running build is still alive
+    with open(os.path.join(directory, p.name + '.pid'), 'w') as f:
+        f.write(str(os.getpid()))
+    dbpedia_access.configure(config)
+    try:
+        g = build_graph(p, config)
+        return p, snapshot.save_graph(directory, g), None
+    except Exception:
+        return p, None, traceback.format_exc()
+
+
+def _worker_pid(directory, p):
+    filename = os.path.join(directory, p.name + '.pid')
+    if not os.path.exists(filename):
+        return None
+    with open(filename) as f:
+        return int(f.read() or 0) or None
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError:
+        return False
+    return True
+
+
+def build_graphs(props, config):
+    # build the graphs of the properties in a process pool; returns the graphs and the errors per property.
+    # a build fails if its process dies (e.g. killed out of memory) or runs longer than build.timeout seconds
+    build = build_config(config)
+    if build['max_memory']:
+        budget = build['max_memory'] * GB
+    else:
+        budget = float('inf')
+    estimates = dict((p, estimate_memory(p, config)) for p in props)
+    # start with the largest graphs
+    pending = sorted(props, key=lambda p: estimates[p], reverse=True)
+
+    directory = tempfile.mkdtemp(prefix='graphs-')
+    pool = multiprocessing.Pool(processes=build['workers'], maxtasksperchild=1)
+    graphs = {}
+    errors = {}
+    try:
+        # property -> estimate, result, start time, time its process was found dead
+        running = {}
+        while pending or running:
+            # start as many builds as fit into the memory budget, at least one
+            while pending and len(running) < build['workers']:
+                fits = [p for p in pending if sum(r[0] for r in running.values()) + estimates[p] <= budget]
+                if not fits and running:
+                    break
+                p = fits[0] if fits else pending[0]
+                pending.remove(p)
+                result = pool.apply_async(_build_worker, [(p, config, directory)])
+                running[p] = [estimates[p], result, time.time(), None]
+                logging.info('Start building property graph: ' + p.name + ' (running: ' + str(len(running)) + ')')
+
+            finished = {}
+            for p, (estimate, result, start, dead) in running.items():
+                if result.ready():
+                    p, entry, finished[p] = result.get()
+                    if entry is not None:
+                        graphs[p] = snapshot.load_graph(directory, entry, p, config)
+                        logging.info('Finished property graph: ' + p.name)
+                    continue
+                pid = _worker_pid(directory, p)
+                if build['timeout'] and time.time() - start > build['timeout']:
+                    finished[p] = 'Build timed out after ' + str(build['timeout']) + ' seconds'
+                    if pid and _alive(pid):
+                        # the pool replaces the process
+                        os.kill(pid, signal.SIGTERM)
+                elif dead is not None and time.time() - dead > POLL_SECONDS:
+                    # no result after the process has exited
+                    finished[p] = 'Build process ' + str(pid) + ' died (e.g. killed out of memory)'
+                elif dead is None and pid and not _alive(pid):
+                    running[p][3] = time.time()
+            for p, error in finished.items():
+                del running[p]
+                if error:
+                    logging.error('Failed to build property graph: ' + p.name + '\n' + error)
+                    errors[p] = error
+            if running and not finished:
+                running.values()[0][1].wait(POLL_SECONDS)
+    finally:
+        pool.terminate()
+        shutil.rmtree(directory)
+    return graphs, errors
@@ -0,0 +1,146 @@
+import logging
+import threading
+import weakref
+from collections import OrderedDict
+
+from algorithm.interval_index import StoreIndex
+from utils import metrics, snapshot
+
+MB = 1024 ** 2
+
+LOADS = metrics.counter('labelling_graph_loads_total', 'Graphs loaded from the snapshot on demand')
+EVICTIONS = metrics.counter('labelling_graph_evictions_total', 'Graphs dropped from memory (least recently used)')
+LOADED_BYTES = metrics.gauge('labelling_graph_loaded_bytes',
+                             'Memory of the value arrays of the loaded graphs and the dropped graphs still in use')
+
+
+class GraphCache(object):
+    # property graphs of a snapshot directory, loaded on demand. the least recently used graphs are dropped
+    # while the loaded graphs need more than max_memory bytes (the last used graph is always kept).
+    # a query holds on to the graphs of all nodes in its value range: a wide query can need more than max_memory,
+    # the dropped graphs which are still used by queries are counted in memory() until the queries are finished
+    def __init__(self, directory, entries, config, max_memory=None, mmap=False, sketch_size=0):
+        self.directory = directory
+        self.entries = entries
+        self.config = config
+        self.max_memory = max_memory
+        self.mmap = mmap
+        self.sketch_size = sketch_size
+        self.graphs = OrderedDict()
+        self.sizes = {}
+        # node stores of dropped graphs which are still referenced -> size
+        self.dropped = weakref.WeakKeyDictionary()
+        # property -> [event, graph] of the running loads
+        self.loading = {}
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, p):
+        return p in self.entries
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __getitem__(self, p):
+        return self.get(p)
+
+    def get(self, p):
+        # the graph is read from disk outside of the lock, queries of other (loaded) graphs are not blocked.
+        # concurrent queries of the same graph wait for one load
+        with self.lock:
+            g = self.graphs.pop(p, None)
+            if g is not None:
+                # most recently used at the end
+                self.graphs[p] = g
+                return g
+            loading = self.loading.get(p)
+            if loading is None:
+                loading = self.loading[p] = [threading.Event(), None]
+                owner = True
+            else:
+                owner = False
+        if not owner:
+            loading[0].wait()
+            # the load failed
+            if loading[1] is None:
+                return self.get(p)
+            return loading[1]
+        try:
+            g, size = self._load(p)
+            with self.lock:
+                self.graphs[p] = g
+                self.sizes[p] = size
+                self._evict()
+            loading[1] = g
+            return g
+        finally:
+            with self.lock:
+                del self.loading[p]
+            loading[0].set()
+
+    def _load(self, p):
+        logging.info('Load property graph from snapshot: ' + p.name)
+        g = snapshot.load_graph(self.directory, self.entries[p], p, self.config, mmap=self.mmap)
+        size = g.store.nbytes
+        if self.sketch_size:
+            size += g.store.sketch(self.sketch_size).nbytes
+        LOADS.inc()
+        return g, size
+
+    def memory(self):
+        # loaded graphs and dropped graphs which are still used by queries
+        with self.lock:
+            return self._loaded_memory() + sum(self.dropped.values())
+
+    def _loaded_memory(self):
+        return sum(self.sizes[p] for p in self.graphs)
+
+    def _evict(self):
+        while self.max_memory and len(self.graphs) > 1 and self._loaded_memory() > self.max_memory:
+            p, g = self.graphs.popitem(last=False)
+            self.dropped[g.store] = self.sizes.pop(p)
+            EVICTIONS.inc()
+            logging.info('Drop property graph from memory: ' + p.name)
+        LOADED_BYTES.set(self._loaded_memory() + sum(self.dropped.values()))
+
+    def replace(self, p, g, entries):
+        # new cache with the graph g of p (rebuilt or new) and the loaded graphs of the other properties,
+        # this cache still serves the queries started before the swap
+        cache = GraphCache(self.directory, entries, self.config, max_memory=self.max_memory, mmap=self.mmap,
+                           sketch_size=self.sketch_size)
+        with self.lock:
+            for q, h in self.graphs.items():
+                if q != p:
+                    cache.graphs[q] = h
+                    cache.sizes[q] = self.sizes[q]
+        size = g.store.nbytes
+        if self.sketch_size:
+            size += g.store.sketch(self.sketch_size).nbytes
+        cache.graphs[p] = g
+        cache.sizes[p] = size
+        cache._evict()
+        return cache
+
+    def loaded(self):
+        # the loaded graphs, least recently used first
+        with self.lock:
+            return list(self.graphs.values())
+
+
+class LazyStoreIndex(StoreIndex):
+    # interval index over the node ranges of all graphs of a GraphCache (read from the snapshot files).
+    # only the graphs with nodes in the range of a query are loaded
+    def __init__(self, cache):
+        self.cache = cache
+        self.props = sorted(cache, key=lambda p: p.name)
+        self._build([snapshot.node_ranges(cache.directory, cache.entries[p]) for p in self.props])
+
+    @property
+    def stores(self):
+        # stores of the loaded graphs
+        return [g.store for g in self.cache.loaded()]
+
+    def _store(self, i):
+        return self.cache.get(self.props[i]).store
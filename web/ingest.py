@@ -0,0 +1,163 @@
+import codecs
+import csv
+from collections import Counter
+
+import numpy as np
+
+from utils import metrics
+
+# rows which are converted at once
+CHUNK_ROWS = 10000
+SNIFF_BYTES = 1 << 16
+SNIFF_ROWS = 100
+DELIMITERS = ',;\t|'
+
+PARSE_SECONDS = metrics.histogram('labelling_upload_parse_seconds', 'Duration of parsing uploaded CSV files')
+ROWS = metrics.counter('labelling_upload_rows_total', 'Rows of uploaded CSV files')
+
+
+def _decode(v):
+    if isinstance(v, unicode):
+        return v
+    return v.decode('utf-8', 'replace')
+
+
+def to_numbers(cells):
+    # bulk conversion of a list of strings: numbers and a mask of the numeric cells.
+    # empty cells are never numeric, they are left out of the conversion (a sparse column stays on the bulk path)
+    nums = np.zeros(len(cells), dtype=np.float64)
+    mask = np.zeros(len(cells), dtype=bool)
+    filled = [i for i, v in enumerate(cells) if v.strip()]
+    values = cells if len(filled) == len(cells) else [cells[i] for i in filled]
+    try:
+        nums[filled] = np.array(values).astype(np.float64)
+        mask[filled] = True
+        return nums, mask
+    except (ValueError, UnicodeError):
+        pass
+    # mixed column, convert value by value (as float())
+    for i in filled:
+        try:
+            nums[i] = float(cells[i])
+            mask[i] = True
+        except (ValueError, UnicodeError):
+            pass
+    return nums, mask
+
+
+class ColumnSample(object):
+    # numeric values of a column, at most max_values of them (uniform reservoir sample); the invalid
+    # cells are kept up to the same limit
+    def __init__(self, max_values=None, seed=0):
+        self.max_values = max_values
+        self.values = np.empty(0, dtype=np.float64)
+        self.invalid = []
+        self.numeric = 0
+        # non-empty, non-numeric cells
+        self.non_numeric = 0
+        # first non-empty cell (header)
+        self.first = None
+        # fixed seed: the same upload gives the same sample
+        self.rnd = np.random.RandomState(seed)
+
+    def add(self, cells):
+        if not cells:
+            return
+        if self.first is None:
+            self.first = next((v for v in cells if v.strip()), None)
+        nums, mask = to_numbers(cells)
+        if not mask.all():
+            for v, m in zip(cells, mask):
+                if not m and v.strip():
+                    self.non_numeric += 1
+                    if self.max_values is None or len(self.invalid) < self.max_values:
+                        self.invalid.append(_decode(v))
+        self._sample(nums[mask])
+
+    def _sample(self, nums):
+        seen = self.numeric
+        self.numeric += len(nums)
+        if self.max_values is None:
+            self.values = np.concatenate((self.values, nums))
+            return
+        free = max(self.max_values - len(self.values), 0)
+        if free:
+            self.values = np.concatenate((self.values, nums[:free]))
+            nums = nums[free:]
+            seen += free
+        if len(nums):
+            # algorithm R: the t-th value replaces a random slot with probability max_values / t
+            t = np.arange(seen + 1, seen + len(nums) + 1)
+            slots = (self.rnd.random_sample(len(nums)) * t).astype(np.int64)
+            keep = slots < self.max_values
+            self.values[slots[keep]] = nums[keep]
+
+    @property
+    def sampled(self):
+        return self.numeric > len(self.values)
+
+    def has_header(self):
+        return self.first is not None and not to_numbers([self.first])[1][0]
+
+
+def sniff(sample):
+    # the delimiter which splits most rows of the sample into the same number of fields
+    lines = sample.splitlines()[:SNIFF_ROWS]
+    best, score = ',', (0, 0)
+    for d in DELIMITERS:
+        try:
+            widths = Counter(len(r) for r in csv.reader(lines, delimiter=d) if r)
+        except csv.Error:
+            continue
+        width, rows = max(widths.items(), key=lambda w: (w[1], w[0])) if widths else (1, 0)
+        if width > 1 and (rows, width) > score:
+            best, score = d, (rows, width)
+    return best
+
+
+def read_columns(stream, columns=None, max_values=None):
+    # stream the rows of a CSV file and collect the given columns (all columns if None): {index: ColumnSample}
+    with PARSE_SECONDS.time():
+        return _read_columns(stream, columns, max_values)
+
+
+def _read_columns(stream, columns, max_values):
+    sample = stream.read(SNIFF_BYTES)
+    # byte order mark of files saved by Excel
+    if sample.startswith(codecs.BOM_UTF8):
+        sample = sample[len(codecs.BOM_UTF8):]
+    rest = stream.readline() if sample and not sample.endswith('\n') else ''
+    delimiter = sniff(sample + rest)
+    lines = _lines(sample + rest, stream)
+    samples = {}
+    if columns is not None:
+        for c in columns:
+            samples[c] = ColumnSample(max_values)
+    chunk = []
+    for row in csv.reader(lines, delimiter=delimiter):
+        chunk.append(row)
+        if len(chunk) >= CHUNK_ROWS:
+            ROWS.inc(len(chunk))
+            _add_rows(chunk, samples, columns, max_values)
+            chunk = []
+    ROWS.inc(len(chunk))
+    _add_rows(chunk, samples, columns, max_values)
+    return samples
+
+
+def _lines(head, stream):
+    for line in head.splitlines(True):
+        yield line
+    for line in stream:
+        yield line
+
+
+def _add_rows(rows, samples, columns, max_values):
+    if not rows:
+        return
+    if columns is None:
+        for c in range(max(len(r) for r in rows)):
+            if c not in samples:
+                samples[c] = ColumnSample(max_values)
+    for c, s in samples.items():
+        s.add([r[c] for r in rows if c < len(r)])
@@ -1,10 +1,26 @@
 import csv
 import logging
+import threading
+import weakref
 from collections import defaultdict
 
-from algorithm import graph, dimensions
-from algorithm.algorithms import KolmogorovSmirnov
+import numpy as np
+
+from algorithm import graph
+from algorithm.algorithms import KolmogorovSmirnov, Neighbors, approximate_error
+from algorithm.interval_index import StoreIndex
+from algorithm.node_store import NodeStore, ks_pairs
+from utils import metrics, snapshot
 from utils.dbpedia_access import DBpedia
+from web import builder, graph_cache
+from web.graph_cache import GraphCache, LazyStoreIndex
+
+RANKING_SECONDS = metrics.histogram('labelling_ranking_seconds', 'Duration of the nearest neighbour search',
+                                    labels=('function',))
+CANDIDATE_NODES = metrics.histogram('labelling_candidate_nodes', 'Nodes in the value range of a query',
+                                    buckets=metrics.COUNT_BUCKETS)
+KS_COMPARISONS = metrics.counter('labelling_ks_comparisons_total', 'KS statistics computed between queries and nodes',
+                                 labels=('mode',))
 
 
 def parse_props(config):
@@ -17,51 +33,264 @@ def parse_props(config):
     return [graph.Property(prop, dir=config['local-files']) for prop in props]
 
 
+def add_prop(config, p, count):
+    # append a new property to the properties file (served after a restart as well), count: its number of values
+    if p in parse_props(config):
+        return False
+    propfile = config['properties']
+    with open(propfile, 'a+') as f:
+        f.seek(0, 2)
+        if f.tell():
+            f.seek(-1, 2)
+            if f.read(1) != '\n':
+                f.write('\n')
+        csv.writer(f, quoting=csv.QUOTE_NONNUMERIC, lineterminator='\n').writerow([p.prop[1:-1].encode('utf-8'),
+                                                                                   count])
+    logging.info('Property added to the properties file: ' + p.name)
+    return True
+
+
 class NumLabeller():
-    def __init__(self, props, config):
+    def __init__(self, props, config, snapshot_dir=None, mmap=False, lazy=False):
+        # lazy: the graphs are loaded from the snapshot when a query touches their value range and
+        # dropped (least recently used) beyond graph-memory MB in the api section of the config
         self. config = config
-        self.dist_fct = getattr(graph, self.config['graph-setup']['dist-function'])
-        self.features = None
-        if self.dist_fct == graph.euclid_dist:
-            self.features = getattr(dimensions, self.config['graph-setup']['feature-vector'])
+        self.dist_fct, self.features = builder.graph_setup(config)
+        self.ranking = ranking_config(config)
+        self.props = list(props)
+        self.snapshot_dir = snapshot_dir
+        self.mmap = mmap
+        self.lazy = lazy
+        # inputs, build time and snapshot entry of the served graphs, see refresh()
+        self.served = {}
+        # weak references to the replaced graph caches (lazy), their files are removed after the running queries
+        self.caches = []
+        self.lock = threading.RLock()
 
-        dbp = DBpedia()
+        if lazy and not snapshot_dir:
+            raise ValueError('Loading graphs on demand requires a snapshot directory')
         self.graphs = {}
-        for p in props:
-            logging.info('Collecting all subjects for property: ' + p.name)
-            subjects = dbp.get_subjects_by_predicate(graph._normalize_uri(p.prop))
-
-            logging.info('Build property graph: ' + p.name)
-            g = graph.PropertyGraph(p, subjects, p.filename, min_instances=self.config['graph-setup']['nodes']['min'])
-            g.build_type_hierarchy()
-            logging.info('Branching for property graph: ' + p.name)
-            g.branching(
-                features=self.features,
-                dist_function=self.dist_fct,
-                min_instances=self.config['graph-setup']['nodes']['min'],
-                max_instances=self.config['graph-setup']['nodes']['max'],
-                normalize=self.config['graph-setup']['normalize-dist']
-            )
-            g.single_element_values()
-            self.graphs[p] = g
+        entries = {}
+        if snapshot_dir:
+            entries = snapshot.entries(snapshot_dir, props, config)
+            if not lazy:
+                for p, entry in entries.items():
+                    logging.info('Load property graph from snapshot: ' + p.name)
+                    self.graphs[p] = snapshot.load_graph(snapshot_dir, entry, p, config, mmap=mmap)
+        for p, entry in entries.items():
+            self.served[p] = {'inputs': entry['inputs'], 'built': entry.get('built'), 'entry': entry}
+
+        missing = [p for p in props if p not in entries]
+        for p in missing:
+            self.served[p] = {'inputs': snapshot.build_inputs(p, config), 'built': None, 'entry': None}
+        # properties which failed to build in the process pool
+        self.errors = {}
+        if builder.build_config(config)['workers'] > 1 and missing:
+            graphs, self.errors = builder.build_graphs(missing, config)
+            self.graphs.update(graphs)
+        else:
+            dbp = DBpedia()
+            for p in missing:
+                self.graphs[p] = self.build_graph(p, dbp)
+
+        if lazy:
+            # the new graphs are only kept in the snapshot
+            if self.graphs:
+                self._save(self.graphs)
+            max_memory = (config.get('api') or {}).get('graph-memory')
+            self.graphs = GraphCache(snapshot_dir, snapshot.entries(snapshot_dir, props, config), config,
+                                     max_memory=max_memory * graph_cache.MB if max_memory else None, mmap=mmap,
+                                     sketch_size=self.ranking['sketch_size'])
+            self.index = LazyStoreIndex(self.graphs)
+            return
+        # interval index over the value ranges of all nodes
+        self.index = StoreIndex(self.graphs[p].store for p in self.graphs)
+        if self.ranking['sketch_size']:
+            for store in self.index.stores:
+                store.sketch(self.ranking['sketch_size'])
+
+    def _remove_superseded(self, props):
+        # remove the files of earlier builds which are neither served nor used by a replaced graph cache
+        with self.lock:
+            caches = [ref() for ref in self.caches]
+            self.caches = [ref for ref, cache in zip(self.caches, caches) if cache is not None]
+            for p in props:
+                keep = [self.served[p]['entry']] + [c.entries[p] for c in caches if c is not None and p in c.entries]
+                snapshot.remove_superseded(self.snapshot_dir, p, [e for e in keep if e])
+            del caches
+
+    def _save(self, graphs):
+        snapshot.save(self.snapshot_dir, graphs, self.config)
+        manifest = snapshot.read_manifest(self.snapshot_dir)
+        for p in graphs:
+            self.served[p]['built'] = manifest['graphs'][p.name]['built']
+            self.served[p]['entry'] = manifest['graphs'][p.name]
+
+    def refresh(self, p, force=False):
+        # rebuild the graph of one (new or changed) property and swap it into the labeller. returns 'loaded' if the
+        # snapshot has a newer up-to-date graph (e.g. built with the rebuild command), 'unchanged' if the inputs of
+        # the served graph did not change, 'built' otherwise (force: always build). the graph is built in a separate
+        # process, queries are served from the old graphs until the swap
+        served = self.served.get(p)
+        entry = None
+        if self.snapshot_dir and not force:
+            entry = snapshot.entries(self.snapshot_dir, [p], self.config).get(p)
+        if entry and (served is None or entry.get('built') != served['built']):
+            logging.info('Load property graph from snapshot: ' + p.name)
+            g = snapshot.load_graph(self.snapshot_dir, entry, p, self.config, mmap=self.mmap)
+            self._swap(p, g, {'inputs': entry['inputs'], 'built': entry.get('built'), 'entry': entry})
+            return 'loaded'
+        if not force and served is not None and not snapshot.is_stale(served, p, self.config):
+            logging.info('Inputs of property graph not changed: ' + p.name)
+            return 'unchanged'
+
+        inputs = snapshot.build_inputs(p, self.config)
+        graphs, errors = builder.build_graphs([p], self.config)
+        if p in errors:
+            raise RuntimeError('Failed to build property graph: ' + p.name + '\n' + errors[p])
+        served = {'inputs': inputs, 'built': None, 'entry': None}
+        if self.snapshot_dir:
+            snapshot.save(self.snapshot_dir, graphs, self.config)
+            served['entry'] = snapshot.read_manifest(self.snapshot_dir)['graphs'][p.name]
+            served['built'] = served['entry']['built']
+        self._swap(p, graphs[p], served)
+        return 'built'
+
+    def _swap(self, p, g, served):
+        # new graphs and index, the queries hold on to the index they started with
+        with self.lock:
+            if self.lazy:
+                entries = dict(self.graphs.entries)
+                entries[p] = served['entry']
+                graphs = self.graphs.replace(p, g, entries)
+                index = LazyStoreIndex(graphs)
+                # the replaced cache loads the files of its entries for the running queries until it is released
+                replaced = self.graphs.entries
+                self.caches.append(weakref.ref(self.graphs, lambda ref: self._remove_superseded(
+                    [q for q in replaced if q in self.served and replaced[q] != self.served[q]['entry']])))
+            else:
+                graphs = dict(self.graphs)
+                graphs[p] = g
+                index = StoreIndex(graphs[x].store for x in graphs)
+                if self.ranking['sketch_size']:
+                    g.store.sketch(self.ranking['sketch_size'])
+            new = p not in self.props
+            if new:
+                self.props.append(p)
+            self.served[p] = served
+            self.errors.pop(p, None)
+            self.graphs = graphs
+            self.index = index
+        if served['entry']:
+            self._remove_superseded([p])
+        if new:
+            add_prop(self.config, p, int(g.store.counts.sum()))
+        logging.info('Property graph swapped in: ' + p.name)
+
+    def build_graph(self, p, dbp):
+        return builder.build_graph(p, self.config, dbp)
 
     def get_candidates(self, values, k):
-        return ks_classify(values, self.graphs, k)
-
-
-def ks_classify(values, graphs, k):
-    X = []
-    nodes = []
-    for p in graphs:
-        graph = graphs[p]
-        for n in graph.nodes:
-            if n.instances > 0:
-                v = n.values
-                if v and in_range(values, n):
-                    X.append(v)
-                    nodes.append(n)
-    ks_test = KolmogorovSmirnov(X, nodes)
-    return ks_test.getNeighbors(values, k)
+        return ks_classify(values, self.index, k, **self.ranking)
+
+    def get_candidates_batch(self, columns, k):
+        return ks_classify_batch(columns, self.index, k, **self.ranking)
+
+
+def ranking_config(config):
+    # approximate ranking: sketch-size quantiles per node (0: exact ranking), rerank: number of
+    # candidates which are re-ranked with the exact statistic
+    ranking = dict(sketch_size=0, rerank=100)
+    ranking.update((k.replace('-', '_'), v) for k, v in (config.get('ranking') or {}).items())
+    return ranking
+
+
+def ks_classify(values, index, k, sketch_size=0, rerank=100):
+    with RANKING_SECONDS.time(function='ks_classify'):
+        candidates = []
+        if len(values):
+            candidates = index.candidates(min(values), max(values))
+        _count_comparisons([sum(len(idx) for store, idx in candidates)], k, sketch_size, rerank)
+        ks_test = KolmogorovSmirnov(candidates, sketch_size=sketch_size, rerank=rerank)
+        return ks_test.getNeighbors(values, k)
+
+
+def _count_comparisons(candidates, k, sketch_size, rerank):
+    # candidates: number of candidate nodes per query
+    for n in candidates:
+        CANDIDATE_NODES.observe(n)
+        if sketch_size:
+            KS_COMPARISONS.inc(n, mode='sketch')
+            KS_COMPARISONS.inc(min(n, max(rerank, k, 0)), mode='exact')
+        else:
+            KS_COMPARISONS.inc(n, mode='exact')
+
+
+def _ks_pairs(queries, cols, stores, nodes, store_list, sketch_size=0):
+    distances = np.zeros(len(cols), dtype=np.float64)
+    for i, store in enumerate(store_list):
+        sel = np.flatnonzero(stores == i)
+        if len(sel):
+            if sketch_size:
+                store = store.sketch(sketch_size)
+            distances[sel] = ks_pairs(queries, cols[sel], store, nodes[sel])
+    return distances
+
+
+def ks_classify_batch(columns, index, k, sketch_size=0, rerank=100):
+    # nearest neighbours of several value bags: the KS statistics of all (column, candidate node) pairs
+    # are computed in one pass per node store. same result as ks_classify for each column
+    with RANKING_SECONDS.time(function='ks_classify_batch'):
+        return _ks_classify_batch(columns, index, k, sketch_size, rerank)
+
+
+def _ks_classify_batch(columns, index, k, sketch_size, rerank):
+    filled = [j for j, values in enumerate(columns) if len(values)]
+    queries = NodeStore.from_values([columns[j] for j in filled])
+    # pairs in the candidate order of ks_classify, grouped by column
+    cols, stores, nodes = [], [], []
+    # the stores of the candidates (graphs may be loaded on demand, see graph_cache)
+    store_list = []
+    store_ids = {}
+    counts = [0] * len(filled)
+    for q, j in enumerate(filled):
+        values = columns[j]
+        for store, idx in index.candidates(min(values), max(values)):
+            if id(store) not in store_ids:
+                store_ids[id(store)] = len(store_list)
+                store_list.append(store)
+            cols.append(np.repeat(q, len(idx)))
+            stores.append(np.repeat(store_ids[id(store)], len(idx)))
+            nodes.append(idx)
+            counts[q] += len(idx)
+    _count_comparisons(counts, k, sketch_size, rerank)
+    res = [Neighbors() for _ in columns]
+    if not cols:
+        return res
+    cols, stores, nodes = np.concatenate(cols), np.concatenate(stores), np.concatenate(nodes)
+    bounds = np.searchsorted(cols, np.arange(len(filled) + 1))
+    if sketch_size:
+        # rank on the sketches, re-rank the best candidates of each column
+        approx = _ks_pairs(queries, cols, stores, nodes, store_list, sketch_size)
+        selected = np.concatenate([bounds[q] + np.sort(np.argsort(approx[bounds[q]:bounds[q + 1]], kind='mergesort')
+                                                       [:max(rerank, k, 0)]) for q in range(len(filled))])
+        cols, stores, nodes = cols[selected], stores[selected], nodes[selected]
+        sel_bounds = np.searchsorted(cols, np.arange(len(filled) + 1))
+    distances = _ks_pairs(queries, cols, stores, nodes, store_list)
+
+    for q, j in enumerate(filled):
+        if sketch_size:
+            b = sel_bounds
+            res[j].error_bound = approximate_error(approx[bounds[q]:bounds[q + 1]], distances[b[q]:b[q + 1]],
+                                                   selected[b[q]:b[q + 1]] - bounds[q], k, 1. / sketch_size)
+        else:
+            b = bounds
+        d = distances[b[q]:b[q + 1]]
+        # stable sort keeps the order of the candidates for equal distances
+        for i in np.argsort(d, kind='mergesort')[:max(k, 0)]:
+            p = b[q] + i
+            res[j].append((store_list[stores[p]].nodes[nodes[p]], d[i]))
+    return res
 
 
 def in_range(values, x):
@@ -0,0 +1,71 @@
+import errno
+import logging
+import os
+import signal
+import socket
+
+from werkzeug.serving import make_server
+
+
+def _listen(host, port):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(128)
+    return sock
+
+
+def _worker(app, host, port, sock, init):
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if init:
+        init()
+    # one request at a time per process: the labelling is CPU-bound
+    server = make_server(host, port, app, threaded=False, fd=sock.fileno())
+    server.serve_forever()
+
+
+def serve(app, host, port, workers, init=None):
+    # pre-forking server: the app (and the graphs of the labeller) are loaded before the workers are forked.
+    # the workers share the memory of the parent (copy-on-write) and accept on the same listening socket,
+    # init() is called in each worker process before it serves requests
+    sock = _listen(host, port)
+    children = set()
+    stopping = []
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            try:
+                _worker(app, host, port, sock, init)
+            except Exception:
+                logging.exception('Worker failed')
+            finally:
+                os._exit(1)
+        children.add(pid)
+        logging.info('Started worker process ' + str(pid))
+
+    def stop(signum, frame):
+        stopping.append(signum)
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for _ in range(workers):
+        spawn()
+    while children:
+        try:
+            pid, status = os.wait()
+        except OSError as e:
+            if e.errno == errno.EINTR:
+                continue
+            raise
+        children.discard(pid)
+        if not stopping:
+            logging.warning('Worker process ' + str(pid) + ' exited (status ' + str(status) + '), restarting')
+            spawn()
+    sock.close()
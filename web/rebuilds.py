@@ -0,0 +1,65 @@
+import logging
+import threading
+import time
+import traceback
+import Queue
+from collections import OrderedDict
+
+
+class RebuildQueue(object):
+    # runs the refreshs of property graphs one after another in a background thread.
+    # refresh(p, force) returns the status of the job ('unchanged', 'loaded', 'built'),
+    # on_change(p) is called after a new graph has been swapped in
+    def __init__(self, refresh, on_change=None, max_jobs=100):
+        self.refresh = refresh
+        self.on_change = on_change
+        self.max_jobs = max_jobs
+        self.jobs = OrderedDict()
+        self.queue = Queue.Queue()
+        self.lock = threading.Lock()
+        self.ids = 0
+        self.thread = None
+
+    def submit(self, p, force=False):
+        # the pending job of the property if there is one
+        with self.lock:
+            for job in self.jobs.values():
+                if job['property'] == p.name and job['status'] == 'queued' and (job['force'] or not force):
+                    return job
+            self.ids += 1
+            job = {'id': self.ids, 'property': p.name, 'uri': p.prop[1:-1], 'force': force, 'status': 'queued',
+                   'error': None, 'submitted': time.time(), 'finished': None}
+            self.jobs[job['id']] = job
+            # keep the most recent jobs
+            while len(self.jobs) > self.max_jobs:
+                self.jobs.popitem(last=False)
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, name='rebuilds')
+                self.thread.daemon = True
+                self.thread.start()
+        self.queue.put((job, p))
+        return job
+
+    def _run(self):
+        while True:
+            job, p = self.queue.get()
+            job['status'] = 'running'
+            logging.info('Refresh property graph: ' + p.name)
+            try:
+                job['status'] = self.refresh(p, job['force'])
+                if job['status'] != 'unchanged' and self.on_change:
+                    self.on_change(p)
+            except Exception:
+                logging.exception('Failed to refresh property graph: ' + p.name)
+                job['status'] = 'failed'
+                job['error'] = traceback.format_exc()
+            job['finished'] = time.time()
+            self.queue.task_done()
+
+    def wait(self):
+        # block until all submitted jobs are finished
+        self.queue.join()
+
+    def list(self):
+        with self.lock:
+            return [dict(job) for job in self.jobs.values()]
@@ -1,31 +1,57 @@
 import argparse
+import hmac
+import json
 import logging
 import os
+import shutil
+import tempfile
+import urllib
+import urllib2
 
-import anycsv
 import flask
 import yaml
 from flask import Flask, request, jsonify, flash
 
+import builder
+import ingest
 import labeller
+import prefork
+import rebuilds
 from labeller import NumLabeller
+from query_cache import QueryCache, query_key
+from algorithm import graph
+from utils import dbpedia_access, metrics, ntriples, snapshot, type_index
 
 
 app = Flask(__name__)
 app.secret_key = "multi-level labelling"
+# min. ratio of numeric cells for detecting numeric columns in batch requests
+NUMERIC_RATIO = 0.8
+# results of recent requests, see set_labeller
+app.config['CACHE'] = QueryCache(max_size=0)
+# max. number of values per column (reservoir sample of larger columns), None: all values
+app.config['MAX_VALUES'] = None
+# admin requests (graph rebuilds) need this token in the X-Admin-Token header, None: only from localhost
+app.config['ADMIN_TOKEN'] = None
+LOCALHOST = ('127.0.0.1', '::1')
+app.config['WORKERS'] = 1
+# shared directory of the metrics of the worker processes (workers > 1), see serve_workers
+app.config['METRICS_DIR'] = None
 
-def parse_data(values):
-    nums = []
-    missing = []
-    for v in values:
-        try:
-            n = float(v)
-            nums.append(n)
-        except:
-            missing.append(v)
-    return nums, missing
+REQUEST_SECONDS = metrics.histogram('labelling_request_seconds', 'Duration of labelling requests', labels=('endpoint',))
+COLUMNS = metrics.counter('labelling_columns_total', 'Labelled columns', labels=('cache',))
+CACHE = metrics.gauge('labelling_cache', 'Statistics of the result cache', labels=('stat',))
 
 
+def set_labeller(num_labeller, cache_config=None):
+    # the cached results are only valid for the graphs of this labeller
+    if cache_config is not None:
+        app.config['CACHE'] = QueryCache(max_size=cache_config.get('size', 10000), ttl=cache_config.get('ttl'))
+    app.config['LABELLER'] = num_labeller
+    app.config['CACHE'].clear()
+    # graph rebuilds in the background, the result cache is cleared after a graph has been swapped in
+    app.config['REBUILDS'] = rebuilds.RebuildQueue(num_labeller.refresh, on_change=lambda p: app.config['CACHE'].clear())
+
 def isInt(value):
   try:
     int(value)
@@ -34,19 +60,51 @@ def isInt(value):
     return False
 
 
-def get_response(values, neighbours):
-    data, invalid = parse_data(values)
-    neighbors = app.config['LABELLER'].get_candidates(data, neighbours)
+def column_sample(values):
+    sample = ingest.ColumnSample(app.config['MAX_VALUES'])
+    sample.add(values)
+    return sample
+
+
+def get_response(sample, neighbours):
+    with REQUEST_SECONDS.time(endpoint='labelling'):
+        cache = app.config['CACHE']
+        key = query_key(sample.values, neighbours)
+        # results ranked on graphs which are swapped out meanwhile are not cached
+        generation = cache.generation
+        result = cache.get(key)
+        COLUMNS.inc(cache='miss' if result is None else 'hit')
+        if result is None:
+            neighbors = app.config['LABELLER'].get_candidates(sample.values, neighbours)
+            result = labelling_result(neighbors)
+            cache.put(key, result, generation)
+        return jsonify(response(sample, result))
+
+
+def response(sample, result):
+    res = {
+        'values': sample.values.tolist(),
+        'invalid': sample.invalid
+    }
+    if sample.sampled:
+        # the values are a random sample of all numeric cells
+        res['sampled-from'] = sample.numeric
+    res.update(result)
+    return res
+
+
+def labelling_result(neighbors):
+    # the part of the response which only depends on the (sorted) values
     label_maj = labeller.label_prediction(neighbors)
     label_avg = labeller.label_prediction(neighbors, mode='avg')
 
     type_maj = labeller.type_prediction(neighbors, mode='maj')
     type_avg = labeller.type_prediction(neighbors, mode='avg')
 
-    response = {
-        'values': data,
-        'invalid': invalid,
+    result = {
         'neighbours': [[str(n[0]), round(n[1], 4)] for n in neighbors],
+        # approximate ranking: max. distance by which another node could be closer than the neighbours
+        'error-bound': round(getattr(neighbors, 'error_bound', 0.), 4),
         'labelling': {
             'property': {
                 'maj': [[str(l[0]), round(l[1], 4)] for l in label_maj],
@@ -58,7 +116,47 @@ def get_response(values, neighbours):
             }
         }
     }
-    return jsonify(response)
+    return result
+
+
+def is_numeric_column(sample, min_ratio=NUMERIC_RATIO):
+    # numeric if most of the non-empty cells are numbers, a header row is not counted
+    cells = sample.numeric + sample.non_numeric
+    if sample.has_header():
+        cells -= 1
+    return sample.numeric > 0 and sample.numeric >= min_ratio * cells
+
+
+def get_batch_response(columns, neighbours, detect=True):
+    # columns: list of (name, ColumnSample)
+    with REQUEST_SECONDS.time(endpoint='batch'):
+        return _batch_response(columns, neighbours, detect)
+
+
+def _batch_response(columns, neighbours, detect):
+    numeric = [not detect or is_numeric_column(sample) for name, sample in columns]
+    selected = [c for c, x in zip(columns, numeric) if x]
+    cache = app.config['CACHE']
+    keys = [query_key(c[1].values, neighbours) for c in selected]
+    generation = cache.generation
+    results = [cache.get(key) for key in keys]
+    # rank the columns which are not cached in one batch
+    missing = [i for i, r in enumerate(results) if r is None]
+    COLUMNS.inc(len(results) - len(missing), cache='hit')
+    COLUMNS.inc(len(missing), cache='miss')
+    batch = app.config['LABELLER'].get_candidates_batch([selected[i][1].values for i in missing], neighbours)
+    for i, neighbors in zip(missing, batch):
+        results[i] = labelling_result(neighbors)
+        cache.put(keys[i], results[i], generation)
+    res = {
+        'columns': [],
+        'skipped': [c[0] for c, x in zip(columns, numeric) if not x]
+    }
+    for (name, sample), result in zip(selected, results):
+        column = response(sample, result)
+        column['column'] = name
+        res['columns'].append(column)
+    return jsonify(res)
 
 
 @app.route('/labelling', methods=['GET', 'POST'])
@@ -83,17 +181,184 @@ def upload_file():
                 flask.abort(400, '\n'.join(flask.get_flashed_messages()))
             if file:
                 #filename = secure_filename(file.filename)
-                reader = anycsv.reader(content=file.read())
-                values = [r[int(column)] for r in reader]
-                return get_response(values=values, neighbours=int(neighbours))
+                # the upload is parsed row by row, only the requested column is kept
+                samples = ingest.read_columns(file.stream, [int(column)], app.config['MAX_VALUES'])
+                return get_response(samples[int(column)], neighbours=int(neighbours))
 
         flash('Use "csv" parameter to specify file')
     return flask.abort(400, '\n'.join(flask.get_flashed_messages()))
 
 
+@app.route('/labelling/batch', methods=['POST'])
+def batch_labelling():
+    # label all numeric columns of an uploaded table, or several value bags given as JSON:
+    # {"columns": {"name": [values], ...}} or {"columns": [[values], ...]}
+    neighbours = request.args.get('neighbours', '10')
+    if not isInt(neighbours):
+        flash('Invalid number of neighbours. Use "neighbours={count}". Default is 10.')
+        flask.abort(422, '\n'.join(flask.get_flashed_messages()))
+    if 'csv' in request.files:
+        file = request.files['csv']
+        if file.filename == '':
+            flash('No selected file')
+            flask.abort(400, '\n'.join(flask.get_flashed_messages()))
+        samples = ingest.read_columns(file.stream, max_values=app.config['MAX_VALUES'])
+        return get_batch_response(sorted(samples.items()), neighbours=int(neighbours))
+    data = request.get_json(silent=True)
+    if isinstance(data, dict) and 'columns' in data:
+        columns = data['columns']
+        if isinstance(columns, dict):
+            columns = sorted(columns.items())
+        elif isinstance(columns, list):
+            columns = list(enumerate(columns))
+        else:
+            flask.abort(400, '"columns" must be an object or a list of value lists')
+        invalid = [unicode(name) for name, values in columns if not isinstance(values, list)]
+        if invalid:
+            flask.abort(400, 'The values of a column must be a list: ' + u', '.join(invalid))
+        # value bags are labelled even if they contain non-numeric values
+        detect = request.args.get('detect', 'false') == 'true'
+        return get_batch_response([(name, column_sample([unicode(v) for v in values])) for name, values in columns],
+                                  neighbours=int(neighbours), detect=detect)
+    flash('Use "csv" parameter to upload a table or post JSON {"columns": ...}')
+    return flask.abort(400, '\n'.join(flask.get_flashed_messages()))
+
+
+@app.route('/labelling/cache', methods=['GET'])
+def cache_stats():
+    return jsonify(app.config['CACHE'].stats())
+
+
+def update_cache_metrics():
+    for stat, value in app.config['CACHE'].stats().items():
+        if value is not None:
+            CACHE.set(value, stat=stat)
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    # Prometheus text format. with several worker processes the metrics of all workers are merged,
+    # whichever worker serves the request
+    update_cache_metrics()
+    if app.config['METRICS_DIR']:
+        text = metrics.merged_exposition(app.config['METRICS_DIR'])
+    else:
+        text = metrics.exposition()
+    return flask.Response(text, mimetype='text/plain; version=0.0.4')
+
+
+def _utf8(x):
+    return x.encode('utf-8') if isinstance(x, unicode) else str(x)
+
+
+def check_admin():
+    # without a token the admin requests are only accepted from localhost
+    token = app.config['ADMIN_TOKEN']
+    if not token:
+        if request.remote_addr not in LOCALHOST:
+            flask.abort(403, 'Admin requests are only accepted from localhost, set admin-token in the api section '
+                             'of the config file')
+        return
+    if not hmac.compare_digest(_utf8(request.headers.get('X-Admin-Token', '')), _utf8(token)):
+        flask.abort(403, 'Invalid admin token')
+
+
+def graph_status(num_labeller):
+    res = []
+    for p in sorted(num_labeller.props, key=lambda p: p.name):
+        served = num_labeller.served.get(p, {})
+        res.append({
+            'property': p.name,
+            'uri': p.prop[1:-1],
+            'built': served.get('built'),
+            'error': p in num_labeller.errors
+        })
+    return res
+
+
+@app.route('/admin/graphs', methods=['GET'])
+def admin_graphs():
+    check_admin()
+    return jsonify({'graphs': graph_status(app.config['LABELLER']), 'jobs': app.config['REBUILDS'].list()})
+
+
+@app.route('/admin/graphs/rebuild', methods=['POST'])
+def admin_rebuild():
+    # rebuild the graph of a property (name or URI) in the background, new properties are given by their URI.
+    # skipped if the inputs of the graph did not change (force=true: always rebuild)
+    check_admin()
+    if app.config['WORKERS'] > 1:
+        flask.abort(409, 'Graphs can only be rebuilt in a single process service (workers: 1), '
+                         'use the rebuild command and restart the service')
+    name = request.args.get('property', '')
+    if not name:
+        flask.abort(400, 'Use "property={name or URI}" parameter to specify the property')
+    num_labeller = app.config['LABELLER']
+    known = dict((p.name, p) for p in num_labeller.props)
+    if '/' in name:
+        p = graph.Property(name, dir=num_labeller.config['local-files'])
+        p = known.get(p.name, p)
+    elif name in known:
+        p = known[name]
+    else:
+        flask.abort(404, 'Unknown property: ' + name + ' (new properties are given by their URI)')
+    job = app.config['REBUILDS'].submit(p, force=request.args.get('force', 'false') == 'true')
+    return jsonify(job), 202
+
+
+def _start_worker_metrics():
+    # counts of the startup (graph builds, scans) are reported by the parent process
+    metrics.reset_counts()
+    metrics.start_dump(app.config['METRICS_DIR'], update=update_cache_metrics)
+
+
+def serve_workers(port, workers):
+    # each worker writes its metrics to a shared directory, /metrics merges them
+    directory = app.config['METRICS_DIR'] = tempfile.mkdtemp(prefix='labelling-metrics-')
+    metrics.save(os.path.join(directory, str(os.getpid()) + '.json'), kinds=('counter', 'histogram'))
+    try:
+        prefork.serve(app, '0.0.0.0', port, workers, init=_start_worker_metrics)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def notify(url, prop, token=None):
+    # ask a running service to swap in the rebuilt graph (loaded from the snapshot)
+    url = url.rstrip('/') + '/admin/graphs/rebuild?' + urllib.urlencode({'property': prop.prop[1:-1]})
+    req = urllib2.Request(url, data='', headers={'X-Admin-Token': token} if token else {})
+    return json.load(urllib2.urlopen(req))
+
+
+def rebuild(p, config, snapshot_dir, force=False):
+    # build the graph of one property into the snapshot, skipped if the snapshot is up to date
+    if not force and p in snapshot.entries(snapshot_dir, [p], config):
+        logging.info('Snapshot of property graph is up to date: ' + p.name)
+        return False
+    g = builder.build_graph(p, config)
+    snapshot.save(snapshot_dir, {p: g}, config)
+    labeller.add_prop(config, p, int(g.store.counts.sum()))
+    return True
+
+
 def parse_args():
     parser = argparse.ArgumentParser()
+    parser.add_argument("command", nargs="?", choices=["serve", "build", "rebuild", "index"],
+                        default="serve",
+                        help="serve: start the API service (default), build: build the graphs and write a snapshot, "
+                             "rebuild: build the graph of one property into the snapshot, "
+                             "index: build the local type index from N-Triples dumps")
     parser.add_argument("-c", "--config", help="config file")
+    parser.add_argument("--snapshot", help="snapshot directory (overrides 'snapshot' in config file)")
+    parser.add_argument("--rebuild", action="store_true", help="build: ignore an existing snapshot")
+    parser.add_argument("--property", help="rebuild: URI of the property (added to the snapshot and the "
+                                             "properties file if it is new)")
+    parser.add_argument("--force", action="store_true", help="rebuild: build even if the inputs did not change")
+    parser.add_argument("--notify", help="rebuild: URL of a running service which swaps in the new graph, "
+                                         "e.g. http://localhost:8081")
+    parser.add_argument("--dumps", nargs="+", default=[],
+                        help="index: N-Triples dumps with rdf:type and rdfs:subClassOf triples (plain, gz or bz2)")
+    parser.add_argument("--workers", type=int,
+                        help="serve: number of worker processes (overrides 'workers' in the api section of config file)")
     parser.add_argument("--logfile", help="log output to file")
     parser.add_argument("--debug", action="store_true")
     args = parser.parse_args()
@@ -118,12 +383,56 @@ def start():
 
     with open(args.config, 'r') as ymlfile:
         config = yaml.load(ymlfile)
+    dbpedia_access.configure(config)
 
     props = labeller.parse_props(config=config)
-    num_labeller = NumLabeller(props, config)
-    app.config['LABELLER'] = num_labeller
+    if args.command == 'index':
+        if not args.dumps:
+            logging.error("Specify the dumps: --dumps instance_types_en.ttl.bz2 dbpedia.owl.nt")
+            return
+        # restrict the index to the subjects of the local files
+        local_files = [p.filename for p in props if ntriples.source_files(p.filename)]
+        type_index.build(type_index.index_file(config['local-files']), args.dumps, local_files)
+        return
+
+    snapshot_dir = args.snapshot or config.get('snapshot')
+    if args.command == 'build':
+        if not snapshot_dir:
+            logging.error("Specify a snapshot directory: --snapshot DIR")
+            return
+        num_labeller = NumLabeller(props, config, snapshot_dir=None if args.rebuild else snapshot_dir)
+        # the graphs which were loaded from the snapshot are not written again
+        built = dict((p, g) for p, g in num_labeller.graphs.items() if num_labeller.served[p]['entry'] is None)
+        snapshot.save(snapshot_dir, built, config)
+        logging.info("Snapshot written to: " + snapshot_dir)
+        return
+    if args.command == 'rebuild':
+        if not snapshot_dir or not args.property:
+            logging.error("Specify a snapshot directory and a property: --snapshot DIR --property URI")
+            return
+        p = graph.Property(args.property, dir=config['local-files'])
+        rebuild(p, config, snapshot_dir, force=args.force)
+        if args.notify:
+            job = notify(args.notify, p, token=config['api'].get('admin-token'))
+            logging.info("Service notified, rebuild job: " + str(job['id']))
+        return
+
+    # the snapshot is memory-mapped read-only, its pages are shared by all worker processes
+    lazy = config['api'].get('lazy-graphs', False)
+    if lazy and not snapshot_dir:
+        logging.error("Loading graphs on demand (lazy-graphs) requires a snapshot directory: --snapshot DIR")
+        return
+    num_labeller = NumLabeller(props, config, snapshot_dir=snapshot_dir, mmap=True, lazy=lazy)
+    set_labeller(num_labeller, config['api'].get('cache', {}))
+    app.config['MAX_VALUES'] = config['api'].get('max-values') or None
+    app.config['ADMIN_TOKEN'] = config['api'].get('admin-token') or None
     logging.info("Finished branching. Graphs loaded in memory")
     logging.info("Service running at: http://localhost:"+str(config['api']['port'])+'/labelling')
     logging.info("Example curl request: curl -X POST -F csv=@testfile/stadiums.csv http://localhost:"+str(config['api']['port'])+"/labelling?column=2&neighbours=10")
-    app.run(threaded=True, port=config['api']['port'], host='0.0.0.0')
+    workers = args.workers or config['api'].get('workers', 1)
+    app.config['WORKERS'] = workers
+    if workers > 1:
+        serve_workers(config['api']['port'], workers)
+    else:
+        app.run(threaded=True, port=config['api']['port'], host='0.0.0.0')
 